@@ -18,7 +18,11 @@ from utils.data_cube_utilities.import_export import export_xarray_to_netcdf
 
 from .models import CoastalChangeTask
 from apps.dc_algorithm.models import Satellite
-from apps.dc_algorithm.tasks import DCAlgorithmBase, check_cancel_task, task_clean_up
+from apps.dc_algorithm.utils import slice_dataset_to_extent
+from apps.dc_algorithm.tasks import DCAlgorithmBase, check_cancel_task, task_clean_up, combine_split_chunks
+from apps.dc_algorithm.scheduler import prioritize
+from apps.dc_algorithm.tracing import trace_step
+from apps.dc_algorithm.memory import split_chunk_over_memory_budget, get_planned_geographic_chunk_size
 
 logger = get_task_logger(__name__)
 
@@ -39,6 +43,47 @@ def run(task_id=None):
                  start_chunk_processing.s(task_id=task_id))()
 
 
+@task(name="coastal_change.subset", base=BaseTask)
+def subset(task_id=None, parent_id=None):
+    """Create the output products of a task by slicing the stored intermediate product of a parent task
+
+    See Query.is_subset_of for the requirements. No data is loaded from the Data Cube - the parent's
+    intermediate product is sliced to the task's bounds and passed directly to create_output_products.
+    """
+    return chain(slice_parent_result.s(task_id=task_id, parent_id=parent_id),
+                 create_output_products.s(task_id=task_id, subset=True),
+                 task_clean_up.si(task_id=task_id, task_model='CoastalChangeTask'))()
+
+
+@task(name="coastal_change.slice_parent_result", base=BaseTask, bind=True)
+def slice_parent_result(self, task_id=None, parent_id=None):
+    """Slice the stored intermediate product of a parent task to the bounds of a task
+
+    The parent's metadata dict is reused for the acquisition list. Its per acquisition statistics describe the
+    parent's extent and can't be recomputed from the composited product, so create_output_products drops them.
+
+    Returns:
+        path to the sliced product, path to its metadata, and a dict containing the geo/time ids
+    """
+    task = CoastalChangeTask.objects.get(pk=task_id)
+    parent = CoastalChangeTask.objects.get(pk=parent_id)
+
+    task.execution_start = datetime.now()
+    if check_cancel_task(self, task): return
+    task.update_status("WAIT", "Slicing the result of an existing task.")
+
+    dataset = slice_dataset_to_extent(
+        parent.open_intermediate(),
+        latitude=(task.latitude_min, task.latitude_max),
+        longitude=(task.longitude_min, task.longitude_max))
+    path = os.path.join(task.get_temp_path(), "subset.nc")
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(dataset, path)
+        span.add_output(path)
+    metadata_path = task.store_chunk_metadata(path, parent.get_intermediate_metadata())
+    return path, metadata_path, {'geo_chunk_id': 0, 'time_chunk_id': 0}
+
+
 @task(name="coastal_change.parse_parameters_from_task", base=BaseTask, bind=True)
 def parse_parameters_from_task(self, task_id=None):
     """Parse out required DC parameters from the task model.
@@ -63,6 +108,8 @@ def parse_parameters_from_task(self, task_id=None):
         'measurements': task.satellite.get_measurements()
     }
 
+    parameters.update(task.get_preview_load_parameters())
+
     task.execution_start = datetime.now()
     if check_cancel_task(self, task): return
     task.update_status("WAIT", "Parsed out parameters.")
@@ -138,7 +185,7 @@ def perform_task_chunking(self, parameters, task_id=None):
     geographic_chunks = create_geographic_chunks(
         longitude=parameters['longitude'],
         latitude=parameters['latitude'],
-        geographic_chunk_size=task_chunk_sizing['geographic'])
+        geographic_chunk_size=get_planned_geographic_chunk_size(task, task_chunk_sizing, dates))
 
     grouped_dates = group_datetimes_by_year(dates)
     # we need to pair these with the first year - subsequent years.
@@ -170,7 +217,6 @@ def start_chunk_processing(self, chunk_details, task_id=None):
     if chunk_details is None:
         return None
 
-    parameters = chunk_details.get('parameters')
     geographic_chunks = chunk_details.get('geographic_chunks')
     time_chunks = chunk_details.get('time_chunks')
 
@@ -183,6 +229,9 @@ def start_chunk_processing(self, chunk_details, task_id=None):
     task.scenes_processed = 0
     task.save()
 
+    # processing tasks read their parameters and chunks from the stored details rather than their messages.
+    task.store_chunk_details(chunk_details)
+
     if check_cancel_task(self, task): return
     task.update_status("WAIT", "Starting processing.")
 
@@ -193,13 +242,11 @@ def start_chunk_processing(self, chunk_details, task_id=None):
             processing_task.s(
                 task_id=task_id,
                 geo_chunk_id=geo_index,
-                time_chunk_id=time_index,
-                geographic_chunk=geographic_chunk,
-                time_chunk=time_chunk,
-                **parameters) for geo_index, geographic_chunk in enumerate(geographic_chunks)
-        ]) | recombine_geographic_chunks.s(task_id=task_id) for time_index, time_chunk in enumerate(time_chunks)
+                time_chunk_id=time_index) for geo_index in range(len(geographic_chunks))
+        ]) | recombine_geographic_chunks.s(task_id=task_id) for time_index in range(len(time_chunks))
     ]) | recombine_time_chunks.s(task_id=task_id) | create_output_products.s(task_id=task_id)\
-       | task_clean_up.si(task_id=task_id, task_model='CoastalChangeTask')).apply_async()
+       | task_clean_up.si(task_id=task_id, task_model='CoastalChangeTask'))
+    prioritize(processing_pipeline, task).apply_async()
 
     return True
 
@@ -210,12 +257,11 @@ def processing_task(self,
                     geo_chunk_id=None,
                     time_chunk_id=None,
                     geographic_chunk=None,
-                    time_chunk=None,
-                    **parameters):
+                    time_chunk=None):
     """Process a parameter set and save the results to disk.
 
     Uses the geographic and time chunk id to identify output products.
-    **params is updated with time and geographic ranges then used to load data.
+    The load parameters are read from the stored chunk details and updated with time and geographic ranges.
     the task model holds the iterative property that signifies whether the algorithm
     is iterative or if all data needs to be loaded at once.
 
@@ -223,10 +269,9 @@ def processing_task(self,
         task_id, geo_chunk_id, time_chunk_id: identification for the main task and what chunk this is processing
         geographic_chunk: range of latitude and longitude to load - dict with keys latitude, longitude
         time_chunk: list of acquisition dates
-        parameters: all required kwargs to load data.
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
     """
     chunk_id = "_".join([str(geo_chunk_id), str(time_chunk_id)])
     task = CoastalChangeTask.objects.get(pk=task_id)
@@ -236,6 +281,22 @@ def processing_task(self,
     if not os.path.exists(task.get_temp_path()):
         return None
 
+    geographic_chunk, time_chunk, parameters = task.get_chunk_parameters(
+        geo_chunk_id, time_chunk_id, geographic_chunk=geographic_chunk)
+
+    # over budget chunks are processed as smaller chunks that are combined before recombination.
+    geographic_chunks = split_chunk_over_memory_budget(task, geographic_chunk, max(time_chunk, key=len), parameters)
+    if geographic_chunks is not None:
+        return self.replace(
+            group([
+                processing_task.s(
+                    task_id=task_id,
+                    geo_chunk_id="{}.{}".format(geo_chunk_id, index),
+                    time_chunk_id=time_chunk_id,
+                    geographic_chunk=split_chunk) for index, split_chunk in enumerate(geographic_chunks)
+            ]) | combine_split_chunks.s(
+                task_id=task_id, app_name='coastal_change', geo_chunk_id=geo_chunk_id, time_chunk_id=time_chunk_id))
+
     def _get_datetime_range_containing(*time_ranges):
         return (min(time_ranges) - timedelta(microseconds=1), max(time_ranges) + timedelta(microseconds=1))
 
@@ -253,15 +314,18 @@ def processing_task(self,
         acquisitions that were in the retrieved data.
         """
         updated_params.update({'time': time})
-        data = dc.get_dataset_by_extent(**updated_params)
+        with trace_step("load") as span:
+            data = dc.get_dataset_by_extent(**updated_params)
+            span.add_input(data)
         if data is None or 'time' not in data:
             logger.info("Invalid chunk.")
             return None, None, None
 
         clear_mask = task.satellite.get_clean_mask_func()(data)
         metadata = task.metadata_from_dataset({}, data, clear_mask, updated_params)
-        return task.get_processing_method()(data, clean_mask=clear_mask, no_data=task.satellite.no_data_value), \
-               metadata, len(data['time'])
+        with trace_step("process"):
+            mosaic = task.get_processing_method()(data, clean_mask=clear_mask, no_data=task.satellite.no_data_value)
+        return mosaic, metadata, len(data['time'])
 
     if check_cancel_task(self, task): return
     old_mosaic, old_metadata, num_scenes_old = _compute_mosaic(starting_year)
@@ -285,10 +349,13 @@ def processing_task(self,
     if check_cancel_task(self, task): return
 
     path = os.path.join(task.get_temp_path(), chunk_id + ".nc")
-    export_xarray_to_netcdf(output_product, path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(output_product, path)
+        span.add_output(path)
     dc.close()
     logger.info("Done with chunk: " + chunk_id)
-    return path, metadata, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
+    metadata_path = task.store_chunk_metadata(path, metadata)
+    return path, metadata_path, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
 
 
 @task(name="coastal_change.recombine_geographic_chunks", base=BaseTask, bind=True)
@@ -299,10 +366,10 @@ def recombine_geographic_chunks(self, chunks, task_id=None):
     and combine it into a single dataset. Combine metadata as well, writing to disk.
 
     Args:
-        chunks: list of the return from the processing_task function - path, metadata, and {chunk ids}
+        chunks: list of the return from the processing_task function - path, metadata path, and {chunk ids}
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
     """
     task = CoastalChangeTask.objects.get(pk=task_id)
     if check_cancel_task(self, task): return
@@ -317,7 +384,7 @@ def recombine_geographic_chunks(self, chunks, task_id=None):
     metadata = {}
     chunk_data = []
     for index, chunk in enumerate(total_chunks):
-        metadata = task.combine_metadata(metadata, chunk[1])
+        metadata = task.combine_metadata(metadata, task.get_chunk_metadata(chunk[1]))
         chunk_data.append(xr.open_dataset(chunk[0]))
     combined_data = combine_geographic_chunks(chunk_data)
 
@@ -327,17 +394,22 @@ def recombine_geographic_chunks(self, chunks, task_id=None):
             combined_data
         ) if task.animated_product.animation_id == "coastline_change" else mask_mosaic_with_coastal_change(
             combined_data)
-        write_png_from_xr(
-            path,
-            animated_data,
-            bands=['red', 'green', 'blue'],
-            scale=task.satellite.get_scale(),
-            no_data=task.satellite.no_data_value)
+        with trace_step("write_png") as span:
+            write_png_from_xr(
+                path,
+                animated_data,
+                bands=['red', 'green', 'blue'],
+                scale=task.satellite.get_scale(),
+                no_data=task.satellite.no_data_value)
+            span.add_output(path)
 
     path = os.path.join(task.get_temp_path(), "recombined_geo_{}.nc".format(time_chunk_id))
-    export_xarray_to_netcdf(combined_data, path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(combined_data, path)
+        span.add_output(path)
     logger.info("Done combining geographic chunks for time: " + str(time_chunk_id))
-    return path, metadata, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
+    metadata_path = task.store_chunk_metadata(path, metadata)
+    return path, metadata_path, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
 
 
 @task(name="coastal_change.recombine_time_chunks", base=BaseTask, bind=True)
@@ -349,10 +421,10 @@ def recombine_time_chunks(self, chunks, task_id=None):
     simply return the data again.
 
     Args:
-        chunks: list of the return from the processing_task function - path, metadata, and {chunk ids}
+        chunks: list of the return from the processing_task function - path, metadata path, and {chunk ids}
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
     """
     logger.info("RECOMBINE_TIME")
 
@@ -368,17 +440,18 @@ def recombine_time_chunks(self, chunks, task_id=None):
     metadata = {}
 
     for index, chunk in enumerate(total_chunks):
-        metadata.update(chunk[1])
+        metadata.update(task.get_chunk_metadata(chunk[1]))
 
     # if we've computed an animation, only the last one will be needed for the next pass.
     #if there is no animation then this is fine anyways.
     path = total_chunks[-1][0]
 
-    return path, metadata, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
+    metadata_path = task.store_chunk_metadata(path, metadata)
+    return path, metadata_path, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
 
 
 @task(name="coastal_change.create_output_products", base=BaseTask, bind=True)
-def create_output_products(self, data, task_id=None):
+def create_output_products(self, data, task_id=None, subset=False):
     """Create the final output products for this algorithm.
 
     Open the final dataset and metadata and generate all remaining metadata.
@@ -386,12 +459,13 @@ def create_output_products(self, data, task_id=None):
     Update status and exit.
 
     Args:
-        data: tuple in the format of processing_task function - path, metadata, and {chunk ids}
+        data: tuple in the format of processing_task function - path, metadata path, and {chunk ids}
+        subset: whether data was sliced from the result of a parent task - see slice_parent_result
     """
     task = CoastalChangeTask.objects.get(pk=task_id)
     if check_cancel_task(self, task): return
 
-    full_metadata = data[1]
+    full_metadata = task.get_chunk_metadata(data[1])
     dataset = xr.open_dataset(data[0])
 
     task.result_path = os.path.join(task.get_result_path(), "coastline_change.png")
@@ -403,30 +477,43 @@ def create_output_products(self, data, task_id=None):
                                        "animation.gif") if task.animated_product.animation_id != 'none' else ""
     task.final_metadata_from_dataset(dataset)
     task.metadata_from_dict(full_metadata)
+    if subset:
+        task.drop_acquisition_statistics()
 
     bands = task.satellite.get_measurements() + ['coastal_change', 'coastline_old', 'coastline_new']
     png_bands = ['red', 'green', 'blue']
 
-    export_xarray_to_netcdf(dataset, task.data_netcdf_path)
-    write_geotiff_from_xr(task.data_path, dataset.astype('int32'), bands=bands, no_data=task.satellite.no_data_value)
-    write_png_from_xr(
-        task.result_path,
-        mask_mosaic_with_coastlines(dataset),
-        bands=png_bands,
-        scale=task.satellite.get_scale(),
-        no_data=task.satellite.no_data_value)
-    write_png_from_xr(
-        task.result_coastal_change_path,
-        mask_mosaic_with_coastal_change(dataset),
-        bands=png_bands,
-        scale=task.satellite.get_scale(),
-        no_data=task.satellite.no_data_value)
-    write_png_from_xr(
-        task.result_mosaic_path,
-        dataset,
-        bands=png_bands,
-        scale=task.satellite.get_scale(),
-        no_data=task.satellite.no_data_value)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(dataset, task.data_netcdf_path)
+        span.add_output(task.data_netcdf_path)
+    with trace_step("export") as span:
+        write_geotiff_from_xr(
+            task.data_path, dataset.astype('int32'), bands=bands, no_data=task.satellite.no_data_value)
+        span.add_output(task.data_path)
+    with trace_step("write_png") as span:
+        write_png_from_xr(
+            task.result_path,
+            mask_mosaic_with_coastlines(dataset),
+            bands=png_bands,
+            scale=task.satellite.get_scale(),
+            no_data=task.satellite.no_data_value)
+        span.add_output(task.result_path)
+    with trace_step("write_png") as span:
+        write_png_from_xr(
+            task.result_coastal_change_path,
+            mask_mosaic_with_coastal_change(dataset),
+            bands=png_bands,
+            scale=task.satellite.get_scale(),
+            no_data=task.satellite.no_data_value)
+        span.add_output(task.result_coastal_change_path)
+    with trace_step("write_png") as span:
+        write_png_from_xr(
+            task.result_mosaic_path,
+            dataset,
+            bands=png_bands,
+            scale=task.satellite.get_scale(),
+            no_data=task.satellite.no_data_value)
+        span.add_output(task.result_mosaic_path)
 
     if task.animated_product.animation_id != "none":
         with imageio.get_writer(task.animation_path, mode='I', duration=1.0) as writer:
@@ -436,6 +523,10 @@ def create_output_products(self, data, task_id=None):
                     image = imageio.imread(path)
                     writer.append_data(image)
 
+    # keep the final dataset so the task can be subset without reprocessing.
+    if not task.preview:
+        task.store_intermediate(data[0], full_metadata)
+
     logger.info("All products created.")
     # task.update_bounds_from_dataset(dataset)
     task.complete = True
@@ -31,12 +31,13 @@ from datetime import datetime, timedelta
 
 from apps.dc_algorithm.models import Satellite, Area, Application
 from .forms import AdditionalOptionsForm, DataSelectionForm
-from .tasks import run
+from .tasks import run, subset
 
 from collections import OrderedDict
 
-from apps.dc_algorithm.views import (ToolView, SubmitNewRequest, GetTaskResult, SubmitNewSubsetRequest, CancelRequest,
-                                     UserHistory, ResultList, OutputList, RegionSelection, TaskDetails)
+from apps.dc_algorithm.views import (ToolView, SubmitNewRequest, EstimateTaskCost, GetTaskResult,
+                                     SubmitNewSubsetRequest, CancelRequest, UserHistory, ResultList, OutputList,
+                                     RegionSelection, TaskDetails)
 
 
 class RegionSelection(RegionSelection):
@@ -100,6 +101,19 @@ class SubmitNewRequest(SubmitNewRequest):
     form_list = [DataSelectionForm, AdditionalOptionsForm]
 
 
+class EstimateTaskCost(EstimateTaskCost):
+    """
+    Estimate task cost REST API Endpoint
+    Extends the EstimateTaskCost abstract class - required attributes are the tool_name,
+    task_model_name, and form_list
+
+    See the dc_algorithm.views docstrings for more information.
+    """
+    tool_name = 'coastal_change'
+    task_model_name = 'CoastalChangeTask'
+    form_list = [DataSelectionForm, AdditionalOptionsForm]
+
+
 class GetTaskResult(GetTaskResult):
     """
     Get task result REST API endpoint
@@ -124,6 +138,7 @@ class SubmitNewSubsetRequest(SubmitNewSubsetRequest):
     task_model_name = 'CoastalChangeTask'
 
     celery_task_func = run
+    subset_task_func = subset
 
     def task_model_update_func(self, task_model, **kwargs):
         """
@@ -105,6 +105,13 @@ class Query(BaseQuery):
         """
         return self.compositor.is_iterative()
 
+    def get_extendable(self):
+        """implements get_extendable as required by the base class
+
+        See the base query class docstring for more information.
+        """
+        return self.compositor.is_iterative() and self.animated_product.animation_id == "none"
+
     def get_reverse_time(self):
         """implements get_reverse_time as required by the base class
 
@@ -32,13 +32,13 @@ import datetime
 from apps.dc_algorithm.models import Satellite, Area, Application
 from apps.dc_algorithm.forms import DataSelectionForm
 from .forms import AdditionalOptionsForm
-from .tasks import run, pixel_drill
+from .tasks import run, pixel_drill, extend, subset
 
 from collections import OrderedDict
 
-from apps.dc_algorithm.views import (ToolView, SubmitNewRequest, SubmitPixelDrillRequest, GetTaskResult,
-                                     SubmitNewSubsetRequest, CancelRequest, UserHistory, ResultList, OutputList,
-                                     RegionSelection, TaskDetails)
+from apps.dc_algorithm.views import (ToolView, SubmitNewRequest, EstimateTaskCost, SubmitPixelDrillRequest,
+                                     GetTaskResult, GetTaskPlotData, SubmitNewSubsetRequest, ExtendRequest,
+                                     CancelRequest, UserHistory, ResultList, OutputList, RegionSelection, TaskDetails)
 
 from apps.dc_algorithm.forms import MAX_NUM_YEARS
 
@@ -107,6 +107,19 @@ class SubmitNewRequest(SubmitNewRequest):
     form_list = [DataSelectionForm, AdditionalOptionsForm]
 
 
+class EstimateTaskCost(EstimateTaskCost):
+    """
+    Estimate task cost REST API Endpoint
+    Extends the EstimateTaskCost abstract class - required attributes are the tool_name,
+    task_model_name, and form_list
+
+    See the dc_algorithm.views docstrings for more information.
+    """
+    tool_name = 'custom_mosaic_tool'
+    task_model_name = 'CustomMosaicToolTask'
+    form_list = [DataSelectionForm, AdditionalOptionsForm]
+
+
 class SubmitPixelDrillRequest(SubmitPixelDrillRequest):
     """
     Submit pixel_drill request REST API Endpoint
@@ -137,6 +150,18 @@ class GetTaskResult(GetTaskResult):
     task_model_name = 'CustomMosaicToolTask'
 
 
+class GetTaskPlotData(GetTaskPlotData):
+    """
+    Get task plot data REST API endpoint
+    Extends the GetTaskPlotData abstract class, required attributes are the tool_name
+    and task_model_name
+
+    See the dc_algorithm.views docstrings for more information.
+    """
+    tool_name = 'custom_mosaic_tool'
+    task_model_name = 'CustomMosaicToolTask'
+
+
 class SubmitNewSubsetRequest(SubmitNewSubsetRequest):
     """
     Submit new subset request REST API endpoint
@@ -149,6 +174,7 @@ class SubmitNewSubsetRequest(SubmitNewSubsetRequest):
     task_model_name = 'CustomMosaicToolTask'
 
     celery_task_func = run
+    subset_task_func = subset
 
     def task_model_update_func(self, task_model, **kwargs):
         """
@@ -165,6 +191,20 @@ class SubmitNewSubsetRequest(SubmitNewSubsetRequest):
         return task_model
 
 
+class ExtendRequest(ExtendRequest):
+    """
+    Extend request REST API endpoint
+    Extends the ExtendRequest abstract class, required attributes are
+    the tool_name, task_model_name, and celery_task_func.
+
+    See the dc_algorithm.views docstrings for more information.
+    """
+    tool_name = 'custom_mosaic_tool'
+    task_model_name = 'CustomMosaicToolTask'
+
+    celery_task_func = extend
+
+
 class CancelRequest(CancelRequest):
     """
     Cancel request REST API endpoint
@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+# The dataset_extent table holds the bounds and center time of each dataset as plain columns so that
+# Dataset.filter_datasets can use indexes rather than decoding the metadata of every dataset.
+# Triggers on the dataset table keep it up to date as datasets are indexed, updated, or removed.
+# center_dt values keep their UTC offset - values without an offset are read as UTC.
+CREATE_INDEX_SQL = """
+CREATE TABLE IF NOT EXISTS agdc.dataset_extent (
+    dataset_ref uuid PRIMARY KEY REFERENCES agdc.dataset (id) ON DELETE CASCADE,
+    dataset_type_ref smallint NOT NULL,
+    longitude_min double precision,
+    longitude_max double precision,
+    latitude_min double precision,
+    latitude_max double precision,
+    center_dt timestamptz
+);
+
+CREATE INDEX IF NOT EXISTS dataset_extent_type_time_idx ON agdc.dataset_extent (dataset_type_ref, center_dt);
+CREATE INDEX IF NOT EXISTS dataset_extent_time_id_idx ON agdc.dataset_extent (center_dt, dataset_ref);
+CREATE INDEX IF NOT EXISTS dataset_extent_bounds_idx ON agdc.dataset_extent
+    USING gist (box(point(longitude_min, latitude_min), point(longitude_max, latitude_max)));
+
+CREATE OR REPLACE FUNCTION agdc.update_dataset_extent() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO agdc.dataset_extent
+        SELECT NEW.id, NEW.dataset_type_ref,
+            (NEW.metadata #>> '{extent,coord,ul,lon}')::double precision,
+            (NEW.metadata #>> '{extent,coord,lr,lon}')::double precision,
+            (NEW.metadata #>> '{extent,coord,lr,lat}')::double precision,
+            (NEW.metadata #>> '{extent,coord,ul,lat}')::double precision,
+            (NEW.metadata #>> '{extent,center_dt}')::timestamptz
+    ON CONFLICT (dataset_ref) DO UPDATE SET
+        dataset_type_ref = EXCLUDED.dataset_type_ref,
+        longitude_min = EXCLUDED.longitude_min,
+        longitude_max = EXCLUDED.longitude_max,
+        latitude_min = EXCLUDED.latitude_min,
+        latitude_max = EXCLUDED.latitude_max,
+        center_dt = EXCLUDED.center_dt;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SET timezone = 'UTC';
+
+DROP TRIGGER IF EXISTS dataset_extent_update ON agdc.dataset;
+CREATE TRIGGER dataset_extent_update AFTER INSERT OR UPDATE OF metadata, dataset_type_ref ON agdc.dataset
+    FOR EACH ROW EXECUTE PROCEDURE agdc.update_dataset_extent();
+"""
+
+# Adds the datasets that were indexed before the triggers were created.
+POPULATE_INDEX_SQL = """
+SET LOCAL timezone = 'UTC';
+INSERT INTO agdc.dataset_extent
+    SELECT id, dataset_type_ref,
+        (metadata #>> '{extent,coord,ul,lon}')::double precision,
+        (metadata #>> '{extent,coord,lr,lon}')::double precision,
+        (metadata #>> '{extent,coord,lr,lat}')::double precision,
+        (metadata #>> '{extent,coord,ul,lat}')::double precision,
+        (metadata #>> '{extent,center_dt}')::timestamptz
+    FROM agdc.dataset
+ON CONFLICT (dataset_ref) DO NOTHING;
+ANALYZE agdc.dataset_extent;
+"""
+
+
+class Command(BaseCommand):
+    help = 'Create or update the dataset extent index used to filter datasets by bounding box and time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true', help="Repopulate the index from the metadata of every dataset.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using='agdc'), connections['agdc'].cursor() as cursor:
+            cursor.execute(CREATE_INDEX_SQL)
+            self.stdout.write(self.style.SUCCESS("Created the dataset extent table and triggers..."))
+            if options.get('rebuild'):
+                cursor.execute("TRUNCATE agdc.dataset_extent;")
+            cursor.execute(POPULATE_INDEX_SQL)
+        self.stdout.write(self.style.SUCCESS("Done! The dataset extent index is up to date."))
@@ -3,12 +3,19 @@ from __future__ import unicode_literals
 from django.db import models
 from django.contrib.postgres.fields import JSONField
 from django.db.models import Q
+from django.db.models.expressions import RawSQL
 from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 
 from dateutil.parser import parse
 from collections import Iterable
-from glob import glob
+import datetime
 import uuid
+import hashlib
+import json
+import calendar
 
 
 class Dataset(models.Model):
@@ -30,7 +37,7 @@ class Dataset(models.Model):
 
         dataset_type_ref and is optional and can be null, so that needs to be checked.
         Uses Django Q objects to combine and/or operations on queries. Does a BB intersection
-        and time query to filter datasets.
+        and time query on the indexed DatasetExtent table and returns the matching datasets.
 
         Args:
             dict representing cleaned form data from forms.DatasetFilterForm
@@ -44,51 +51,86 @@ class Dataset(models.Model):
             dataset_type_ref = cleaned_form_data['dataset_type_ref'] if isinstance(
                 cleaned_form_data['dataset_type_ref'], Iterable) else [cleaned_form_data['dataset_type_ref']]
             base_query &= Q(dataset_type_ref__in=dataset_type_ref)
-        """
-        bool doOverlap(Point l1, Point r1, Point l2, Point r2)
-            {
-                // If one rectangle is on left side of other
-                if (l1.x > r2.x || l2.x > r1.x)
-                    return false;
-
-                // If one rectangle is above other
-                if (l1.y < r2.y || l2.y < r1.y)
-                    return false;
-
-                return true;
-            }
-        """
 
-        longitude_query = ~Q(
-            Q(metadata__extent__coord__ul__lon__gt=cleaned_form_data['longitude_max']) | Q(
-                metadata__extent__coord__lr__lon__lt=cleaned_form_data['longitude_min']))
+        time_query = Q(center_dt__lte=_as_utc_datetime(cleaned_form_data['end_date']),
+                       center_dt__gte=_as_utc_datetime(cleaned_form_data['start_date']))
+        base_query &= time_query
 
-        latitude_query = ~Q(
-            Q(metadata__extent__coord__ul__lat__lt=cleaned_form_data['latitude_min']) | Q(
-                metadata__extent__coord__lr__lat__gt=cleaned_form_data['latitude_max']))
+        # Datasets overlap the bounding box unless one is entirely to the side of or above the other - the && box
+        # operator is the same test and is supported by the GiST index of dataset_extent.
+        extents = DatasetExtent.objects.using('agdc').filter(base_query).extra(
+            where=[
+                "box(point(longitude_min, latitude_min), point(longitude_max, latitude_max)) && "
+                "box(point(%s, %s), point(%s, %s))"
+            ],
+            params=[
+                cleaned_form_data['longitude_min'], cleaned_form_data['latitude_min'],
+                cleaned_form_data['longitude_max'], cleaned_form_data['latitude_max']
+            ])
 
-        time_query = Q(metadata__extent__center_dt__lte=cleaned_form_data['end_date'].isoformat(),
-                       metadata__extent__center_dt__gte=cleaned_form_data['start_date'].isoformat())
-        base_query &= latitude_query & longitude_query & time_query
+        return cls.objects.using('agdc').filter(id__in=extents.values('dataset_ref'))
 
-        return cls.objects.using('agdc').filter(base_query)
+    @classmethod
+    def get_dataset_table_values(cls, datasets):
+        """Project a queryset of datasets to the values used by get_dataset_table_columns
 
-    def get_dataset_table_columns(self):
-        """Returns the metadata columns specified in the datasets.html template
+        Only the displayed metadata fields are extracted by the database rather than decoding the full
+        metadata document of every row. Bounds and center time come from the dataset's DatasetExtent.
+
+        """
+        return datasets.annotate(
+            platform=RawSQL("dataset.metadata #>> '{platform,code}'", []),
+            instrument=RawSQL("dataset.metadata #>> '{instrument,name}'", []),
+            product_type=RawSQL("dataset.metadata #>> '{product_type}'", []),
+            acquisition_dt=RawSQL("dataset.metadata #>> '{extent,center_dt}'", []),
+            data_format=RawSQL("dataset.metadata #>> '{format,name}'", [])).values(
+                'id', 'platform', 'instrument', 'product_type', 'acquisition_dt', 'data_format',
+                'extent__longitude_min', 'extent__longitude_max', 'extent__latitude_min', 'extent__latitude_max',
+                'extent__center_dt')
+
+    @staticmethod
+    def get_dataset_table_columns(values):
+        """Returns the metadata columns specified in the datasets.html template from get_dataset_table_values
 
         id, platform, instrument, product type, upper left/lower right, center dt, format
 
         """
         return [
-            self.id, self.metadata['platform']['code'], self.metadata['instrument']['name'],
-            self.metadata['product_type'], "{:.2f}, {:.2f}".format(self.metadata['extent']['coord']['ul']['lon'],
-                                                                   self.metadata['extent']['coord']['ul']['lat']),
-            "{:.2f}, {:.2f}".format(self.metadata['extent']['coord']['lr']['lon'],
-                                    self.metadata['extent']['coord']['lr']['lat']),
-            self.metadata['extent']['center_dt'], self.metadata['format']['name']
+            values['id'], values['platform'], values['instrument'], values['product_type'],
+            "{:.2f}, {:.2f}".format(values['extent__longitude_min'], values['extent__latitude_max']),
+            "{:.2f}, {:.2f}".format(values['extent__longitude_max'], values['extent__latitude_min']),
+            values['acquisition_dt'], values['data_format']
         ]
 
 
+class DatasetExtent(models.Model):
+    """Bounding box and center time of a dataset, copied from its metadata into indexed columns
+
+    The table is created by the create_dataset_extent_index management command and is kept up to date by
+    triggers on the dataset table, so it is never written through this model.
+
+    """
+    dataset_ref = models.OneToOneField(
+        Dataset, models.DO_NOTHING, primary_key=True, db_column='dataset_ref', related_name='extent')
+    dataset_type_ref = models.ForeignKey('DatasetType', models.DO_NOTHING, db_column='dataset_type_ref')
+    longitude_min = models.FloatField(blank=True, null=True)
+    longitude_max = models.FloatField(blank=True, null=True)
+    latitude_min = models.FloatField(blank=True, null=True)
+    latitude_max = models.FloatField(blank=True, null=True)
+    center_dt = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        managed = False
+        db_table = 'dataset_extent'
+
+
+def _as_utc_datetime(value):
+    """Get a UTC datetime from a date or datetime - center_dt values without a timezone are stored as UTC"""
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time.min)
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
 class DatasetLocation(models.Model):
     dataset_ref = models.ForeignKey(Dataset, models.CASCADE, db_column='dataset_ref')
     uri_scheme = models.TextField()
@@ -184,6 +226,7 @@ class IngestionRequest(models.Model):
     total_storage_units = models.IntegerField(default=0)
     storage_units_processed = models.IntegerField(default=0)
     download_script_path = models.CharField(max_length=100, default="")
+    archive_path = models.CharField(max_length=100, default="")
 
     status = models.CharField(max_length=50, default="WAIT")
     message = models.CharField(max_length=150, default="Please wait while your Data Cube is created.")
@@ -195,6 +238,11 @@ class IngestionRequest(models.Model):
         self.status = status
         self.message = message
         self.save()
+        cache.delete(IngestionRequest.get_status_cache_key(self.pk))
+
+    @staticmethod
+    def get_status_cache_key(ingestion_request_id):
+        return "ingestion_request_status_{}".format(ingestion_request_id)
 
     def get_database_name(self):
         return self.user + str(self.pk)
@@ -205,9 +253,14 @@ class IngestionRequest(models.Model):
     def get_base_data_path(self):
         return self.ingestion_definition['location']
 
-    def update_storage_unit_count(self):
-        self.storage_units_processed = len(glob(self.get_base_data_path() + "/*.nc"))
-        self.save()
+    def get_manifest_path(self):
+        return "{}/manifest.json".format(self.ingestion_definition['location'])
+
+    def get_archive_path(self):
+        return "{}/ceos_data_cube_sample.tar".format(self.ingestion_definition['location'])
+
+    def get_batch_path(self, batch):
+        return "{}/.ingestion_batch_{}.pickle".format(self.ingestion_definition['location'], batch)
 
 
 class IngestionDetails(models.Model):
@@ -232,6 +285,14 @@ class IngestionDetails(models.Model):
     pixel_count = models.BigIntegerField(default=0)
     scene_count = models.BigIntegerField(default=0)
 
+    # active dataset count and latest added datetime of the product when the details were last updated.
+    dataset_count = models.BigIntegerField(default=0)
+    last_added = models.DateTimeField(blank=True, null=True)
+    # datetime of the last full recompute - incremental updates are periodically replaced by a full recompute.
+    last_recomputed = models.DateTimeField(blank=True, null=True)
+
+    INGESTED_AREAS_CACHE_KEY = 'ingested_areas'
+
     def __str__(self):
         return "{} - {}".format(self.product, self.platform)
 
@@ -262,6 +323,41 @@ class IngestionDetails(models.Model):
             'scene_count': self.scene_count
         }
 
+    @classmethod
+    def get_ingested_areas(cls):
+        """Get the serialized responses of all non global products grouped by platform with a single query"""
+        ingested_areas = {}
+        for ingestion_details in cls.objects.filter(global_dataset=False).order_by('platform', 'dataset_type_ref'):
+            ingested_areas.setdefault(ingestion_details.platform, []).append(
+                ingestion_details.get_serialized_response())
+        return ingested_areas
+
+    @classmethod
+    def cache_ingested_areas(cls):
+        """Serialize the ingested areas once and store them in the cache for the visualization tool
+
+        The cached value is a dict with the json content, a quoted ETag computed from the content, and a
+        Last-Modified unix timestamp. It is replaced whenever the details are updated and never expires.
+
+        Returns:
+            The cached dict.
+
+        """
+        content = json.dumps(cls.get_ingested_areas(), cls=DjangoJSONEncoder).encode('utf-8')
+        ingested_areas = {
+            'content': content,
+            'etag': '"{}"'.format(hashlib.md5(content).hexdigest()),
+            'last_modified': calendar.timegm(timezone.now().utctimetuple())
+        }
+        cache.set(cls.INGESTED_AREAS_CACHE_KEY, ingested_areas, None)
+        return ingested_areas
+
+    @classmethod
+    def get_cached_ingested_areas(cls):
+        """Get the cached ingested areas, building them if they haven't been cached yet - see cache_ingested_areas"""
+        ingested_areas = cache.get(cls.INGESTED_AREAS_CACHE_KEY)
+        return ingested_areas if ingested_areas is not None else cls.cache_ingested_areas()
+
     def update_with_query_metadata(self, metadata_dict):
         """Update this model using a DataAccessApi.get_query_metadata call
 
@@ -1,7 +1,8 @@
 from django.conf import settings
-from django.db import connections
+from django.db import connections, transaction
 from django.forms.models import model_to_dict
-from django.db.models import Q
+from django.db.models import Q, F, Count, Max, Min
+from django.utils import timezone
 
 import celery
 from celery.task import task
@@ -15,18 +16,52 @@ from datacube.config import LocalConfig
 from datacube.scripts import ingest
 
 import uuid
+from datetime import timedelta
 import os
 import configparser
 from glob import glob
 import shutil
-
-from apps.data_cube_manager.models import (Dataset, DatasetType, DatasetSource, DatasetLocation, IngestionRequest,
-                                           IngestionDetails)
+import tempfile
+import subprocess
+import hashlib
+import json
+import pickle
+import tarfile
+import fcntl
+from urllib.parse import urlparse, unquote
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import pool, sql
+
+from apps.data_cube_manager.models import Dataset, DatasetExtent, DatasetType, IngestionRequest, IngestionDetails
 from apps.data_cube_manager.templates.bulk_downloader import base_downloader_script, static_script
 from utils.data_cube_utilities.data_access_api import DataAccessApi
+from apps.dc_algorithm.tasks import extend_tasks
+from apps.dc_algorithm.estimator import get_pixel_count
 
 logger = get_task_logger(__name__)
 
+# Maximum number of ingest_storage_units tasks created for a single ingestion request.
+SUBSET_INGESTION_CONCURRENCY = 4
+# Number of datasets removed by each transaction of delete_datasets.
+DATASET_DELETION_BATCH_SIZE = 5000
+# Database with an initialized agdc schema that the database of each subset request is cloned from.
+SUBSET_TEMPLATE_DATABASE = 'agdc_subset_template'
+# Compression level (0-9) of the custom format database dump of a subset request.
+SUBSET_DUMP_COMPRESSION = 6
+# Number of jobs suggested to users for restoring the database dump with pg_restore.
+SUBSET_RESTORE_JOBS = 4
+# Append each storage unit to a single tar archive as it is written, so the whole cube can be downloaded at once.
+# Disabled by default as the archive doubles the disk space used by each request.
+SUBSET_ARCHIVE_ENABLED = False
+# Size of the blocks read when streaming the database dump and checksumming files.
+OUTPUT_BLOCK_SIZE = 1024 * 1024
+# Maximum age of the last full recompute of a product's IngestionDetails before incremental updates are replaced
+# by a full recompute, correcting any drift of the merged extents, pixel count, and scene count.
+DATA_CUBE_DETAILS_RECOMPUTE_INTERVAL = timedelta(days=7)
+
+_admin_connection_pool = None
+
 
 class IngestionBase(celery.Task):
     """Serves as a base class for ingestion tasks"""
@@ -45,10 +80,11 @@ class IngestionBase(celery.Task):
                 "ERROR",
                 "There was an unhandled exception during ingestion. Did you change the src_varname of any measurement?")
             delete_ingestion_request.delay(ingestion_request_id=request_id)
-            cmd = "dropdb -U dc_user -h {} {}".format(settings.MASTER_NODE, request.get_database_name())
-            os.system(cmd)
+            drop_database(request.get_database_name())
         except IngestionRequest.DoesNotExist:
             pass
+        except psycopg2.Error:
+            logger.exception("Failed to drop the database of ingestion request {}".format(request_id))
 
     def on_success(self, retval, task_id, args, kwargs):
         """"""
@@ -60,20 +96,114 @@ class IngestionBase(celery.Task):
     #run_every=(30.0),
     run_every=(crontab(hour=0, minute=0)),
     ignore_result=True)
-def update_data_cube_details(ingested_only=True):
+def update_data_cube_details(ingested_only=True, incremental=True):
+    """Update the IngestionDetails of each managed product
+
+    In incremental mode, the active dataset count and latest added datetime of each product are compared with
+    the values stored on its IngestionDetails. Unchanged products are skipped. Products that only gained datasets
+    have the extents of the new datasets merged in from the dataset_extent table. New products, products with
+    archived or deleted datasets - which lower the active dataset count - and products that haven't been
+    recomputed within DATA_CUBE_DETAILS_RECOMPUTE_INTERVAL are recomputed from the Data Cube.
+
+    Products that gained datasets are passed to extend_tasks, which checks the acquisitions of each task.
+
+    Args:
+        incremental: skip unchanged products and merge new datasets - recompute every product if False
+
+    """
     dataset_types = DatasetType.objects.using('agdc').filter(
         Q(definition__has_keys=['managed']) & Q(definition__has_keys=['measurements']))
 
-    dc = DataAccessApi(config='/home/' + settings.LOCAL_USER + '/Datacube/data_cube_ui/config/.datacube.conf')
-
+    dc = None
+    updated_products = []
     for dataset_type in dataset_types:
         ingestion_details, created = IngestionDetails.objects.get_or_create(
             dataset_type_ref=dataset_type.id,
             product=dataset_type.name,
             platform=dataset_type.metadata['platform']['code'])
-        ingestion_details.update_with_query_metadata(dc.get_datacube_metadata(dataset_type.name))
 
-    dc.close()
+        datasets = Dataset.objects.using('agdc').filter(dataset_type_ref=dataset_type.id, archived__isnull=True)
+        statistics = datasets.aggregate(dataset_count=Count('id'), last_added=Max('added'))
+        recompute_due = ingestion_details.last_recomputed is None or \
+            ingestion_details.last_recomputed < timezone.now() - DATA_CUBE_DETAILS_RECOMPUTE_INTERVAL
+        if incremental and not created and not recompute_due and \
+                statistics['dataset_count'] == ingestion_details.dataset_count and \
+                statistics['last_added'] == ingestion_details.last_added:
+            continue
+
+        new_datasets = datasets.filter(added__gt=ingestion_details.last_added) \
+            if ingestion_details.last_added is not None else datasets.none()
+        if incremental and not created and not recompute_due and ingestion_details.dataset_count > 0 and \
+                ingestion_details.dataset_count + new_datasets.count() == statistics['dataset_count']:
+            merge_new_datasets(ingestion_details, dataset_type, new_datasets)
+        else:
+            if dc is None:
+                dc = DataAccessApi(
+                    config='/home/' + settings.LOCAL_USER + '/Datacube/data_cube_ui/config/.datacube.conf')
+            ingestion_details.update_with_query_metadata(dc.get_datacube_metadata(dataset_type.name))
+            ingestion_details.last_recomputed = timezone.now()
+
+        if not created and statistics['last_added'] is not None and \
+                (ingestion_details.last_added is None or statistics['last_added'] > ingestion_details.last_added):
+            updated_products.append(dataset_type.name)
+        ingestion_details.dataset_count = statistics['dataset_count']
+        ingestion_details.last_added = statistics['last_added']
+        ingestion_details.save()
+
+    if dc is not None:
+        dc.close()
+
+    IngestionDetails.cache_ingested_areas()
+
+    # fold any newly ingested acquisitions into completed results that use the updated products.
+    if len(updated_products) > 0:
+        extend_tasks.delay(products=updated_products)
+
+
+@task(name="data_cube_manager.delete_datasets", bind=True, queue="data_cube_manager")
+def delete_datasets(self, dataset_filters=None, archive=False, dry_run=False):
+    """Delete or archive the datasets selected by a DatasetFilterForm in batches
+
+    Each batch of dataset ids is removed with set based statements in its own transaction - locations, sources,
+    and then the datasets themselves - so locks are only held for a single batch. Archiving sets the archived
+    date instead, leaving the datasets and their locations in place as the agdc tools do.
+    Progress is reported through the task's PROGRESS state.
+
+    Args:
+        dataset_filters: cleaned data of a DatasetFilterForm with a list of dataset type ids for dataset_type_ref
+        archive: archive the datasets rather than deleting them
+        dry_run: only count the datasets that would be removed
+
+    Returns:
+        dict with total_records and records_processed.
+    """
+    datasets = Dataset.filter_datasets(dataset_filters)
+    if archive:
+        datasets = datasets.filter(archived__isnull=True)
+    total_records = datasets.count()
+    if dry_run:
+        return {'total_records': total_records, 'records_processed': 0}
+
+    records_processed = 0
+    while True:
+        # removed datasets no longer match the filter, so the next batch is always at the start.
+        dataset_ids = list(datasets.values_list('id', flat=True)[:DATASET_DELETION_BATCH_SIZE])
+        if len(dataset_ids) == 0:
+            break
+        with transaction.atomic(using='agdc'), connections['agdc'].cursor() as cursor:
+            if archive:
+                cursor.execute("UPDATE dataset SET archived = now() WHERE id = ANY(%s::uuid[]) AND archived IS NULL",
+                               [dataset_ids])
+            else:
+                cursor.execute("DELETE FROM dataset_location WHERE dataset_ref = ANY(%s::uuid[])", [dataset_ids])
+                cursor.execute("DELETE FROM dataset_source WHERE dataset_ref = ANY(%s::uuid[]) OR "
+                               "source_dataset_ref = ANY(%s::uuid[])", [dataset_ids, dataset_ids])
+                cursor.execute("DELETE FROM dataset WHERE id = ANY(%s::uuid[])", [dataset_ids])
+        records_processed += len(dataset_ids)
+        self.update_state(
+            state='PROGRESS', meta={'total_records': total_records, 'records_processed': records_processed})
+
+    return {'total_records': total_records, 'records_processed': records_processed}
 
 
 @task(name="data_cube_manager.run_ingestion")
@@ -90,22 +220,26 @@ def run_ingestion(ingestion_definition):
     index = index_connect(local_config=LocalConfig.find([conf_path]))
 
     source_type, output_type = ingest.make_output_type(index, ingestion_definition)
-    ingestion_work.delay(output_type, source_type, ingestion_definition)
+    ingestion_work.delay(ingestion_definition)
 
     index.close()
     return output_type.id
 
 
 @task(name="data_cube_manager.ingestion_work")
-def ingestion_work(output_type, source_type, ingestion_definition):
+def ingestion_work(ingestion_definition):
     """Run the ingestion process for a user defined configuration
 
+    The source and output types are looked up from the index rather than passed as arguments so that
+    task messages only contain plain data.
+
     Args:
-        output_type, source_type: types produced by ingest.make_output_type
         ingestion_definition: dict representing a Data Cube ingestion def produced using the utils func.
     """
     conf_path = '/home/' + settings.LOCAL_USER + '/Datacube/data_cube_ui/config/.datacube.conf'
     index = index_connect(local_config=LocalConfig.find([conf_path]))
+    # the output type was added by run_ingestion, so this returns the existing types.
+    source_type, output_type = ingest.make_output_type(index, ingestion_definition)
 
     tasks = ingest.create_task_list(index, output_type, None, source_type, ingestion_definition)
 
@@ -143,27 +277,19 @@ def ingestion_on_demand(ingestion_request_id=None):
 
 @task(name="data_cube_manager.init_db", base=IngestionBase, queue="data_cube_manager")
 def init_db(ingestion_request_id=None):
-    """Creates a new database and initializes it with the standard agdc schema
+    """Creates a new database with the standard agdc schema
 
-    Creates a new database named the user using a psql call and uses the agdc api
-    to initalize the schema.
+    Clones the database from SUBSET_TEMPLATE_DATABASE, which already holds the agdc schema, default metadata
+    types, and field indexes, so the schema is only initialized once rather than for every request.
 
     """
     ingestion_request = IngestionRequest.objects.get(pk=ingestion_request_id)
 
-    cmd = "createdb -U dc_user -h {} {}".format(settings.MASTER_NODE, ingestion_request.get_database_name())
-    os.system(cmd)
-
-    config = get_config(ingestion_request.get_database_name())
-    index = index_connect(local_config=config, validate_connection=False)
-    try:
-        index.init_db(with_default_types=True, with_permissions=True)
-        index.metadata_types.check_field_indexes(allow_table_lock=True, rebuild_indexes=True, rebuild_views=True)
-    except:
-        index.close()
-        raise
-
-    index.close()
+    create_template_database()
+    with admin_connection() as cursor:
+        cursor.execute(
+            sql.SQL("CREATE DATABASE {} TEMPLATE {}").format(
+                sql.Identifier(ingestion_request.get_database_name()), sql.Identifier(SUBSET_TEMPLATE_DATABASE)))
 
 
 @task(name="data_cube_manager.add_source_datasets", base=IngestionBase, queue="data_cube_manager")
@@ -175,6 +301,8 @@ def add_source_datasets(ingestion_request_id=None):
     the agdc script.
 
     A dataset type, datasets, dataset_locations, and dataset_sources are added to the new database.
+    The lineage of the datasets is found with a single recursive query and the rows are copied between the
+    databases with binary COPY statements, so no metadata is decoded in Python.
     """
 
     ingestion_request = IngestionRequest.objects.get(pk=ingestion_request_id)
@@ -183,7 +311,6 @@ def add_source_datasets(ingestion_request_id=None):
     config = get_config(ingestion_request.get_database_name())
     index = index_connect(local_config=config, validate_connection=True)
 
-    dataset_type = DatasetType.objects.using('agdc').get(id=ingestion_request.dataset_type_ref)
     filtering_options = {
         key: getattr(ingestion_request, key)
         for key in [
@@ -191,136 +318,211 @@ def add_source_datasets(ingestion_request_id=None):
             'longitude_max'
         ]
     }
-    datasets = list(Dataset.filter_datasets(filtering_options))
-    dataset_locations = DatasetLocation.objects.using('agdc').filter(dataset_ref__in=datasets)
-    dataset_sources = DatasetSource.objects.using('agdc').filter(dataset_ref__in=datasets)
-
-    def create_source_dataset_models(dataset_sources, dataset_type_index=0):
-        source_datasets = Dataset.objects.using('agdc').filter(
-            pk__in=dataset_sources.values_list('source_dataset_ref', flat=True))
-        source_dataset_type = DatasetType.objects.using('agdc').get(id=source_datasets[0].dataset_type_ref.id)
-        source_dataset_locations = DatasetLocation.objects.using('agdc').filter(dataset_ref__in=source_datasets)
-        source_dataset_sources = DatasetSource.objects.using('agdc').filter(dataset_ref__in=source_datasets)
-
-        if source_dataset_sources.exists():
-            dataset_type_index = create_source_dataset_models(
-                source_dataset_sources, dataset_type_index=dataset_type_index)
-
-        source_dataset_type.id = dataset_type_index
-        source_dataset_type.save(using=ingestion_request.get_database_name())
-
-        for dataset in source_datasets:
-            dataset.dataset_type_ref_id = source_dataset_type.id
-
-        Dataset.objects.using(ingestion_request.get_database_name()).bulk_create(source_datasets)
-        DatasetLocation.objects.using(ingestion_request.get_database_name()).bulk_create(source_dataset_locations)
-        DatasetSource.objects.using(ingestion_request.get_database_name()).bulk_create(source_dataset_sources)
-
-        return dataset_type_index + 1
+    dataset_query, dataset_params = Dataset.filter_datasets(filtering_options).values('id').query.get_compiler(
+        using='agdc').as_sql()
 
     create_db(ingestion_request.get_database_name())
 
-    dataset_type_index = create_source_dataset_models(dataset_sources) if dataset_sources else 0
-
-    dataset_type.id = dataset_type_index
-    dataset_type.save(using=ingestion_request.get_database_name())
-
-    for dataset in datasets:
-        dataset.dataset_type_ref_id = dataset_type.id
-
-    Dataset.objects.using(ingestion_request.get_database_name()).bulk_create(datasets)
-    DatasetLocation.objects.using(ingestion_request.get_database_name()).bulk_create(dataset_locations)
-    DatasetSource.objects.using(ingestion_request.get_database_name()).bulk_create(dataset_sources)
-
-    cmd = "psql -U dc_user -h {} {} -c \"ALTER SEQUENCE agdc.dataset_type_id_seq RESTART WITH {};\"".format(
-        settings.MASTER_NODE, ingestion_request.get_database_name(), dataset_type_index + 1)
-    os.system(cmd)
+    with transaction.atomic(using='agdc'), connections['agdc'].cursor() as source_cursor, \
+            connections[ingestion_request.get_database_name()].cursor() as target_cursor:
+        # the datasets and all of their sources with the depth at which they were found - a dataset type's depth is
+        # its deepest dataset so that sources are given lower ids than the datasets derived from them.
+        source_cursor.execute("""
+            CREATE TEMPORARY TABLE subset_lineage ON COMMIT DROP AS
+            WITH RECURSIVE lineage(id, depth) AS (
+                SELECT dataset.id, 0 FROM dataset WHERE dataset.id IN ({})
+              UNION
+                SELECT dataset_source.source_dataset_ref, lineage.depth + 1
+                FROM dataset_source JOIN lineage ON dataset_source.dataset_ref = lineage.id
+            )
+            SELECT id, max(depth) AS depth FROM lineage GROUP BY id""".format(dataset_query), dataset_params)
+        source_cursor.execute("""
+            SELECT dataset.dataset_type_ref FROM subset_lineage JOIN dataset ON dataset.id = subset_lineage.id
+            GROUP BY dataset.dataset_type_ref ORDER BY max(subset_lineage.depth) DESC, dataset.dataset_type_ref""")
+        dataset_type_ids = [row[0] for row in source_cursor.fetchall()] or [ingestion_request.dataset_type_ref]
+
+        for dataset_type_index, dataset_type_id in enumerate(dataset_type_ids):
+            dataset_type = DatasetType.objects.using('agdc').get(id=dataset_type_id)
+            dataset_type.id = dataset_type_index
+            dataset_type.save(using=ingestion_request.get_database_name())
+
+        dataset_type_ref = "CASE dataset.dataset_type_ref {} END::smallint".format(" ".join(
+            "WHEN {} THEN {}".format(int(dataset_type_id), dataset_type_index)
+            for dataset_type_index, dataset_type_id in enumerate(dataset_type_ids)))
+
+        copy_rows(source_cursor, target_cursor, """
+            SELECT dataset.id, dataset.metadata_type_ref, {}, dataset.metadata, dataset.archived, dataset.added,
+                dataset.added_by
+            FROM dataset JOIN subset_lineage ON dataset.id = subset_lineage.id""".format(dataset_type_ref),
+                  "dataset (id, metadata_type_ref, dataset_type_ref, metadata, archived, added, added_by)")
+        copy_rows(source_cursor, target_cursor, """
+            SELECT dataset_location.id, dataset_location.dataset_ref, dataset_location.uri_scheme,
+                dataset_location.uri_body, dataset_location.added, dataset_location.added_by
+            FROM dataset_location JOIN subset_lineage ON dataset_location.dataset_ref = subset_lineage.id""",
+                  "dataset_location (id, dataset_ref, uri_scheme, uri_body, added, added_by)")
+        copy_rows(source_cursor, target_cursor, """
+            SELECT dataset_source.dataset_ref, dataset_source.classifier, dataset_source.source_dataset_ref
+            FROM dataset_source JOIN subset_lineage ON dataset_source.dataset_ref = subset_lineage.id""",
+                  "dataset_source (dataset_ref, classifier, source_dataset_ref)")
+
+        target_cursor.execute("ALTER SEQUENCE agdc.dataset_type_id_seq RESTART WITH {}".format(
+            len(dataset_type_ids)))
 
     close_db(ingestion_request.get_database_name())
     index.close()
 
 
-@task(name="data_cube_manager.ingest_subset", base=IngestionBase, queue="data_cube_manager", throws=(SystemExit))
-def ingest_subset(ingestion_request_id=None):
+@task(name="data_cube_manager.ingest_subset", base=IngestionBase, queue="data_cube_manager", bind=True)
+def ingest_subset(self, ingestion_request_id=None):
     """Run the ingestion process on the new database
 
-    Open a connection to the new database and run ingestion based on the
-    ingestion configuration found on the IngestionRequest model.
+    Open a connection to the new database, add the output product, and split the ingestion tasks described by the
+    ingestion configuration found on the IngestionRequest model between ingest_storage_units tasks. At most
+    SUBSET_INGESTION_CONCURRENCY tasks are created, bounding the number of workers used by a single request.
+
+    The task list is only created once. Ingestion tasks hold datacube datasets and tiles that can't be sent through
+    the message format used for celery, so the slice of each batch is pickled to the request's data path.
 
     """
 
     ingestion_request = IngestionRequest.objects.get(pk=ingestion_request_id)
+    ingestion_definition = get_subset_ingestion_definition(ingestion_request)
 
     config = get_config(ingestion_request.get_database_name())
     index = index_connect(local_config=config, validate_connection=True)
 
-    # Thisis done because of something that the agdc guys do in ingest: https://github.com/opendatacube/datacube-core/blob/develop/datacube/scripts/ingest.py#L168
-    ingestion_request.ingestion_definition['filename'] = "ceos_data_cube_sample.yaml"
     try:
-        # source_type, output_type = ingest.make_output_type(index, ingestion_request.ingestion_definition)
+        # source_type, output_type = ingest.make_output_type(index, ingestion_definition)
 
-        source_type = index.products.get_by_name(ingestion_request.ingestion_definition['source_type'])
+        source_type = index.products.get_by_name(ingestion_definition['source_type'])
         output_type = index.products.add(
-            ingest.morph_dataset_type(source_type, ingestion_request.ingestion_definition), allow_table_lock=True)
+            ingest.morph_dataset_type(source_type, ingestion_definition), allow_table_lock=True)
 
-        tasks = list(
-            ingest.create_task_list(index, output_type, None, source_type, ingestion_request.ingestion_definition))
-
-        ingestion_request.total_storage_units = len(tasks)
-        ingestion_request.update_status("WAIT", "Starting the ingestion process...")
-
-        executor = SerialExecutor()
-        successful, failed = ingest.process_tasks(index, ingestion_request.ingestion_definition, source_type,
-                                                  output_type, tasks, 3200, executor)
+        tasks = ingest.create_task_list(index, output_type, None, source_type, ingestion_definition)
     except:
         index.close()
         raise
 
     index.close()
 
+    ingestion_request.total_storage_units = len(tasks)
+    ingestion_request.storage_units_processed = 0
+    ingestion_request.update_status("WAIT", "Starting the ingestion process...")
+
+    if len(tasks) == 0:
+        return
+
+    num_batches = min(SUBSET_INGESTION_CONCURRENCY, len(tasks))
+    os.makedirs(ingestion_request.get_base_data_path(), exist_ok=True)
+    for batch in range(num_batches):
+        with open(ingestion_request.get_batch_path(batch), 'wb') as batch_file:
+            pickle.dump(tasks[batch::num_batches], batch_file)
+
+    return self.replace(
+        group([
+            ingest_storage_units.si(ingestion_request.get_batch_path(batch), ingestion_request_id=ingestion_request_id)
+            for batch in range(num_batches)
+        ]))
+
+
+@task(name="data_cube_manager.ingest_storage_units", base=IngestionBase, queue="data_cube_manager",
+      throws=(SystemExit))
+def ingest_storage_units(batch_path, ingestion_request_id=None):
+    """Ingest a batch of the storage units of an ingestion request
+
+    Progress is added to the request's storage_units_processed as each storage unit is written, and the new
+    storage units are added to the output manifest and archive.
+
+    Failures aren't raised, as IngestionBase would drop the database while the other batches are still writing
+    to it. Instead the request's status is set to ERROR, the other batches stop before their next storage unit,
+    and prepare_output removes the request once every batch has stopped.
+
+    Args:
+        batch_path: path to the pickled list of ingestion tasks written by ingest_subset
+        ingestion_request_id: pk of a models.IngestionRequest obj.
+
+    """
+    ingestion_request = IngestionRequest.objects.get(pk=ingestion_request_id)
+    ingestion_definition = get_subset_ingestion_definition(ingestion_request)
+
+    with open(batch_path, 'rb') as batch_file:
+        tasks = pickle.load(batch_file)
+    os.remove(batch_path)
+
+    config = get_config(ingestion_request.get_database_name())
+    index = index_connect(local_config=config, validate_connection=True)
+    try:
+        source_type = index.products.get_by_name(ingestion_definition['source_type'])
+        output_type = index.products.get_by_name(ingestion_definition['output_type'])
+
+        executor = SerialExecutor()
+        for ingestion_task in tasks:
+            if IngestionRequest.objects.filter(pk=ingestion_request_id, status="ERROR").exists():
+                break
+            successful, failed = ingest.process_tasks(index, ingestion_definition, source_type, output_type,
+                                                      [ingestion_task], 1, executor)
+            IngestionRequest.objects.filter(pk=ingestion_request_id).update(
+                storage_units_processed=F('storage_units_processed') + successful)
+            if successful:
+                add_storage_units_to_output(ingestion_request)
+    except Exception:
+        logger.exception("Failed to ingest a batch of ingestion request {}".format(ingestion_request_id))
+        IngestionRequest.objects.get(pk=ingestion_request_id).update_status(
+            "ERROR",
+            "There was an unhandled exception during ingestion. Did you change the src_varname of any measurement?")
+    finally:
+        index.close()
+
 
 @task(name="data_cube_manager.prepare_output", base=IngestionBase, queue="data_cube_manager")
 def prepare_output(ingestion_request_id=None):
     """Dump the database and perform cleanup functions
 
-    Drops the database, create the bulk download script, and dumps the database.
+    Streams a compressed custom format dump of the database, drops the database, and adds the dump and any storage
+    units not yet added by ingest_storage_units to the manifest and archive before creating the bulk download script.
 
     """
 
     ingestion_request = IngestionRequest.objects.get(pk=ingestion_request_id)
+    # a batch of ingest_storage_units failed - every batch has stopped by now, so the request can be removed.
+    if ingestion_request.status == "ERROR":
+        delete_ingestion_request.delay(ingestion_request_id=ingestion_request_id)
+        return
+
     ingestion_request.update_status("WAIT", "Creating output products...")
 
-    cmd = "pg_dump -U dc_user -h {} -n agdc {} > {}".format(settings.MASTER_NODE,
-                                                            ingestion_request.get_database_name(),
-                                                            ingestion_request.get_database_dump_path())
-    os.system(cmd)
-    cmd = "dropdb -U dc_user -h {} {}".format(settings.MASTER_NODE, ingestion_request.get_database_name())
-    os.system(cmd)
+    dump_entry = dump_database(ingestion_request.get_database_name(), ingestion_request.get_database_dump_path())
+    drop_database(ingestion_request.get_database_name())
+
+    manifest = add_storage_units_to_output(ingestion_request, dump_entry=dump_entry)
 
     ingestion_request.download_script_path = ingestion_request.get_base_data_path() + "/bulk_downloader.py"
+    if SUBSET_ARCHIVE_ENABLED:
+        ingestion_request.archive_path = ingestion_request.get_archive_path()
 
     with open(ingestion_request.download_script_path, "w+") as downloader:
-        file_list = ",".join('"{}"'.format(path) for path in glob(ingestion_request.get_base_data_path() + '/*.nc'))
+        file_list = ",".join(json.dumps(entry) for entry in manifest['files'] if entry['path'] != dump_entry['path'])
         download_script = base_downloader_script.format(
             file_list=file_list,
-            database_dump_file=ingestion_request.get_database_dump_path(),
+            database_dump=json.dumps(dump_entry),
             base_host=settings.BASE_HOST,
-            base_data_path=ingestion_request.get_base_data_path()) + static_script
+            base_data_path=ingestion_request.get_base_data_path(),
+            restore_jobs=SUBSET_RESTORE_JOBS) + static_script
         downloader.write(download_script)
 
     ingestion_request.update_status("OK", "Please follow the directions on the right side panel to download your cube.")
 
 
-@task(name="data_cube_manager.delete_ingestion_request", base=IngestionBase, queue="data_cube_manager")
+@task(name="data_cube_manager.delete_ingestion_request", queue="data_cube_manager")
 def delete_ingestion_request(ingestion_request_id=None):
-    """Delete an existing ingestion request before proceeding with a new one"""
+    """Delete an existing ingestion request before proceeding with a new one
+
+    This doesn't use IngestionBase, as its failure handler queues this task again.
+
+    """
     ingestion_request = IngestionRequest.objects.get(pk=ingestion_request_id)
-    try:
-        cmd = "dropdb -U dc_user -h {} {}".format(settings.MASTER_NODE, ingestion_request.get_database_name())
-        os.system(cmd)
-        shutil.rmtree(ingestion_request.get_base_data_path())
-    except:
-        pass
+    drop_database(ingestion_request.get_database_name())
+    shutil.rmtree(ingestion_request.get_base_data_path(), ignore_errors=True)
 
 
 def get_config(username):
@@ -336,6 +538,254 @@ def get_config(username):
     return LocalConfig(config)
 
 
+def copy_rows(source_cursor, target_cursor, query, table):
+    """Copy the rows of a query into a table of another database with binary COPY statements
+
+    Rows are spooled to a temporary file rather than held in memory. The query's columns must have the same
+    types as the table's columns, e.g. the same agdc schema version in both databases.
+
+    Args:
+        source_cursor, target_cursor: cursors of the source and target databases
+        query: select statement run on the source database
+        table: table name with a column list, e.g. "dataset_source (dataset_ref, classifier, source_dataset_ref)"
+
+    """
+    with tempfile.TemporaryFile() as rows:
+        source_cursor.copy_expert("COPY ({}) TO STDOUT WITH (FORMAT binary)".format(query), rows)
+        rows.seek(0)
+        target_cursor.copy_expert("COPY {} FROM STDIN WITH (FORMAT binary)".format(table), rows)
+
+
+def get_subset_ingestion_definition(ingestion_request):
+    """Get the ingestion definition of an ingestion request as used by the agdc ingestion scripts"""
+    ingestion_definition = ingestion_request.ingestion_definition
+    # Thisis done because of something that the agdc guys do in ingest: https://github.com/opendatacube/datacube-core/blob/develop/datacube/scripts/ingest.py#L168
+    ingestion_definition['filename'] = "ceos_data_cube_sample.yaml"
+    return ingestion_definition
+
+
+def merge_new_datasets(ingestion_details, dataset_type, new_datasets):
+    """Merge the extents of newly added datasets into a product's IngestionDetails without rescanning the product
+
+    Bounds and center times come from the dataset_extent table. Scenes are the distinct center times of the
+    product, so only the new datasets' center times that no other active dataset shares are added to the count.
+    The model is not saved.
+
+    Args:
+        ingestion_details: IngestionDetails model of the product
+        dataset_type: DatasetType model of the product
+        new_datasets: queryset of the active datasets added since the details were last updated
+
+    """
+    new_extents = DatasetExtent.objects.using('agdc').filter(dataset_ref__in=new_datasets.values('id'))
+    extents = new_extents.aggregate(
+        latitude_min=Min('latitude_min'),
+        latitude_max=Max('latitude_max'),
+        longitude_min=Min('longitude_min'),
+        longitude_max=Max('longitude_max'),
+        start=Min('center_dt'),
+        end=Max('center_dt'))
+    if extents['start'] is None:
+        return
+
+    new_times = set(new_extents.exclude(center_dt__isnull=True).values_list('center_dt', flat=True))
+    existing_times = set(
+        DatasetExtent.objects.using('agdc').filter(
+            dataset_type_ref=dataset_type.id, center_dt__in=new_times, dataset_ref__archived__isnull=True).exclude(
+                dataset_ref__in=new_datasets.values('id')).values_list('center_dt', flat=True).distinct())
+    ingestion_details.scene_count += len(new_times - existing_times)
+
+    def merge(current, new, function):
+        values = [value for value in (current, new) if value is not None]
+        return function(values) if len(values) > 0 else None
+
+    has_extent = ingestion_details.start_date is not None
+    for field, function in [('latitude_min', min), ('latitude_max', max), ('longitude_min', min),
+                            ('longitude_max', max)]:
+        value = merge(getattr(ingestion_details, field) if has_extent else None, extents[field], function)
+        if value is not None:
+            setattr(ingestion_details, field, value)
+    ingestion_details.start_date = merge(ingestion_details.start_date, extents['start'].date(), min)
+    ingestion_details.end_date = merge(ingestion_details.end_date, extents['end'].date(), max)
+    ingestion_details.pixel_count = get_pixel_count(dataset_type,
+                                                    (ingestion_details.latitude_min, ingestion_details.latitude_max),
+                                                    (ingestion_details.longitude_min, ingestion_details.longitude_max))
+
+
+def get_file_checksum(path):
+    """Get the hex sha256 digest of a file, read in blocks of OUTPUT_BLOCK_SIZE"""
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as data:
+        for block in iter(lambda: data.read(OUTPUT_BLOCK_SIZE), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def dump_database(database_name, dump_path):
+    """Stream a compressed custom format dump of a subset database's agdc schema to a file
+
+    pg_dump's output is checksummed as it is written rather than read back afterwards. Custom format dumps can be
+    restored with parallel jobs by pg_restore, unlike plain sql dumps.
+
+    Args:
+        database_name: name of the database to dump
+        dump_path: path of the output file
+
+    Returns:
+        Manifest entry of the dump - a dict with path, size, and sha256.
+
+    """
+    environment = dict(os.environ, PGPASSWORD=settings.DATABASES['default']['PASSWORD'])
+    command = [
+        'pg_dump', '-U', settings.DATABASES['default']['USER'], '-h', settings.MASTER_NODE, '-n', 'agdc', '-Fc', '-Z',
+        str(SUBSET_DUMP_COMPRESSION), database_name
+    ]
+    checksum = hashlib.sha256()
+    size = 0
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, env=environment)
+    with open(dump_path, 'wb') as dump:
+        for block in iter(lambda: process.stdout.read(OUTPUT_BLOCK_SIZE), b''):
+            dump.write(block)
+            checksum.update(block)
+            size += len(block)
+    process.stdout.close()
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    return {'path': dump_path, 'size': size, 'sha256': checksum.hexdigest()}
+
+
+def get_indexed_storage_units(ingestion_request):
+    """Get the paths of the storage units that have been written and indexed in a subset request's database
+
+    Storage units are indexed after their file is closed, so files that are still being written by other workers
+    are not included. Locations of the source datasets are outside of the request's base path and are skipped.
+
+    """
+    base_path = os.path.join(ingestion_request.get_base_data_path(), '')
+    database_name = ingestion_request.get_database_name()
+    create_db(database_name)
+    try:
+        with connections[database_name].cursor() as cursor:
+            cursor.execute("SELECT uri_body FROM dataset_location WHERE uri_scheme = 'file'")
+            paths = [unquote(urlparse("file:" + uri_body).path) for uri_body, in cursor.fetchall()]
+    finally:
+        close_db(database_name)
+    return sorted(path for path in paths if path.startswith(base_path) and path.endswith('.nc'))
+
+
+def add_storage_units_to_output(ingestion_request, dump_entry=None):
+    """Add new storage units of a subset request to its manifest and, if enabled, its archive
+
+    The manifest lists the path, size, and sha256 of each output file. Workers of the same request share the
+    manifest and archive, so they are updated under an exclusive lock and the manifest is replaced atomically.
+
+    Args:
+        ingestion_request: models.IngestionRequest obj
+        dump_entry: manifest entry of the database dump - added after all storage units if provided, when the
+            database has been dropped and no more storage units can be added
+
+    Returns:
+        The manifest as written, a dict with a list of file entries.
+
+    """
+    base_path = ingestion_request.get_base_data_path()
+    manifest_path = ingestion_request.get_manifest_path()
+    with open(os.path.join(base_path, ".output.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        manifest = {'files': []}
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+        added_paths = set(entry['path'] for entry in manifest['files'])
+
+        if dump_entry is None:
+            new_paths = [path for path in get_indexed_storage_units(ingestion_request) if path not in added_paths]
+        else:
+            new_paths = [path for path in sorted(glob(base_path + '/*.nc')) if path not in added_paths]
+        new_entries = [{
+            'path': path,
+            'size': os.path.getsize(path),
+            'sha256': get_file_checksum(path)
+        } for path in new_paths]
+        if dump_entry is not None:
+            new_entries.append(dump_entry)
+
+        if SUBSET_ARCHIVE_ENABLED and new_entries:
+            # storage units are already compressed netcdf files, so the archive is not compressed and can be appended.
+            with tarfile.open(ingestion_request.get_archive_path(), 'a') as archive:
+                for entry in new_entries:
+                    archive.add(entry['path'], arcname=os.path.relpath(entry['path'], base_path))
+
+        manifest['files'].extend(new_entries)
+        with open(manifest_path + ".tmp", "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        os.replace(manifest_path + ".tmp", manifest_path)
+    return manifest
+
+
+@contextmanager
+def admin_connection():
+    """Get an autocommit cursor on the maintenance database for creating and dropping databases
+
+    Connections are pooled per worker process. Errors are raised to the caller as psycopg2 errors.
+
+    """
+    global _admin_connection_pool
+    if _admin_connection_pool is None:
+        _admin_connection_pool = pool.SimpleConnectionPool(
+            1,
+            2,
+            dbname='postgres',
+            user=settings.DATABASES['default']['USER'],
+            password=settings.DATABASES['default']['PASSWORD'],
+            host=settings.MASTER_NODE,
+            connect_timeout=60)
+    connection = _admin_connection_pool.getconn()
+    try:
+        # CREATE and DROP DATABASE can't run inside a transaction.
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            yield cursor
+    finally:
+        _admin_connection_pool.putconn(connection)
+
+
+def create_template_database():
+    """Create the template database for subset requests if it doesn't exist yet
+
+    The database is created with the agdc schema, default metadata types, and field indexes. Drop it to have it
+    recreated, e.g. after upgrading the Data Cube. An advisory lock prevents concurrent workers from creating it
+    at the same time.
+
+    """
+    with admin_connection() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(hashtext(%s))", [SUBSET_TEMPLATE_DATABASE])
+        try:
+            cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", [SUBSET_TEMPLATE_DATABASE])
+            if cursor.fetchone() is not None:
+                return
+            cursor.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(SUBSET_TEMPLATE_DATABASE)))
+            try:
+                index = index_connect(local_config=get_config(SUBSET_TEMPLATE_DATABASE), validate_connection=False)
+                try:
+                    index.init_db(with_default_types=True, with_permissions=True)
+                    index.metadata_types.check_field_indexes(
+                        allow_table_lock=True, rebuild_indexes=True, rebuild_views=True)
+                finally:
+                    index.close()
+            except:
+                cursor.execute(sql.SQL("DROP DATABASE {}").format(sql.Identifier(SUBSET_TEMPLATE_DATABASE)))
+                raise
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", [SUBSET_TEMPLATE_DATABASE])
+
+
+def drop_database(database_name):
+    """Drop a subset request's database if it exists"""
+    with admin_connection() as cursor:
+        cursor.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(database_name)))
+
+
 def create_db(username):
     connections.databases[username] = {
         'ENGINE': 'django.db.backends.postgresql',
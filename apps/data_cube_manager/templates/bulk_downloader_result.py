@@ -1,10 +1,11 @@
-import sys
 import os, os.path
-import tempfile, shutil
 import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.request import Request, urlopen
 from urllib.error import HTTPError, URLError
-from io import StringIO
 
 try:
     import datacube
@@ -14,207 +15,223 @@ except:
     print("https://github.com/ceos-seo/data_cube_ui/blob/master/docs/open_data_cube_install.md")
     exit(1)
 
+# path, size, and sha256 of each file, as listed in the manifest of the ingestion request.
 files = [
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150731092402000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150221092302000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20151222092532000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20151222092532000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150613092352000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150512092340000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20151206092516000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20151003092412000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150426092332000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20151120092503000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150104092248000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150410092326000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20151019092432000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150816092406000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150715092400000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150426092332000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150613092352000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150901092405000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150731092402000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20151222092532000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20151104092445000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150410092326000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150613092352000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20151104092445000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150528092344000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150120092248000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150528092344000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20151003092412000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150715092400000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20151120092503000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20151120092503000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20151206092516000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150120092248000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20151104092445000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20151206092516000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150715092400000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20151019092432000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20151120092503000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150426092332000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150221092302000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150901092405000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150309092308000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20151003092412000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150221092302000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150120092248000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20151222092532000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150221092302000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150325092318000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20151019092432000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150325092318000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150731092402000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20151003092412000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20151019092432000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20151120092503000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150104092248000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150104092248000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150104092248000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150731092402000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150410092326000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150816092406000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150426092332000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20151104092445000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150715092400000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150410092326000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150426092332000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20151003092412000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150104092248000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150325092318000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20151206092516000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150816092406000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150901092405000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150528092344000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150120092248000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150221092302000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150715092400000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20151206092516000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150715092400000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150512092340000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20151003092412000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150309092308000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150309092308000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150410092326000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150120092248000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150901092405000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150309092308000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150309092308000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150816092406000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150221092302000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150512092340000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20151104092445000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150512092340000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20151104092445000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150410092326000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20151222092532000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150731092402000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20151019092432000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20151019092432000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150613092352000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150613092352000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150613092352000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150325092318000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150120092248000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150901092405000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20151222092532000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150512092340000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150816092406000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150512092340000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150816092406000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20151206092516000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150528092344000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150426092332000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150104092248000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150528092344000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20151120092503000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150901092405000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150325092318000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150731092402000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150325092318000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150528092344000000.nc",
-    "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150309092308000000.nc"
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150731092402000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150221092302000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20151222092532000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20151222092532000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150613092352000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150512092340000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20151206092516000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20151003092412000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150426092332000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20151120092503000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150104092248000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150410092326000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20151019092432000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150816092406000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150715092400000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150426092332000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150613092352000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150901092405000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150731092402000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20151222092532000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20151104092445000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150410092326000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150613092352000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20151104092445000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150528092344000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150120092248000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150528092344000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20151003092412000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150715092400000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20151120092503000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20151120092503000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20151206092516000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150120092248000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20151104092445000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20151206092516000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150715092400000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20151019092432000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20151120092503000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150426092332000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150221092302000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150901092405000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150309092308000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20151003092412000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150221092302000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150120092248000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20151222092532000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150221092302000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150325092318000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20151019092432000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150325092318000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150731092402000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20151003092412000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20151019092432000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20151120092503000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150104092248000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150104092248000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150104092248000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150731092402000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150410092326000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150816092406000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150426092332000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20151104092445000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150715092400000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150410092326000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150426092332000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20151003092412000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150104092248000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150325092318000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20151206092516000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150816092406000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150901092405000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150528092344000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150120092248000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150221092302000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150715092400000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20151206092516000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150715092400000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150512092340000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20151003092412000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150309092308000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150309092308000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150410092326000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150120092248000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150901092405000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150309092308000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150309092308000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150816092406000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150221092302000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150512092340000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20151104092445000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150512092340000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20151104092445000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150410092326000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20151222092532000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150731092402000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20151019092432000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20151019092432000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_46_20150613092352000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150613092352000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150613092352000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150325092318000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150120092248000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_47_45_20150901092405000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20151222092532000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150512092340000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150816092406000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150512092340000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_46_20150816092406000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20151206092516000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150528092344000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150426092332000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150104092248000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150528092344000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20151120092503000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150901092405000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_45_20150325092318000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150731092402000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150325092318000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_47_20150528092344000000.nc"},
+    {"path": "/datacube/ingested_data/localuser/SAMPLE_CUBE_4326_48_48_20150309092308000000.nc"}
 ]
-database_dump_file = "/datacube/ingested_data/localuser/datacube_dump"
+database_dump = {"path": "/datacube/ingested_data/localuser/datacube_dump"}
+database_dump_file = database_dump['path']
 base_host = "http://192.168.100.14/"
 base_data_path = "/datacube/ingested_data/localuser"
+restore_jobs = 4
 
 
-def download_file(data_file, count, total):
+block_size = 1024 * 1024
+print_lock = threading.Lock()
 
-    # see if we've already download this file
-    if os.path.isfile(data_file):
-        print("Storage unit {0} exists! Skipping download of {1}. ".format(os.path.basename(data_file), data_file))
-        return None
 
-    # attempt https connection
-    try:
-        request = Request(base_host + data_file)
-        response = urlopen(request)
+def log(message):
+    with print_lock:
+        print(message)
 
-        # seems to be working
-        print("({0}/{1}) Downloading {2}".format(count, total, data_file))
 
-        # Open our local file for writing and build status bar
-        tf = tempfile.NamedTemporaryFile(mode='w+b', delete=False)
-        chunk_read(response, tf, report_hook=chunk_report)
+def get_checksum(path):
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as data:
+        for block in iter(lambda: data.read(block_size), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
 
-        tempfile_name = tf.name
-        tf.close()
 
-    #handle errors
-    except HTTPError as e:
-        print("HTTP Error:", e.code, data_file)
+def is_complete(path, entry):
+    # files without a size or checksum in the manifest are only checked for existence.
+    if not os.path.isfile(path):
         return False
-
-    except URLError as e:
-        print("URL Error:", e.reason, data_file)
+    if entry.get('size') is not None and os.path.getsize(path) != entry['size']:
         return False
+    return entry.get('sha256') is None or get_checksum(path) == entry['sha256']
 
-    # Return the file size
-    shutil.copy(tempfile_name, data_file)
-    os.remove(tempfile_name)
-    return os.path.getsize(data_file)
 
+def fetch(entry, partial_file):
+    # partial downloads are resumed with a range request - servers that ignore the range send the whole file.
+    offset = os.path.getsize(partial_file) if os.path.isfile(partial_file) else 0
+    if entry.get('size') is not None and offset > entry['size']:
+        offset = 0
+    request = Request(base_host.rstrip('/') + entry['path'])
+    if offset > 0:
+        request.add_header('Range', 'bytes={0}-'.format(offset))
 
-#  chunk_report taken from http://stackoverflow.com/questions/2028517/python-urllib2-progress-hook
-def chunk_report(bytes_so_far, chunk_size, total_size):
-    percent = float(bytes_so_far) / total_size
-    percent = round(percent * 100, 2)
-    sys.stdout.write("Downloaded %d of %d bytes (%0.2f%%)\r" % (bytes_so_far, total_size, percent))
+    try:
+        response = urlopen(request, timeout=60)
+    except HTTPError as e:
+        # the partial file is already complete or no longer matches the file on the server.
+        if e.code == 416:
+            os.remove(partial_file)
+        raise
 
-    if bytes_so_far >= total_size:
-        sys.stdout.write('\n')
+    with response:
+        mode = 'ab' if offset > 0 and response.status == 206 else 'wb'
+        with open(partial_file, mode) as local_file:
+            for block in iter(lambda: response.read(block_size), b''):
+                local_file.write(block)
 
 
-#  chunk_read modified from http://stackoverflow.com/questions/2028517/python-urllib2-progress-hook
-def chunk_read(response, local_file, chunk_size=8192, report_hook=None):
-    try:
-        total_size = response.info().getheader('Content-Length').strip()
-    except AttributeError:
-        total_size = response.getheader('Content-Length').strip()
-    total_size = int(total_size)
-    bytes_so_far = 0
-
-    while 1:
-        chunk = response.read(chunk_size)
+def download_file(entry, retries):
+    data_file = entry['path']
+
+    # see if we've already download this file
+    if is_complete(data_file, entry):
+        log("{0} exists! Skipping download.".format(os.path.basename(data_file)))
+        return None
+
+    partial_file = data_file + ".part"
+    for attempt in range(1, retries + 1):
         try:
-            local_file.write(chunk)
-        except TypeError:
-            local_file.write(chunk.decode(local_file.encoding))
-        bytes_so_far += len(chunk)
+            fetch(entry, partial_file)
+        except HTTPError as e:
+            log("HTTP Error: {0} {1} (attempt {2}/{3})".format(e.code, data_file, attempt, retries))
+            continue
+        except (URLError, OSError) as e:
+            log("Connection Error: {0} {1} (attempt {2}/{3})".format(getattr(e, 'reason', e), data_file, attempt,
+                                                                     retries))
+            continue
 
-        if not chunk:
-            break
+        if entry.get('sha256') is not None and get_checksum(partial_file) != entry['sha256']:
+            log("Checksum mismatch: {0} (attempt {1}/{2})".format(data_file, attempt, retries))
+            os.remove(partial_file)
+            continue
 
-        if report_hook:
-            report_hook(bytes_so_far, chunk_size, total_size)
+        os.replace(partial_file, data_file)
+        return os.path.getsize(data_file)
 
-    return bytes_so_far
+    return False
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download the storage units and database dump of a sample cube.")
+    parser.add_argument("--threads", type=int, default=4, help="number of files downloaded at once")
+    parser.add_argument("--retries", type=int, default=5, help="attempts per file, resuming partial downloads")
+    args = parser.parse_args()
+
     # Make sure we can write it our current directory
     if os.access("/datacube", os.W_OK) is False:
         print("Data Cube root path is not writeable - please ensure that the path '/datacube' exists and is writeable.")
@@ -229,58 +246,47 @@ if __name__ == "__main__":
 
     # summary
     total_bytes = 0
-    total_time = 0
-    count = 0
     success = []
     failed = []
     skipped = []
 
-    size = download_file(database_dump_file, 1, 1)
-
-    for data_file in files:
-        count += 1
-
-        start = time.time()
-        size = download_file(data_file, count, len(files))
-        end = time.time()
-
-        # stats:
-        if size is None:
-            skipped.append(data_file)
-
-        elif size is not False:
-            # Download was good!
-            elapsed = end - start
-            elapsed = 1.0 if elapsed < 1 else elapsed
-            rate = (size / 1024**2) / elapsed
-
-            print("Downloaded {0}b in {1:.2f}secs, Average Rate: {2:.2f}mb/sec".format(size, elapsed, rate))
-
-            # add up metrics
-            total_bytes += size
-            total_time += elapsed
-            success.append({'file': data_file, 'size': size})
-
-        else:
-            print("There was a problem downloading {0}".format(data_file))
-            failed.append(data_file)
+    downloads = [database_dump] + files
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(args.threads, 1)) as executor:
+        futures = {executor.submit(download_file, entry, max(args.retries, 1)): entry for entry in downloads}
+        for count, future in enumerate(as_completed(futures), 1):
+            data_file = futures[future]['path']
+            size = future.result()
+
+            # stats:
+            if size is None:
+                skipped.append(data_file)
+
+            elif size is not False:
+                # Download was good!
+                log("({0}/{1}) Downloaded {2} - {3}b".format(count, len(downloads), data_file, size))
+                total_bytes += size
+                success.append({'file': data_file, 'size': size})
+
+            else:
+                log("({0}/{1}) There was a problem downloading {2}".format(count, len(downloads), data_file))
+                failed.append(data_file)
+    elapsed = max(time.time() - start, 1.0)
 
     # Print summary:
     print("Download Summary")
     print("Successes: {0} files, {1} bytes ".format(len(success), total_bytes))
     if len(failed) > 0:
-        print("Failures: {0} files".format(len(failed)))
+        print("Failures: {0} files - run the script again to resume them.".format(len(failed)))
     if len(skipped) > 0:
         print("  Skipped: {0} files".format(len(skipped)))
     if len(success) > 0:
-        print("  Average Rate: {0:.2f}mb/sec".format((total_bytes / 1024.0**2) / total_time))
+        print("  Average Rate: {0:.2f}mb/sec".format((total_bytes / 1024.0**2) / elapsed))
 
     print("Requirements:")
-    print(
-        "	An initialized Data Cube database named 'datacube'. More info found at https://github.com/ceos-seo/data_cube_ui/blob/master/docs/open_data_cube_install.md"
-    )
-    print("	A database role named 'dc_user' that has read/write access to 'datacube'")
+    print("\tAn initialized Data Cube database named 'datacube'. More info found at https://github.com/ceos-seo/data_cube_ui/blob/master/docs/open_data_cube_install.md")
+    print("\tA database role named 'dc_user' that has read/write access to 'datacube'")
     print("Next steps:")
-    print(
-        "	Import the newly created database dump by running 'psql -U dc_user datacube < {}'".format(database_dump_file))
-    print("	Verify the import by running 'datacube -v product list'. There should be two entries.")
+    print("\tImport the newly created database dump by running 'pg_restore -U dc_user -d datacube -j {} {}'".format(
+        restore_jobs, database_dump_file))
+    print("\tVerify the import by running 'datacube -v product list'. There should be two entries.")
@@ -1,3 +1,98 @@
-from django.test import TestCase
+from datetime import datetime
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db.models import Q
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from apps.data_cube_manager.views import dataset
+
+
+class DatasetQuerySet(list):
+    """Evaluates the ordering and keyset filters used by DatasetListView against a list of value dicts"""
+
+    def order_by(self, *fields):
+        # NULLs sort last in ascending order, as they do in Postgres.
+        return DatasetQuerySet(
+            sorted(self, key=lambda row: tuple((row[field] is None, row[field] or 0) for field in fields)))
+
+    def count(self):
+        return len(self)
+
+    def filter(self, query):
+        return DatasetQuerySet(row for row in self if self._matches(row, query))
+
+    def __getitem__(self, index):
+        return DatasetQuerySet(super().__getitem__(index)) if isinstance(index, slice) else super().__getitem__(index)
+
+    def _matches(self, row, query):
+        matches = [
+            self._matches(row, child) if isinstance(child, Q) else self._lookup(row, *child) for child in query.children
+        ]
+        return any(matches) if query.connector == Q.OR else all(matches)
+
+    def _lookup(self, row, lookup, value):
+        field, _, operator = lookup.rpartition('__')
+        if operator == 'isnull':
+            return (row[field] is None) == value
+        if operator == 'gt':
+            return row[field] is not None and row[field] > value
+        return row[lookup] == value
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DatasetListPaginationTestCase(SimpleTestCase):
+    """Page through the dataset table, seeking past the last row of pages that were already served"""
+
+    def setUp(self):
+        cache.clear()
+        self.datasets = DatasetQuerySet({
+            'id': dataset_id,
+            'platform': "LANDSAT_7",
+            'instrument': "ETM",
+            'product_type': "LEDAPS",
+            'acquisition_dt': None,
+            'data_format': "GeoTIFF",
+            'extent__longitude_min': 0,
+            'extent__longitude_max': 1,
+            'extent__latitude_min': 0,
+            'extent__latitude_max': 1,
+            'extent__center_dt': center_dt
+        } for dataset_id, center_dt in [(1, datetime(2017, 1, 2)), (2, datetime(2017, 1, 18)), (
+            3, datetime(2017, 1, 2)), (4, None), (5, datetime(2017, 2, 3)), (6, None)])
+        form = mock.Mock(cleaned_data={'dataset_type_ref': [1], 'start_date': None})
+        form.is_valid.return_value = True
+        patchers = [
+            mock.patch.object(dataset.forms, 'DatasetFilterForm', return_value=form),
+            mock.patch.object(dataset.models.Dataset, 'filter_datasets', return_value=self.datasets),
+            mock.patch.object(dataset.models.Dataset, 'get_dataset_table_values', side_effect=lambda datasets: datasets)
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_page(self, start, length):
+        request = RequestFactory().post('/', {
+            'form_data': "dataset_type_ref=1",
+            'start': start,
+            'length': length,
+            'draw': 1
+        })
+        response = json.loads(dataset.DatasetListView().post(request).content.decode())
+        self.assertEqual(response['recordsTotal'], len(self.datasets))
+        return [row[0] for row in response['data']]
+
+    def test_pages(self):
+        self.assertEqual(self.get_page(0, 2), [1, 3])
+        self.assertEqual(self.get_page(2, 2), [2, 5])
+        # datasets without a center_dt sort last and must not be dropped by the seek.
+        self.assertEqual(self.get_page(4, 2), [4, 6])
+        self.assertEqual(self.get_page(0, -1), [1, 3, 2, 5, 4, 6])
+
+    def test_page_offsets(self):
+        # pages that start between two served page boundaries seek to the closest one and use a small offset.
+        self.assertEqual(self.get_page(0, 2), [1, 3])
+        self.assertEqual(self.get_page(3, 2), [5, 4])
+        self.assertEqual(self.get_page(5, 2), [6])
+        self.assertEqual(self.get_page(2, -1), [2, 5, 4, 6])
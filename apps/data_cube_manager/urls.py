@@ -48,6 +48,9 @@ urlpatterns = [
         name='view_dataset_type_datasets'),
     url(r'^datasets$', views.DatasetListView.as_view(), name='datasets'),
     url(r'^datasets/delete$', views.DeleteDataset.as_view(), name='delete_datasets'),
+    url(r'^datasets/delete/check/(?P<task_id>[\w\-]+)$',
+        views.CheckDatasetDeletionStatus.as_view(),
+        name='check_dataset_deletion'),
     # Ingestion related functionality
     url(r'^ingestion$', views.CreateIngestionConfigurationView.as_view(), name='ingestion_configuration'),
     url(r'^ingestion/export$', views.CreateIngestionConfigurationView.as_view(), name='export_ingestion'),
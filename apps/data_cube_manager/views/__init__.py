@@ -1,4 +1,4 @@
-from .dataset import DatasetListView, DeleteDataset
+from .dataset import DatasetListView, DeleteDataset, CheckDatasetDeletionStatus
 from .dataset_type import CreateDatasetType, DatasetTypeListView, DatasetTypeView, DatasetYamlExport, DeleteDatasetType, ValidateMeasurement
 from .ingestion import CreateIngestionConfigurationView, SubmitIngestion, IngestionMeasurement, CreateDataCubeSubset, CheckIngestionRequestStatus
 from .visualization import DataCubeVisualization, GetIngestedAreas
@@ -26,12 +26,40 @@ from django.template.loader import render_to_string
 from django.forms.models import model_to_dict
 from django.conf import settings
 from django.views import View
+from django.core.cache import cache
+from django.db.models import Q
 
 from urllib import parse
 from collections import OrderedDict
+import hashlib
+import json
 
 from apps.data_cube_manager import models
 from apps.data_cube_manager import forms
+from apps.data_cube_manager import tasks
+
+# Counts and page boundaries of a dataset filter are reused for this many seconds.
+DATASET_TABLE_CACHE_TIMEOUT = 60 * 5
+
+
+def get_filter_signature(cleaned_data):
+    """Get a cache key for the datasets selected by a DatasetFilterForm
+
+    The signature includes a version that is incremented when datasets are deleted so that counts and page
+    boundaries that include deleted datasets are not reused.
+
+    """
+    dataset_type_refs = sorted(
+        getattr(dataset_type, 'pk', dataset_type) for dataset_type in cleaned_data.get('dataset_type_ref') or [])
+    filters = [str(cleaned_data.get(key)) for key in sorted(cleaned_data) if key != 'dataset_type_ref']
+    signature = [cache.get('dataset_table_version', 0), dataset_type_refs, filters]
+    return hashlib.md5(json.dumps(signature).encode()).hexdigest()
+
+
+def invalidate_filter_signatures():
+    """Invalidate the cached counts and page boundaries of all dataset filters"""
+    cache.add('dataset_table_version', 0, None)
+    cache.incr('dataset_table_version')
 
 
 class DatasetListView(View):
@@ -74,15 +102,35 @@ class DatasetListView(View):
 
         dataset_filters = forms.DatasetFilterForm(form_data)
         if dataset_filters.is_valid():
-            ending_slice = int(request.POST.get('start')) + int(
-                request.POST.get('length')) if request.POST.get('length') != "-1" else -1
-            datasets = models.Dataset.filter_datasets(dataset_filters.cleaned_data)
-            total_records = datasets.count()
-
-            sliced_datasets = datasets[int(request.POST.get('start')):ending_slice] if ending_slice != -1 else datasets[
-                int(request.POST.get('start')):]
-
-            data = [dataset.get_dataset_table_columns() for dataset in sliced_datasets]
+            start = int(request.POST.get('start'))
+            length = int(request.POST.get('length'))
+            datasets = models.Dataset.filter_datasets(dataset_filters.cleaned_data).order_by('extent__center_dt', 'id')
+            signature = get_filter_signature(dataset_filters.cleaned_data)
+
+            total_records = cache.get('dataset_count_' + signature)
+            if total_records is None:
+                total_records = datasets.count()
+                cache.set('dataset_count_' + signature, total_records, DATASET_TABLE_CACHE_TIMEOUT)
+
+            # seek past the last row of the closest page that was already served rather than using a large offset.
+            # datasets without a center_dt sort last, so they always follow a page boundary.
+            page_keys = cache.get('dataset_pages_' + signature, {})
+            seek_start = max([page_start for page_start in page_keys if page_start <= start], default=0)
+            if seek_start > 0:
+                center_dt, dataset_id = page_keys[seek_start]
+                datasets = datasets.filter(
+                    Q(extent__center_dt__gt=center_dt) | Q(extent__center_dt=center_dt, id__gt=dataset_id) |
+                    Q(extent__center_dt__isnull=True))
+
+            offset = start - seek_start
+            values = models.Dataset.get_dataset_table_values(datasets)
+            rows = list(values[offset:offset + length] if length != -1 else values[offset:])
+
+            if length != -1 and len(rows) == length and rows[-1]['extent__center_dt'] is not None:
+                page_keys[start + length] = (rows[-1]['extent__center_dt'], rows[-1]['id'])
+                cache.set('dataset_pages_' + signature, page_keys, DATASET_TABLE_CACHE_TIMEOUT)
+
+            data = [models.Dataset.get_dataset_table_columns(row) for row in rows]
             context = {
                 'draw': int(request.POST.get('draw')),
                 'recordsTotal': total_records,
@@ -129,21 +177,57 @@ class DeleteDataset(View):
                 return JsonResponse(context)
 
     def post(self, request):
-        """Delete datasets based on a DatasetFilterForm
+        """Queue the deletion of datasets selected by a DatasetFilterForm
+
+        Datasets are removed in batches by tasks.delete_datasets so the request returns immediately - the
+        returned task id can be used with CheckDatasetDeletionStatus to follow its progress.
 
         POST data:
             Bound DatasetFilterForm used to select datasets for removal
+            archive: 'true' to archive the datasets rather than deleting them
+            dry_run: 'true' to only count the datasets that would be removed
 
         """
         if not request.user.is_superuser:
             return JsonResponse({'status': "ERROR", 'message': "Only superusers can delete datasets."})
         dataset_filters = forms.DatasetFilterForm(request.POST)
         if dataset_filters.is_valid():
-            filtered_datasets = models.Dataset.filter_datasets(dataset_filters.cleaned_data)
-            filtered_datasets.delete()
-            context = {'status': "OK"}
+            cleaned_data = dict(dataset_filters.cleaned_data)
+            cleaned_data['dataset_type_ref'] = [dataset_type.id for dataset_type in cleaned_data['dataset_type_ref']]
+            result = tasks.delete_datasets.delay(
+                dataset_filters=cleaned_data,
+                archive=request.POST.get('archive') == 'true',
+                dry_run=request.POST.get('dry_run') == 'true')
+            invalidate_filter_signatures()
+            context = {'status': "OK", 'task_id': result.id}
             return JsonResponse(context)
         else:
             for error in dataset_filters.errors:
                 context = {'status': "ERROR", 'message': dataset_filters.errors[error]}
                 return JsonResponse(context)
+
+
+class CheckDatasetDeletionStatus(View):
+    """Check the progress of a dataset deletion queued by DeleteDataset"""
+
+    def get(self, request, task_id):
+        """Get a Json response containing the status and progress of a delete_datasets task
+
+        Returns:
+            Json response with a status of WAIT, OK, or ERROR, total_records, and records_processed
+        """
+        if not request.user.is_superuser:
+            return JsonResponse({'status': "ERROR", 'message': "Only superusers can delete datasets."})
+
+        result = tasks.delete_datasets.AsyncResult(task_id)
+        if result.failed():
+            return JsonResponse({'status': "ERROR", 'message': "There was an error while removing the datasets."})
+
+        context = {'status': "WAIT", 'total_records': None, 'records_processed': 0}
+        if result.successful():
+            # counts cached while the deletion was in progress may include removed datasets.
+            invalidate_filter_signatures()
+            context['status'] = "OK"
+        if isinstance(result.info, dict):
+            context.update(result.info)
+        return JsonResponse(context)
@@ -27,6 +27,7 @@ from django.forms.models import model_to_dict
 from django.conf import settings
 from django.views import View
 from django.db.models import Q
+from django.core.cache import cache
 from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required
 
@@ -42,6 +43,9 @@ from apps.data_cube_manager import forms
 from apps.data_cube_manager import utils
 from apps.data_cube_manager import tasks
 
+# Status responses of an ingestion request are shared between polls for this many seconds.
+INGESTION_STATUS_CACHE_TIMEOUT = 5
+
 
 class CreateIngestionConfigurationView(View):
     """Create a new dataset type using the measurements and metadata forms"""
@@ -374,11 +378,19 @@ class CheckIngestionRequestStatus(View):
         return render(request, 'data_cube_manager/ingestion_request_status.html', context)
 
     def post(self, request, ingestion_request_id):
-        """Check on the status of an ingestion request, returning a json response containing the model"""
-        context = {'ingestion_request_id': ingestion_request_id}
-        ingestion_request = models.IngestionRequest.objects.get(pk=ingestion_request_id)
-        ingestion_request.update_storage_unit_count()
-        context.update(model_to_dict(ingestion_request))
+        """Check on the status of an ingestion request, returning a json response containing the model
+
+        The ingestion workers count processed storage units themselves, so this only reads the model. Responses
+        are cached for INGESTION_STATUS_CACHE_TIMEOUT seconds and invalidated when the request's status changes.
+
+        """
+        cache_key = models.IngestionRequest.get_status_cache_key(ingestion_request_id)
+        context = cache.get(cache_key)
+        if context is None:
+            context = {'ingestion_request_id': ingestion_request_id}
+            ingestion_request = models.IngestionRequest.objects.get(pk=ingestion_request_id)
+            context.update(model_to_dict(ingestion_request))
+            cache.set(cache_key, context, INGESTION_STATUS_CACHE_TIMEOUT)
         return JsonResponse(context)
 
 
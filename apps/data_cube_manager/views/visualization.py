@@ -20,7 +20,7 @@
 # under the License.
 
 from django.shortcuts import render, redirect
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse
 from django.core.files.base import ContentFile
 from django.template.loader import render_to_string
 from django.forms.models import model_to_dict
@@ -28,6 +28,8 @@ from django.conf import settings
 from django.views import View
 from django.db.models import Q
 from django.utils.decorators import method_decorator
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.contrib.auth.decorators import login_required
 
 from urllib import parse
@@ -59,24 +61,21 @@ class GetIngestedAreas(View):
     """Get a dict containing details on the ingested areas, grouped by Platform"""
 
     def get(self, request):
-        """Call a synchronous task to produce a dict containing ingestion details
+        """Serve the ingested area details cached by update_data_cube_details
 
-        Work performed in a synchrounous task so the execution is done on a worker rather than on
-        the webserver. Gets a dict like:
+        The json is built once when the details are updated rather than on every request, and is served with
+        ETag and Last-Modified headers so that unchanged details get a 304 response. Gets a dict like:
             {Landsat_5: [{}, {}, {}],
             Landsat_7: [{}, {}, {}]}
         """
 
-        platforms = models.IngestionDetails.objects.filter(
-            global_dataset=False).order_by().values_list('platform').distinct()
-
-        ingested_area_details = {
-            platform[0]: [
-                ingestion_detail_listing.get_serialized_response()
-                for ingestion_detail_listing in models.IngestionDetails.objects.filter(
-                    global_dataset=False, platform=platform[0])
-            ]
-            for platform in platforms
-        }
-
-        return JsonResponse(ingested_area_details)
+        ingested_areas = models.IngestionDetails.get_cached_ingested_areas()
+        response = get_conditional_response(
+            request, etag=ingested_areas['etag'], last_modified=ingested_areas['last_modified'])
+        if response is None:
+            response = HttpResponse(ingested_areas['content'], content_type='application/json')
+        response['ETag'] = ingested_areas['etag']
+        response['Last-Modified'] = http_date(ingested_areas['last_modified'])
+        # revalidate on every visit so that updated details are picked up.
+        patch_cache_control(response, no_cache=True)
+        return response
@@ -0,0 +1,287 @@
+import os
+import time
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import numpy as np
+import xarray as xr
+from celery.signals import task_prerun, task_postrun
+
+from apps.dc_algorithm.estimator import DEFAULT_RESOLUTION
+from apps.dc_algorithm.tracing import get_peak_rss
+
+# Landsat collection 1 pixel_qa values - see the clean mask functions of the Satellite model.
+PIXEL_QA_CLEAR = 322
+PIXEL_QA_WATER = 324
+PIXEL_QA_CLOUD = 352
+# Landsat 8 has a 16 day revisit time.
+REVISIT_DAYS = 16
+
+
+class SyntheticDataCube:
+    """A deterministic Landsat-like data cube generated on demand
+
+    Pixel values are a function of their position on a fixed grid and the acquisition index, so the same pixel
+    has the same value regardless of how a request is chunked. Clear pixels follow a smooth reflectance surface
+    with a band of water, while cloud_fraction of the pixels of each acquisition are set to bright cloud values.
+
+    Args:
+        latitude, longitude: (min, max) tuples of the extent of the cube
+        acquisitions: number of acquisitions, REVISIT_DAYS apart starting at start_date
+        cloud_fraction: fraction of the pixels of each acquisition covered by clouds, 0-1
+        resolution: pixel size in degrees
+        start_date: datetime of the first acquisition
+        seed: integer used to vary the noise between cubes
+
+    """
+
+    def __init__(self,
+                 latitude=(0, 0.1),
+                 longitude=(0, 0.1),
+                 acquisitions=10,
+                 cloud_fraction=0.2,
+                 resolution=DEFAULT_RESOLUTION,
+                 start_date=datetime(2016, 1, 1),
+                 seed=0):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.resolution = resolution
+        self.cloud_fraction = cloud_fraction
+        self.seed = seed
+        self.dates = [start_date + timedelta(days=REVISIT_DAYS * index) for index in range(acquisitions)]
+        # latitude is descending as in Data Cube loads.
+        num_latitudes = int(round((latitude[1] - latitude[0]) / resolution))
+        num_longitudes = int(round((longitude[1] - longitude[0]) / resolution))
+        self.latitudes = latitude[1] - resolution * (np.arange(num_latitudes) + 0.5)
+        self.longitudes = longitude[0] + resolution * (np.arange(num_longitudes) + 0.5)
+
+        self.bytes_read = 0
+        self._lock = threading.Lock()
+
+    @property
+    def shape(self):
+        return (len(self.dates), len(self.latitudes), len(self.longitudes))
+
+    def list_acquisition_dates(self, time=None, latitude=None, longitude=None):
+        """Get the acquisition datetimes within a time range, both inclusive"""
+        if not self._intersects(latitude, longitude):
+            return []
+        return [self.dates[index] for index in self._get_time_indices(time)]
+
+    def load(self, measurements=None, time=None, latitude=None, longitude=None, resolution=None):
+        """Generate a dataset in the format returned by DataAccessApi.get_dataset_by_extent
+
+        Args:
+            measurements: list of measurement names - every Landsat band and pixel_qa are supported, any other
+                measurement is generated as a smooth surface.
+            time: optional (start, end) tuple
+            latitude, longitude: optional (min, max) tuples
+            resolution: optional (y, x) resolution tuple - pixels are subsampled to the nearest multiple of
+                the cube's resolution.
+
+        Returns:
+            xarray Dataset with time, latitude, and longitude dimensions, empty if nothing intersects the request.
+
+        """
+        time_indices = self._get_time_indices(time)
+        stride = max(1, int(round(abs(resolution[1]) / self.resolution))) if resolution is not None else 1
+        lat_indices = self._get_coordinate_indices(self.latitudes, latitude)[::stride]
+        lon_indices = self._get_coordinate_indices(self.longitudes, longitude)[::stride]
+        if len(time_indices) == 0 or len(lat_indices) == 0 or len(lon_indices) == 0:
+            return xr.Dataset()
+
+        measurements = measurements or ['blue', 'green', 'red', 'nir', 'swir1', 'swir2', 'pixel_qa']
+        rows, columns = np.meshgrid(lat_indices, lon_indices, indexing='ij')
+        surface = 0.5 + 0.5 * np.sin(rows / 50.0) * np.cos(columns / 50.0)
+        water = surface < 0.2
+
+        data_vars = {name: [] for name in measurements}
+        for index in time_indices:
+            noise = self._noise(rows, columns, index)
+            cloud = self._noise(rows, columns, index + len(self.dates)) < self.cloud_fraction
+            for band_index, name in enumerate(measurements):
+                if name == 'pixel_qa':
+                    band = np.where(cloud, PIXEL_QA_CLOUD, np.where(water, PIXEL_QA_WATER, PIXEL_QA_CLEAR))
+                else:
+                    reflectance = 300 + 3000 * surface * (1 + 0.1 * band_index) + 200 * noise
+                    if name in ['nir', 'swir1', 'swir2']:
+                        reflectance = np.where(water, 100 + 50 * noise, reflectance)
+                    band = np.where(cloud, 8000 + 1000 * noise, reflectance)
+                data_vars[name].append(band.astype('int16'))
+
+        dataset = xr.Dataset(
+            {
+                name: (('time', 'latitude', 'longitude'), np.stack(bands))
+                for name, bands in data_vars.items()
+            },
+            coords={
+                'time': np.array([self.dates[index] for index in time_indices], dtype='datetime64[ns]'),
+                'latitude': self.latitudes[lat_indices],
+                'longitude': self.longitudes[lon_indices]
+            },
+            attrs={'crs': 'EPSG:4326'})
+        with self._lock:
+            self.bytes_read += dataset.nbytes
+        return dataset
+
+    def _noise(self, rows, columns, index):
+        """Deterministic pseudo random values in [0, 1) for each pixel of an acquisition"""
+        value = np.sin(rows * 12.9898 + columns * 78.233 + (index + self.seed) * 37.719) * 43758.5453
+        return value - np.floor(value)
+
+    def _intersects(self, latitude, longitude):
+        return all(
+            len(self._get_coordinate_indices(coordinates, bounds)) > 0
+            for coordinates, bounds in [(self.latitudes, latitude), (self.longitudes, longitude)])
+
+    def _get_time_indices(self, time):
+        if time is None:
+            return list(range(len(self.dates)))
+        start, end = [_to_datetime(value) for value in time]
+        # dates are inclusive of the whole end day.
+        if not isinstance(time[1], datetime):
+            end = end + timedelta(days=1) - timedelta(microseconds=1)
+        return [index for index, date in enumerate(self.dates) if start <= date <= end]
+
+    def _get_coordinate_indices(self, coordinates, bounds):
+        if bounds is None:
+            return np.arange(len(coordinates))
+        return np.where((coordinates >= min(bounds)) & (coordinates <= max(bounds)))[0]
+
+
+def _to_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime(value.year, value.month, value.day)
+
+
+class SyntheticDataAccessApi:
+    """Serves a SyntheticDataCube through the DataAccessApi methods used by the processing pipelines
+
+    Every product is served from the same cube. Used in place of DataAccessApi by the run_benchmark command.
+    """
+
+    def __init__(self, config=None, cube=None):
+        self.cube = cube
+
+    def get_dataset_by_extent(self, product, product_type=None, platform=None, time=None, longitude=None,
+                              latitude=None, measurements=None, resolution=None, **kwargs):
+        return self.cube.load(
+            measurements=measurements, time=time, latitude=latitude, longitude=longitude, resolution=resolution)
+
+    def get_stacked_datasets_by_extent(self, products, product_type=None, platforms=None, time=None,
+                                       longitude=None, latitude=None, measurements=None, resolution=None, **kwargs):
+        dataset = self.cube.load(
+            measurements=measurements, time=time, latitude=latitude, longitude=longitude, resolution=resolution)
+        if 'time' not in dataset:
+            return None
+        dataset['satellite'] = xr.zeros_like(dataset[list(dataset.data_vars)[0]], dtype='int16')
+        return dataset
+
+    def list_acquisition_dates(self, product, platform=None, time=None, longitude=None, latitude=None, **kwargs):
+        return self.cube.list_acquisition_dates(time=time, latitude=latitude, longitude=longitude)
+
+    def list_combined_acquisition_dates(self, products, platforms=None, time=None, longitude=None, latitude=None,
+                                        **kwargs):
+        return self.cube.list_acquisition_dates(time=time, latitude=latitude, longitude=longitude)
+
+    def validate_measurements(self, product, measurements, **kwargs):
+        return True
+
+    def get_datacube_metadata(self, product, platform=None):
+        return {
+            'lat_extents': self.cube.latitude,
+            'lon_extents': self.cube.longitude,
+            'time_extents': (self.cube.dates[0], self.cube.dates[-1]),
+            'scene_count': len(self.cube.dates),
+            'pixel_count': int(np.prod(self.cube.shape)),
+            'tile_count': len(self.cube.dates),
+            'storage_units': {}
+        }
+
+    def close(self):
+        pass
+
+
+def get_directory_size(*paths):
+    """Get the total size in bytes of all files under a set of directories"""
+    total = 0
+    for path in paths:
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+    return total
+
+
+class PipelineProfiler:
+    """Records per stage timings, bytes written, and peak RSS for the celery tasks of a single task model
+
+    Connects to the celery task_prerun and task_postrun signals, so it works for eager execution and for workers
+    running in this process. Stage times exclude the time spent in stages that were applied from within them, as
+    happens in eager mode where e.g. start_chunk_processing runs the whole processing pipeline.
+
+    Args:
+        task: task model instance to profile - only celery tasks called with its pk as task_id are recorded.
+
+    """
+
+    def __init__(self, task):
+        self.task_id = str(task.pk)
+        self.paths = [task.get_temp_path(), task.get_result_path()]
+        self.stages = defaultdict(lambda: {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'bytes_written': 0,
+                                           'peak_rss': 0})
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __enter__(self):
+        task_prerun.connect(self._on_prerun, weak=False)
+        task_postrun.connect(self._on_postrun, weak=False)
+        return self
+
+    def __exit__(self, *args):
+        task_prerun.disconnect(self._on_prerun)
+        task_postrun.disconnect(self._on_postrun)
+
+    def _get_stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _on_prerun(self, sender=None, task_id=None, task=None, args=None, kwargs=None, **extra):
+        if str((kwargs or {}).get('task_id')) != self.task_id:
+            return
+        self._get_stack().append({
+            'start': time.perf_counter(),
+            'children': 0.0,
+            'children_bytes': 0,
+            'bytes': get_directory_size(*self.paths)
+        })
+
+    def _on_postrun(self, sender=None, task_id=None, task=None, args=None, kwargs=None, **extra):
+        if str((kwargs or {}).get('task_id')) != self.task_id or len(self._get_stack()) == 0:
+            return
+        frame = self._get_stack().pop()
+        elapsed = time.perf_counter() - frame['start']
+        total_bytes_written = max(get_directory_size(*self.paths) - frame['bytes'], 0)
+        if len(self._get_stack()) > 0:
+            self._get_stack()[-1]['children'] += elapsed
+            self._get_stack()[-1]['children_bytes'] += total_bytes_written
+        seconds = elapsed - frame['children']
+        bytes_written = max(total_bytes_written - frame['children_bytes'], 0)
+
+        stage_name = task.name.split('.')[-1]
+        with self._lock:
+            stage = self.stages[stage_name]
+            stage['count'] += 1
+            stage['seconds'] += seconds
+            stage['max_seconds'] = max(stage['max_seconds'], seconds)
+            stage['bytes_written'] += bytes_written
+            stage['peak_rss'] = max(stage['peak_rss'], get_peak_rss())
+
+    def get_results(self):
+        with self._lock:
+            return {name: dict(stage) for name, stage in self.stages.items()}
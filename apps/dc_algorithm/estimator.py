@@ -0,0 +1,123 @@
+from django.db.models.expressions import RawSQL
+
+import numpy as np
+
+from apps.data_cube_manager.models import Dataset, DatasetType
+from . import scheduler
+
+# Used for products without a storage resolution, e.g. products that have not been ingested. ~30m.
+DEFAULT_RESOLUTION = 0.000269494585236
+# Processing cost relative to a most recent mosaic. Non iterative compositors need the full time stack in memory.
+COMPOSITOR_COST_FACTORS = {
+    'most_recent': 1,
+    'least_recent': 1,
+    'max_ndvi': 1.5,
+    'min_ndvi': 1.5,
+    'median_pixel': 3,
+    'geo_median': 20
+}
+DEFAULT_COST_FACTOR = 1
+# Rough throughput of a single task_processing worker - calibrate these for your cluster.
+CPU_SECONDS_PER_MILLION_PIXELS = 1.0
+BYTES_READ_PER_SECOND = 50 * 1024 * 1024
+# Number of task_processing worker processes - this should match the concurrency in celeryd_conf.
+WORKER_CONCURRENCY = 10
+
+# Estimates above these limits are rejected. A value of `None` indicates no limit.
+MAX_ESTIMATED_BYTES = 50 * 1024**3
+MAX_ESTIMATED_CPU_SECONDS = 12 * 3600
+# Estimates with a wall time above this are flagged as large so users confirm before submitting.
+LARGE_TASK_WALL_TIME = 15 * 60
+
+
+def count_acquisitions(dataset_type, latitude, longitude, time):
+    """Count the distinct acquisition times of a product that intersect a bounding box and time range"""
+    datasets = Dataset.filter_datasets({
+        'dataset_type_ref': dataset_type.id,
+        'latitude_min': latitude[0],
+        'latitude_max': latitude[1],
+        'longitude_min': longitude[0],
+        'longitude_max': longitude[1],
+        'start_date': time[0],
+        'end_date': time[1]
+    }).filter(archived__isnull=True)
+    return datasets.annotate(center_dt=RawSQL("dataset.metadata #>> '{extent,center_dt}'", [])).values(
+        'center_dt').distinct().count()
+
+
+def get_bytes_per_pixel(dataset_type, measurements):
+    """Sum the dtype sizes of the requested measurements of a product"""
+    return sum(
+        np.dtype(measurement['dtype']).itemsize for measurement in dataset_type.definition.get('measurements', [])
+        if measurement['name'] in measurements)
+
+
+def get_pixel_count(dataset_type, latitude, longitude):
+    """Get the number of pixels in a bounding box from the storage resolution of a product"""
+    resolution = dataset_type.definition.get('storage', {}).get('resolution', {})
+    resolution_latitude = abs(resolution.get('latitude', DEFAULT_RESOLUTION))
+    resolution_longitude = abs(resolution.get('longitude', DEFAULT_RESOLUTION))
+    return int(
+        np.ceil((latitude[1] - latitude[0]) / resolution_latitude) *
+        np.ceil((longitude[1] - longitude[0]) / resolution_longitude))
+
+
+def estimate_task_cost(satellite, area_id, latitude, longitude, time, compositor=None):
+    """Estimate the resources required to process a request before it is submitted
+
+    The acquisition count comes from the Data Cube index and the pixel count from the storage resolution
+    of each product. Bytes read assumes that every requested measurement is read for every pixel of every
+    acquisition. Wall time assumes that the request shares the task_processing workers evenly with the
+    tasks that are currently active.
+
+    Args:
+        satellite: Satellite model instance
+        area_id: area id used to build product names
+        latitude, longitude: (min, max) tuples
+        time: (start, end) tuple of dates
+        compositor: optional compositor id - see COMPOSITOR_COST_FACTORS
+
+    Returns:
+        Dict containing acquisitions, pixels, bytes, cpu_seconds, wall_time (seconds), active_tasks,
+        and a recommendation of 'run', 'confirm' for large tasks, or 'reject' along with a message.
+
+    """
+    acquisitions, pixels, bytes_read, pixel_acquisitions = 0, 0, 0, 0
+    measurements = satellite.get_measurements()
+    for dataset_type in DatasetType.objects.using('agdc').filter(name__in=satellite.get_products(area_id)):
+        product_acquisitions = count_acquisitions(dataset_type, latitude, longitude, time)
+        product_pixels = get_pixel_count(dataset_type, latitude, longitude)
+        acquisitions += product_acquisitions
+        pixels = max(pixels, product_pixels)
+        pixel_acquisitions += product_pixels * product_acquisitions
+        bytes_read += product_pixels * product_acquisitions * get_bytes_per_pixel(dataset_type, measurements)
+
+    cpu_seconds = pixel_acquisitions / 1e6 * CPU_SECONDS_PER_MILLION_PIXELS * COMPOSITOR_COST_FACTORS.get(
+        compositor, DEFAULT_COST_FACTOR) + bytes_read / BYTES_READ_PER_SECOND
+    active_tasks = sum(queryset.count() for queryset in scheduler.get_active_tasks().values())
+    available_workers = max(WORKER_CONCURRENCY / (active_tasks + 1), 1)
+    wall_time = cpu_seconds / available_workers
+
+    estimate = {
+        'acquisitions': acquisitions,
+        'pixels': pixels,
+        'bytes': int(bytes_read),
+        'cpu_seconds': int(cpu_seconds),
+        'wall_time': int(wall_time),
+        'active_tasks': active_tasks,
+        'recommendation': 'run',
+        'message': None
+    }
+    if MAX_ESTIMATED_BYTES is not None and bytes_read > MAX_ESTIMATED_BYTES:
+        estimate['recommendation'] = 'reject'
+        estimate['message'] = "This task would read an estimated {:.1f} GB of data - the limit is {:.1f} GB. " \
+                              "Please reduce the area or time range.".format(bytes_read / 1024**3,
+                                                                            MAX_ESTIMATED_BYTES / 1024**3)
+    elif MAX_ESTIMATED_CPU_SECONDS is not None and cpu_seconds > MAX_ESTIMATED_CPU_SECONDS:
+        estimate['recommendation'] = 'reject'
+        estimate['message'] = "This task would take an estimated {:.1f} processing hours - the limit is {:.1f}. " \
+                              "Please reduce the area or time range or choose a simpler compositor.".format(
+                                  cpu_seconds / 3600, MAX_ESTIMATED_CPU_SECONDS / 3600)
+    elif wall_time > LARGE_TASK_WALL_TIME:
+        estimate['recommendation'] = 'confirm'
+    return estimate
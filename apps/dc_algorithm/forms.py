@@ -1,6 +1,9 @@
 from django import forms
 
 from .models import Satellite
+from . import estimator
+
+import datetime
 
 # This is the maximum number of tasks per user across all apps.
 # A value of `None` indicates no limit.
@@ -57,6 +60,7 @@ class DataSelectionForm(forms.Form):
         self.user_id = kwargs.pop('user_id', None)
         self.user_history = kwargs.pop('user_history', None)
         self.task_model_class = kwargs.pop('task_model_class', None)
+        self.cost_estimate = None
         super(DataSelectionForm, self).__init__(*args, **kwargs)
         #meant to prevent this routine from running if trying to init from querydict.
         if time_start and time_end:
@@ -130,6 +134,18 @@ class DataSelectionForm(forms.Form):
             if num_running_tasks >= MAX_NUM_TASKS_PER_USER:
                 self.add_error(None, 'You may only run {} task(s) at a time.'.format(MAX_NUM_TASKS_PER_USER))
 
+        # Estimate the cost of the request - see estimator.estimate_task_cost. Rejected estimates are form errors.
+        # The compositor is part of an app's additional options, so it is read from the raw form data.
+        self.cost_estimate = None
+        if self.user_id is not None and not self.errors and isinstance(time_start, datetime.date):
+            self.cost_estimate = estimator.estimate_task_cost(
+                cleaned_data['satellite'],
+                cleaned_data['area_id'], (latitude_min, latitude_max), (longitude_min, longitude_max),
+                (time_start, time_end),
+                compositor=self.data.get('compositor'))
+            if self.cost_estimate['recommendation'] == 'reject':
+                self.add_error(None, self.cost_estimate['message'])
+
         return cleaned_data
 
     def check_time_range(self, time_start, time_end, max_num_years=5):
@@ -148,4 +164,34 @@ class DataSelectionForm(forms.Form):
         day_diff = time_end.day - time_start.day
         return (year_diff > max_num_years) or \
                (year_diff == max_num_years and month_diff > 0) or \
-               (year_diff == max_num_years and month_diff == 0 and day_diff > 0)
\ No newline at end of file
+               (year_diff == max_num_years and month_diff == 0 and day_diff > 0)
+
+
+class SubsetBoundsForm(forms.Form):
+    """Validates the bounds of a spatial subset of an existing result - see SubmitNewSubsetRequest
+
+    The fields are those of DataSelectionForm. The remaining parameters come from the existing result, so the
+    subset must also fall within its bounds.
+    """
+
+    latitude_min = DataSelectionForm.base_fields['latitude_min']
+    latitude_max = DataSelectionForm.base_fields['latitude_max']
+    longitude_min = DataSelectionForm.base_fields['longitude_min']
+    longitude_max = DataSelectionForm.base_fields['longitude_max']
+
+    def clean(self):
+        cleaned_data = super(SubsetBoundsForm, self).clean()
+        if self.errors:
+            return cleaned_data
+
+        if cleaned_data['latitude_min'] > cleaned_data['latitude_max']:
+            self.add_error(
+                'latitude_min',
+                "Please enter a valid pair of latitude values where the lower bound is less than or equal to the upper bound.")
+
+        if cleaned_data['longitude_min'] > cleaned_data['longitude_max']:
+            self.add_error(
+                'longitude_min',
+                "Please enter a valid pair of longitude values where the lower bound is less than or equal to the upper bound.")
+
+        return cleaned_data
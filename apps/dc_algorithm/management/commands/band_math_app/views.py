@@ -32,13 +32,13 @@ from datetime import datetime, timedelta
 from apps.dc_algorithm.models import Satellite, Area, Application
 from apps.dc_algorithm.forms import DataSelectionForm
 from .forms import AdditionalOptionsForm
-from .tasks import run, pixel_drill
+from .tasks import run, pixel_drill, subset
 
 from collections import OrderedDict
 
-from apps.dc_algorithm.views import (ToolView, SubmitNewRequest, SubmitPixelDrillRequest, GetTaskResult,
-                                     SubmitNewSubsetRequest, CancelRequest, UserHistory, ResultList, OutputList,
-                                     RegionSelection, TaskDetails)
+from apps.dc_algorithm.views import (ToolView, SubmitNewRequest, EstimateTaskCost, SubmitPixelDrillRequest,
+                                     GetTaskResult, GetTaskPlotData, SubmitNewSubsetRequest, CancelRequest, UserHistory,
+                                     ResultList, OutputList, RegionSelection, TaskDetails)
 
 
 class RegionSelection(RegionSelection):
@@ -100,6 +100,19 @@ class SubmitNewRequest(SubmitNewRequest):
     form_list = [DataSelectionForm, AdditionalOptionsForm]
 
 
+class EstimateTaskCost(EstimateTaskCost):
+    """
+    Estimate task cost REST API Endpoint
+    Extends the EstimateTaskCost abstract class - required attributes are the tool_name,
+    task_model_name, and form_list
+
+    See the dc_algorithm.views docstrings for more information.
+    """
+    tool_name = 'band_math_app'
+    task_model_name = 'BandMathTask'
+    form_list = [DataSelectionForm, AdditionalOptionsForm]
+
+
 class SubmitPixelDrillRequest(SubmitPixelDrillRequest):
     """
     Submit pixel_drill request REST API Endpoint
@@ -130,6 +143,18 @@ class GetTaskResult(GetTaskResult):
     task_model_name = 'BandMathTask'
 
 
+class GetTaskPlotData(GetTaskPlotData):
+    """
+    Get task plot data REST API endpoint
+    Extends the GetTaskPlotData abstract class, required attributes are the tool_name
+    and task_model_name
+
+    See the dc_algorithm.views docstrings for more information.
+    """
+    tool_name = 'band_math_app'
+    task_model_name = 'BandMathTask'
+
+
 class SubmitNewSubsetRequest(SubmitNewSubsetRequest):
     """
     Submit new subset request REST API endpoint
@@ -142,6 +167,7 @@ class SubmitNewSubsetRequest(SubmitNewSubsetRequest):
     task_model_name = 'BandMathTask'
 
     celery_task_func = run
+    subset_task_func = subset
 
     def task_model_update_func(self, task_model, **kwargs):
         """
@@ -16,12 +16,16 @@ from utils.data_cube_utilities.dc_utilities import (create_cfmask_clean_mask, cr
                                                     write_png_from_xr, add_timestamp_data_to_xr, clear_attrs)
 from utils.data_cube_utilities.dc_chunker import (create_geographic_chunks, create_time_chunks,
                                                   combine_geographic_chunks)
-from apps.dc_algorithm.utils import create_2d_plot
+from apps.dc_algorithm.utils import (write_2d_plot_data, get_pixel_time_series, pixel_time_series_cache,
+                                     slice_dataset_to_extent)
 from utils.data_cube_utilities.import_export import export_xarray_to_netcdf
 
 from .models import AppNameTask
 from apps.dc_algorithm.models import Satellite
-from apps.dc_algorithm.tasks import DCAlgorithmBase
+from apps.dc_algorithm.tasks import DCAlgorithmBase, task_clean_up, combine_split_chunks
+from apps.dc_algorithm.scheduler import prioritize
+from apps.dc_algorithm.tracing import trace_step
+from apps.dc_algorithm.memory import split_chunk_over_memory_budget, get_planned_geographic_chunk_size
 
 logger = get_task_logger(__name__)
 
@@ -32,7 +36,7 @@ class BaseTask(DCAlgorithmBase):
 
 
 # TODO: If pixel drilling is enabled, uncomment this block and fill in the remaining TODOs
-"""@task(name="app_name.pixel_drill", base=BaseTask)
+"""@task(name="app_name.pixel_drill", base=BaseTask, queue="pixel_drill")
 def pixel_drill(task_id=None):
     parameters = parse_parameters_from_task(task_id=task_id)
     validate_parameters(parameters, task_id=task_id)
@@ -42,7 +46,13 @@ def pixel_drill(task_id=None):
         return None
 
     dc = DataAccessApi(config=task.config_path)
-    single_pixel = dc.get_stacked_datasets_by_extent(**parameters)
+    single_pixel = get_pixel_time_series(dc.dc, cache=pixel_time_series_cache, **task.get_point_query_parameters())
+    dc.close()
+    if single_pixel is None:
+        task.complete = True
+        task.update_status("ERROR", "There are no acquistions for this parameter set.")
+        return None
+
     clear_mask = task.satellite.get_clean_mask_func()(single_pixel.isel(latitude=0, longitude=0))
     single_pixel = single_pixel.where(single_pixel != task.satellite.no_data_value)
 
@@ -52,21 +62,24 @@ def pixel_drill(task_id=None):
         return None
     # TODO: This is an example of how this is normally done. Change it to do what this app does, just on a time
     # series of single pixels.
-    wofs_data = task.get_processing_method()(single_pixel,
-                                             clean_mask=clear_mask,
-                                             enforce_float64=True,
-                                             no_data=task.satellite.no_data_value)
+    with trace_step("process"):
+        wofs_data = task.get_processing_method()(single_pixel,
+                                                 clean_mask=clear_mask,
+                                                 enforce_float64=True,
+                                                 no_data=task.satellite.no_data_value)
     wofs_data = wofs_data.where(wofs_data != task.satellite.no_data_value).isel(latitude=0, longitude=0)
 
     # transpose flattens it into a 1xn array - TODO: add any bands in the first array that you want to.
-    # data_labels, titles, style should all be the same length as datasets. Style refers to matplotlib styling.
+    # data_labels, titles, style should all be the same length as datasets.
+    # Style uses matplotlib style format strings that are interpretted client side.
     datasets = [wofs_data.wofs.values.transpose()] + [clear_mask]
     data_labels = ["Water/Non Water"] + ["Clear"]
     titles = ["Water/Non Water"] + ["Clear Mask"]
     style = ['.', '.']
 
-    task.plot_path = os.path.join(task.get_result_path(), "plot_path.png")
-    create_2d_plot(task.plot_path, dates=dates, datasets=datasets, data_labels=data_labels, titles=titles, style=style)
+    task.plot_path = os.path.join(task.get_result_path(), "plot_data.json")
+    write_2d_plot_data(
+        task.plot_path, dates=dates, datasets=datasets, data_labels=data_labels, titles=titles, style=style)
 
     task.complete = True
     task.update_status("OK", "Done processing pixel drill.")"""
@@ -86,6 +99,46 @@ def run(task_id=None):
     return True
 
 
+@task(name="app_name.subset", base=BaseTask)
+def subset(task_id=None, parent_id=None):
+    """Create the output products of a task by slicing the stored intermediate product of a parent task
+
+    See Query.is_subset_of for the requirements. No data is loaded from the Data Cube - the parent's
+    intermediate product is sliced to the task's bounds and passed directly to create_output_products.
+    """
+    return chain(slice_parent_result.s(task_id=task_id, parent_id=parent_id),
+                 create_output_products.s(task_id=task_id, subset=True),
+                 task_clean_up.si(task_id=task_id, task_model='AppNameTask'))()
+
+
+@task(name="app_name.slice_parent_result", base=BaseTask)
+def slice_parent_result(task_id=None, parent_id=None):
+    """Slice the stored intermediate product of a parent task to the bounds of a task
+
+    The parent's metadata dict is reused for the acquisition list. Its per acquisition statistics describe the
+    parent's extent and can't be recomputed from the composited product, so create_output_products drops them.
+
+    Returns:
+        path to the sliced product, path to its metadata, and a dict containing the geo/time ids
+    """
+    task = AppNameTask.objects.get(pk=task_id)
+    parent = AppNameTask.objects.get(pk=parent_id)
+
+    task.execution_start = datetime.now()
+    task.update_status("WAIT", "Slicing the result of an existing task.")
+
+    dataset = slice_dataset_to_extent(
+        parent.open_intermediate(),
+        latitude=(task.latitude_min, task.latitude_max),
+        longitude=(task.longitude_min, task.longitude_max))
+    path = os.path.join(task.get_temp_path(), "subset.nc")
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(dataset, path)
+        span.add_output(path)
+    metadata_path = task.store_chunk_metadata(path, parent.get_intermediate_metadata())
+    return path, metadata_path, {'geo_chunk_id': 0, 'time_chunk_id': 0}
+
+
 @task(name="app_name.parse_parameters_from_task", base=BaseTask)
 def parse_parameters_from_task(task_id=None):
     """Parse out required DC parameters from the task model.
@@ -115,6 +168,8 @@ def parse_parameters_from_task(task_id=None):
         'measurements': task.satellite.get_measurements()
     }
 
+    parameters.update(task.get_preview_load_parameters())
+
     task.execution_start = datetime.now()
     task.update_status("WAIT", "Parsed out parameters.")
 
@@ -194,7 +249,7 @@ def perform_task_chunking(parameters, task_id=None):
     geographic_chunks = create_geographic_chunks(
         longitude=parameters['longitude'],
         latitude=parameters['latitude'],
-        geographic_chunk_size=task_chunk_sizing['geographic'])
+        geographic_chunk_size=get_planned_geographic_chunk_size(task, task_chunk_sizing, dates))
 
     time_chunks = create_time_chunks(
         dates, _reversed=task.get_reverse_time(), time_chunk_size=task_chunk_sizing['time'])
@@ -221,7 +276,6 @@ def start_chunk_processing(chunk_details, task_id=None):
     if chunk_details is None:
         return None
 
-    parameters = chunk_details.get('parameters')
     geographic_chunks = chunk_details.get('geographic_chunks')
     time_chunks = chunk_details.get('time_chunks')
 
@@ -230,6 +284,8 @@ def start_chunk_processing(chunk_details, task_id=None):
                                                                      if task.get_chunk_size()['time'] is not None else
                                                                      len(time_chunks[0]))
     task.scenes_processed = 0
+    # processing tasks read their parameters and chunks from the stored details rather than their messages.
+    task.store_chunk_details(chunk_details)
     task.update_status("WAIT", "Starting processing.")
 
     logger.info("START_CHUNK_PROCESSING")
@@ -239,28 +295,25 @@ def start_chunk_processing(chunk_details, task_id=None):
             processing_task.s(
                 task_id=task_id,
                 geo_chunk_id=geo_index,
-                time_chunk_id=time_index,
-                geographic_chunk=geographic_chunk,
-                time_chunk=time_chunk,
-                **parameters) for geo_index, geographic_chunk in enumerate(geographic_chunks)
-        ]) | recombine_geographic_chunks.s(task_id=task_id) for time_index, time_chunk in enumerate(time_chunks)
+                time_chunk_id=time_index) for geo_index in range(len(geographic_chunks))
+        ]) | recombine_geographic_chunks.s(task_id=task_id) for time_index in range(len(time_chunks))
     ]) | recombine_time_chunks.s(task_id=task_id)
 
-    processing_pipeline = (processing_pipeline | create_output_products.s(task_id=task_id)).apply_async()
+    processing_pipeline = prioritize(processing_pipeline | create_output_products.s(task_id=task_id), task).apply_async()
     return True
 
 
-@task(name="app_name.processing_task", acks_late=True, base=BaseTask)
-def processing_task(task_id=None,
+@task(name="app_name.processing_task", acks_late=True, base=BaseTask, bind=True)
+def processing_task(self,
+                    task_id=None,
                     geo_chunk_id=None,
                     time_chunk_id=None,
                     geographic_chunk=None,
-                    time_chunk=None,
-                    **parameters):
+                    time_chunk=None):
     """Process a parameter set and save the results to disk.
 
     Uses the geographic and time chunk id to identify output products.
-    **params is updated with time and geographic ranges then used to load data.
+    The load parameters are read from the stored chunk details and updated with time and geographic ranges.
     the task model holds the iterative property that signifies whether the algorithm
     is iterative or if all data needs to be loaded at once.
 
@@ -268,10 +321,9 @@ def processing_task(task_id=None,
         task_id, geo_chunk_id, time_chunk_id: identification for the main task and what chunk this is processing
         geographic_chunk: range of latitude and longitude to load - dict with keys latitude, longitude
         time_chunk: list of acquisition dates
-        parameters: all required kwargs to load data.
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
     """
 
     chunk_id = "_".join([str(geo_chunk_id), str(time_chunk_id)])
@@ -281,6 +333,22 @@ def processing_task(task_id=None,
     if not os.path.exists(task.get_temp_path()):
         return None
 
+    geographic_chunk, time_chunk, parameters = task.get_chunk_parameters(
+        geo_chunk_id, time_chunk_id, geographic_chunk=geographic_chunk)
+
+    # over budget chunks are processed as smaller chunks that are combined before recombination.
+    geographic_chunks = split_chunk_over_memory_budget(task, geographic_chunk, time_chunk, parameters)
+    if geographic_chunks is not None:
+        return self.replace(
+            group([
+                processing_task.s(
+                    task_id=task_id,
+                    geo_chunk_id="{}.{}".format(geo_chunk_id, index),
+                    time_chunk_id=time_chunk_id,
+                    geographic_chunk=split_chunk) for index, split_chunk in enumerate(geographic_chunks)
+            ]) | combine_split_chunks.s(
+                task_id=task_id, app_name='app_name', geo_chunk_id=geo_chunk_id, time_chunk_id=time_chunk_id))
+
     iteration_data = None
     metadata = {}
 
@@ -299,7 +367,9 @@ def processing_task(task_id=None,
     for time_index, time in enumerate(times):
         updated_params.update({'time': time})
         # TODO: If this is not a multisensory app replace get_stacked_datasets_by_extent with get_dataset_by_extent
-        data = dc.get_stacked_datasets_by_extent(**updated_params)
+        with trace_step("load") as span:
+            data = dc.get_stacked_datasets_by_extent(**updated_params)
+            span.add_input(data)
         if data is None or 'time' not in data:
             logger.info("Invalid chunk.")
             continue
@@ -311,11 +381,12 @@ def processing_task(task_id=None,
         metadata = task.metadata_from_dataset(metadata, data, clear_mask, updated_params)
 
         # TODO: Make sure you're producing everything required for your algorithm.
-        iteration_data = task.get_processing_method()(data,
-                                                      clean_mask=clear_mask,
-                                                      intermediate_product=iteration_data,
-                                                      no_data=task.satellite.no_data_value,
-                                                      reverse_time=task.get_reverse_time())
+        with trace_step("process"):
+            iteration_data = task.get_processing_method()(data,
+                                                          clean_mask=clear_mask,
+                                                          intermediate_product=iteration_data,
+                                                          no_data=task.satellite.no_data_value,
+                                                          reverse_time=task.get_reverse_time())
 
         # TODO: If there is no animation you can remove this block. Otherwise, save off the data that you need.
         if task.animated_product.animation_id != "none":
@@ -325,9 +396,13 @@ def processing_task(task_id=None,
                 #need to clear out all the metadata..
                 clear_attrs(data)
                 #can't reindex on time - weird?
-                export_xarray_to_netcdf(data.isel(time=0).drop('time'), path)
+                with trace_step("export") as span:
+                    export_xarray_to_netcdf(data.isel(time=0).drop('time'), path)
+                    span.add_output(path)
             elif task.animated_product.animation_id == "cumulative":
-                export_xarray_to_netcdf(iteration_data, path)
+                with trace_step("export") as span:
+                    export_xarray_to_netcdf(iteration_data, path)
+                    span.add_output(path)
 
         task.scenes_processed = F('scenes_processed') + 1
         task.save()
@@ -336,10 +411,13 @@ def processing_task(task_id=None,
         return None
 
     path = os.path.join(task.get_temp_path(), chunk_id + ".nc")
-    export_xarray_to_netcdf(iteration_data, path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(iteration_data, path)
+        span.add_output(path)
     dc.close()
     logger.info("Done with chunk: " + chunk_id)
-    return path, metadata, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
+    metadata_path = task.store_chunk_metadata(path, metadata)
+    return path, metadata_path, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
 
 
 @task(name="app_name.recombine_geographic_chunks", base=BaseTask)
@@ -350,10 +428,10 @@ def recombine_geographic_chunks(chunks, task_id=None):
     and combine it into a single dataset. Combine metadata as well, writing to disk.
 
     Args:
-        chunks: list of the return from the processing_task function - path, metadata, and {chunk ids}
+        chunks: list of the return from the processing_task function - path, metadata path, and {chunk ids}
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
     """
     logger.info("RECOMBINE_GEO")
     total_chunks = [chunks] if not isinstance(chunks, list) else chunks
@@ -369,7 +447,7 @@ def recombine_geographic_chunks(chunks, task_id=None):
     chunk_data = []
 
     for index, chunk in enumerate(total_chunks):
-        metadata = task.combine_metadata(metadata, chunk[1])
+        metadata = task.combine_metadata(metadata, task.get_chunk_metadata(chunk[1]))
         chunk_data.append(xr.open_dataset(chunk[0]))
 
     combined_data = combine_geographic_chunks(chunk_data)
@@ -390,12 +468,17 @@ def recombine_geographic_chunks(chunks, task_id=None):
                     animated_data.append(xr.open_dataset(path))
             path = os.path.join(task.get_temp_path(), "animation_{}.nc".format(base_index + index))
             if len(animated_data) > 0:
-                export_xarray_to_netcdf(combine_geographic_chunks(animated_data), path)
+                with trace_step("export") as span:
+                    export_xarray_to_netcdf(combine_geographic_chunks(animated_data), path)
+                    span.add_output(path)
 
     path = os.path.join(task.get_temp_path(), "recombined_geo_{}.nc".format(time_chunk_id))
-    export_xarray_to_netcdf(combined_data, path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(combined_data, path)
+        span.add_output(path)
     logger.info("Done combining geographic chunks for time: " + str(time_chunk_id))
-    return path, metadata, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
+    metadata_path = task.store_chunk_metadata(path, metadata)
+    return path, metadata_path, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
 
 
 @task(name="app_name.recombine_time_chunks", base=BaseTask)
@@ -407,10 +490,10 @@ def recombine_time_chunks(chunks, task_id=None):
     simply return the data again.
 
     Args:
-        chunks: list of the return from the processing_task function - path, metadata, and {chunk ids}
+        chunks: list of the return from the processing_task function - path, metadata path, and {chunk ids}
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
 
     """
     logger.info("RECOMBINE_TIME")
@@ -436,22 +519,25 @@ def recombine_time_chunks(chunks, task_id=None):
                     animated_data = xr.concat([animated_data], 'time')
                     animated_data['time'] = [0]
                     clear_mask = task.satellite.get_clean_mask_func()(animated_data)
-                    animated_data = task.get_processing_method()(animated_data,
-                                                                 clean_mask=clear_mask,
-                                                                 intermediate_product=combined_data,
-                                                                 no_data=task.satellite.no_data_value,
-                                                                 reverse_time=task.get_reverse_time())
+                    with trace_step("process"):
+                        animated_data = task.get_processing_method()(animated_data,
+                                                                     clean_mask=clear_mask,
+                                                                     intermediate_product=combined_data,
+                                                                     no_data=task.satellite.no_data_value,
+                                                                     reverse_time=task.get_reverse_time())
                 path = os.path.join(task.get_temp_path(), "animation_{}.png".format(base_index + index))
-                write_png_from_xr(
-                    path,
-                    animated_data,
-                    bands=[task.query_type.red, task.query_type.green, task.query_type.blue],
-                    scale=task.satellite.get_scale(),
-                    no_data=task.satellite.no_data_value)
+                with trace_step("write_png") as span:
+                    write_png_from_xr(
+                        path,
+                        animated_data,
+                        bands=[task.query_type.red, task.query_type.green, task.query_type.blue],
+                        scale=task.satellite.get_scale(),
+                        no_data=task.satellite.no_data_value)
+                    span.add_output(path)
 
     combined_data = None
     for index, chunk in enumerate(total_chunks):
-        metadata.update(chunk[1])
+        metadata.update(task.get_chunk_metadata(chunk[1]))
         data = xr.open_dataset(chunk[0])
         if combined_data is None:
             # TODO: If there is no animation, remove this.
@@ -463,24 +549,28 @@ def recombine_time_chunks(chunks, task_id=None):
         data = xr.concat([data], 'time')
         data['time'] = [0]
         clear_mask = task.satellite.get_clean_mask_func()(data)
-        combined_data = task.get_processing_method()(data,
-                                                     clean_mask=clear_mask,
-                                                     intermediate_product=combined_data,
-                                                     no_data=task.satellite.no_data_value,
-                                                     reverse_time=task.get_reverse_time())
+        with trace_step("process"):
+            combined_data = task.get_processing_method()(data,
+                                                         clean_mask=clear_mask,
+                                                         intermediate_product=combined_data,
+                                                         no_data=task.satellite.no_data_value,
+                                                         reverse_time=task.get_reverse_time())
         # if we're animating, combine it all and save to disk.
         # TODO: If there is no animation, remove this.
         if task.animated_product.animation_id != "none":
             generate_animation(index, combined_data)
 
     path = os.path.join(task.get_temp_path(), "recombined_time_{}.nc".format(geo_chunk_id))
-    export_xarray_to_netcdf(combined_data, path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(combined_data, path)
+        span.add_output(path)
     logger.info("Done combining time chunks for geo: " + str(geo_chunk_id))
-    return path, metadata, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
+    metadata_path = task.store_chunk_metadata(path, metadata)
+    return path, metadata_path, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
 
 
 @task(name="app_name.create_output_products", base=BaseTask)
-def create_output_products(data, task_id=None):
+def create_output_products(data, task_id=None, subset=False):
     """Create the final output products for this algorithm.
 
     Open the final dataset and metadata and generate all remaining metadata.
@@ -488,11 +578,12 @@ def create_output_products(data, task_id=None):
     Update status and exit.
 
     Args:
-        data: tuple in the format of processing_task function - path, metadata, and {chunk ids}
+        data: tuple in the format of processing_task function - path, metadata path, and {chunk ids}
+        subset: whether data was sliced from the result of a parent task - see slice_parent_result
 
     """
     logger.info("CREATE_OUTPUT")
-    full_metadata = data[1]
+    full_metadata = task.get_chunk_metadata(data[1])
     dataset = xr.open_dataset(data[0])
     task = AppNameTask.objects.get(pk=task_id)
 
@@ -505,6 +596,8 @@ def create_output_products(data, task_id=None):
                                        "animation.gif") if task.animated_product.animation_id != 'none' else ""
     task.final_metadata_from_dataset(dataset)
     task.metadata_from_dict(full_metadata)
+    if subset:
+        task.drop_acquisition_statistics()
 
     # TODO: Set the bands that should be written to the final products
     bands = task.satellite.get_measurements() + []
@@ -512,16 +605,23 @@ def create_output_products(data, task_id=None):
     # TODO: If you're creating pngs, specify the RGB bands
     png_bands = [task.query_type.red, task.query_type.green, task.query_type.blue]
 
-    export_xarray_to_netcdf(dataset, task.data_netcdf_path)
-    write_geotiff_from_xr(task.data_path, dataset.astype('int32'), bands=bands, no_data=task.satellite.no_data_value)
-    write_png_from_xr(
-        task.result_path,
-        dataset,
-        bands=png_bands,
-        png_filled_path=task.result_filled_path,
-        fill_color=task.query_type.fill,
-        scale=task.satellite.get_scale(),
-        no_data=task.satellite.no_data_value)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(dataset, task.data_netcdf_path)
+        span.add_output(task.data_netcdf_path)
+    with trace_step("export") as span:
+        write_geotiff_from_xr(
+            task.data_path, dataset.astype('int32'), bands=bands, no_data=task.satellite.no_data_value)
+        span.add_output(task.data_path)
+    with trace_step("write_png") as span:
+        write_png_from_xr(
+            task.result_path,
+            dataset,
+            bands=png_bands,
+            png_filled_path=task.result_filled_path,
+            fill_color=task.query_type.fill,
+            scale=task.satellite.get_scale(),
+            no_data=task.satellite.no_data_value)
+        span.add_output(task.result_path, task.result_filled_path)
 
     # TODO: if there is no animation, remove this. Otherwise, open each time iteration slice and write to disk.
     if task.animated_product.animation_id != "none":
@@ -538,15 +638,19 @@ def create_output_products(data, task_id=None):
     # TODO: if you're capturing more tabular metadata, plot it here by converting these to lists.
     # an example of this is the current water detection app.
     dates = list(map(lambda x: datetime.strptime(x, "%m/%d/%Y"), task._get_field_as_list('acquisition_list')))
-    if len(dates) > 1:
-        task.plot_path = os.path.join(task.get_result_path(), "plot_path.png")
-        create_2d_plot(
+    if len(dates) > 1 and not subset:
+        task.plot_path = os.path.join(task.get_result_path(), "plot_data.json")
+        write_2d_plot_data(
             task.plot_path,
             dates=dates,
             datasets=task._get_field_as_list('clean_pixel_percentages_per_acquisition'),
             data_labels="Clean Pixel Percentage (%)",
             titles="Clean Pixel Percentage Per Acquisition")
 
+    # keep the final dataset so the task can be subset without reprocessing.
+    if not task.preview:
+        task.store_intermediate(data[0], full_metadata)
+
     logger.info("All products created.")
     # task.update_bounds_from_dataset(dataset)
     task.complete = True
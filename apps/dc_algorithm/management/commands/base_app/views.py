@@ -32,13 +32,13 @@ from datetime import datetime, timedelta
 from apps.dc_algorithm.models import Satellite, Area, Application
 from apps.dc_algorithm.forms import DataSelectionForm
 from .forms import AdditionalOptionsForm
-from .tasks import run  # TODO: Is pixel drilling enabled? if so, import pixel_drill
+from .tasks import run, subset  # TODO: Is pixel drilling enabled? if so, import pixel_drill
 
 from collections import OrderedDict
 
-from apps.dc_algorithm.views import (ToolView, SubmitNewRequest, SubmitPixelDrillRequest, SubmitPixelDrillRequest,
-                                     GetTaskResult, SubmitNewSubsetRequest, CancelRequest, UserHistory, ResultList,
-                                     OutputList, RegionSelection, TaskDetails)
+from apps.dc_algorithm.views import (ToolView, SubmitNewRequest, EstimateTaskCost, SubmitPixelDrillRequest,
+                                     SubmitPixelDrillRequest, GetTaskResult, GetTaskPlotData, SubmitNewSubsetRequest,
+                                     CancelRequest, UserHistory, ResultList, OutputList, RegionSelection, TaskDetails)
 
 
 class RegionSelection(RegionSelection):
@@ -121,6 +121,19 @@ class SubmitNewRequest(SubmitNewRequest):
 #     form_list = [DataSelectionForm, AdditionalOptionsForm]
 
 
+class EstimateTaskCost(EstimateTaskCost):
+    """
+    Estimate task cost REST API Endpoint
+    Extends the EstimateTaskCost abstract class - required attributes are the tool_name,
+    task_model_name, and form_list
+
+    See the dc_algorithm.views docstrings for more information.
+    """
+    tool_name = 'app_name'
+    task_model_name = 'AppNameTask'
+    form_list = [DataSelectionForm, AdditionalOptionsForm]
+
+
 class GetTaskResult(GetTaskResult):
     """
     Get task result REST API endpoint
@@ -133,6 +146,18 @@ class GetTaskResult(GetTaskResult):
     task_model_name = 'AppNameTask'
 
 
+class GetTaskPlotData(GetTaskPlotData):
+    """
+    Get task plot data REST API endpoint
+    Extends the GetTaskPlotData abstract class, required attributes are the tool_name
+    and task_model_name
+
+    See the dc_algorithm.views docstrings for more information.
+    """
+    tool_name = 'app_name'
+    task_model_name = 'AppNameTask'
+
+
 class SubmitNewSubsetRequest(SubmitNewSubsetRequest):
     """
     Submit new subset request REST API endpoint
@@ -145,6 +170,7 @@ class SubmitNewSubsetRequest(SubmitNewSubsetRequest):
     task_model_name = 'AppNameTask'
 
     celery_task_func = run
+    subset_task_func = subset
 
     # TODO: Ensure that your task_model_update_func works as expected - does this app support
     # single requests?
@@ -0,0 +1,166 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.apps import apps
+
+import functools
+import importlib
+import json
+import shutil
+import subprocess
+import time
+import uuid
+from datetime import datetime
+
+from data_cube_ui.celery import app as celery_app
+from apps.dc_algorithm.models import Application
+from apps.dc_algorithm.benchmark import (SyntheticDataCube, SyntheticDataAccessApi, PipelineProfiler,
+                                         get_directory_size)
+from apps.dc_algorithm.tracing import get_peak_rss
+from apps.dc_algorithm.estimator import DEFAULT_RESOLUTION
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the processing pipeline of each app against a synthetic Landsat-like data cube. ' \
+           'The most recent task of each app is used as a template for its parameters - use loaddata to load ' \
+           'in some test cases before running this script. Results are written as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apps', nargs='*', help="App ids to benchmark, defaults to all apps.")
+        parser.add_argument('--size', type=int, default=500, help="Number of pixels along each axis.")
+        parser.add_argument('--acquisitions', type=int, default=20)
+        parser.add_argument('--cloud_fraction', type=float, default=0.2)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--mode',
+            choices=['eager', 'worker'],
+            default='eager',
+            help="Run the pipelines in this process or with a local worker using an in memory broker.")
+        parser.add_argument('--timeout', type=int, default=3600, help="Seconds to wait for each task in worker mode.")
+        parser.add_argument('--output', help="Path to write the JSON results to, defaults to stdout.")
+        parser.add_argument('--keep', action='store_true', help="Keep the benchmark tasks and their results.")
+
+    def handle(self, *args, **options):
+        _apps = Application.objects.all()
+        if options['apps']:
+            _apps = _apps.filter(pk__in=options['apps'])
+        if not _apps.exists():
+            raise CommandError("No matching apps.")
+
+        extent = options['size'] * DEFAULT_RESOLUTION
+        cube = SyntheticDataCube(
+            latitude=(0, extent),
+            longitude=(0, extent),
+            acquisitions=options['acquisitions'],
+            cloud_fraction=options['cloud_fraction'],
+            seed=options['seed'])
+
+        if options['mode'] == 'eager':
+            celery_app.conf.update(CELERY_ALWAYS_EAGER=True, CELERY_EAGER_PROPAGATES_EXCEPTIONS=False)
+            results = [self.benchmark_app(app, cube, options) for app in _apps]
+        else:
+            from celery.contrib.testing.worker import start_worker
+            celery_app.conf.update(
+                CELERY_ALWAYS_EAGER=False, BROKER_URL='memory://', CELERY_RESULT_BACKEND='cache+memory://')
+            with start_worker(celery_app, perform_ping_check=False):
+                results = [self.benchmark_app(app, cube, options) for app in _apps]
+
+        report = {
+            'commit': self.get_commit(),
+            'created': datetime.now().isoformat(),
+            'mode': options['mode'],
+            'cube': {
+                'shape': cube.shape,
+                'cloud_fraction': options['cloud_fraction'],
+                'seed': options['seed']
+            },
+            'results': results
+        }
+        output = json.dumps(report, indent=2, default=str)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+            self.stdout.write(self.style.SUCCESS("Wrote benchmark results to " + options['output']))
+        else:
+            self.stdout.write(output)
+
+    def benchmark_app(self, app, cube, options):
+        """Run the pipeline of a single app against the synthetic cube, returning its timings"""
+        camel_case = "".join(x.title() for x in app.pk.split('_'))
+        task_model = apps.get_model(".".join([app.pk, camel_case + "Task"]))
+        template = task_model.objects.filter(
+            pixel_drill_task=False, preview=False).order_by('-execution_start').first()
+        if template is None:
+            self.stderr.write("Skipping {} - there are no tasks to use as a template.".format(app.pk))
+            return {'app': app.pk, 'status': "SKIPPED", 'message': "There are no tasks to use as a template."}
+
+        self.stderr.write("Benchmarking " + app.pk)
+        task = self.create_benchmark_task(template, cube)
+        tasks_module = importlib.import_module("apps.{}.tasks".format(app.pk))
+        # every DataAccessApi in the app's tasks reads from the synthetic cube.
+        data_access_api = tasks_module.DataAccessApi
+        tasks_module.DataAccessApi = functools.partial(SyntheticDataAccessApi, cube=cube)
+        bytes_read = cube.bytes_read
+        start = time.perf_counter()
+        try:
+            with PipelineProfiler(task) as profiler:
+                tasks_module.run.delay(task_id=task.pk)
+                if options['mode'] == 'worker':
+                    self.wait_for_task(task, options['timeout'])
+        finally:
+            tasks_module.DataAccessApi = data_access_api
+        wall_seconds = time.perf_counter() - start
+
+        task.refresh_from_db()
+        stages = profiler.get_results()
+        result = {
+            'app': app.pk,
+            'task_id': task.pk,
+            'status': task.status,
+            'message': task.message,
+            'wall_seconds': wall_seconds,
+            'bytes_read': cube.bytes_read - bytes_read,
+            'bytes_written': get_directory_size(task.get_result_path()),
+            'peak_rss': get_peak_rss(),
+            'chunks': stages.get('processing_task', {}).get('count', 0),
+            'total_scenes': task.total_scenes,
+            'stages': stages
+        }
+
+        if not options['keep']:
+            shutil.rmtree(task.get_result_path(), ignore_errors=True)
+            shutil.rmtree(task.get_temp_path(), ignore_errors=True)
+            task.delete()
+        return result
+
+    def create_benchmark_task(self, template, cube):
+        """Copy a task model, replacing its extent and time range with those of the cube"""
+        task = type(template).objects.get(pk=template.pk)
+        task.pk = uuid.uuid4()
+        task._state.adding = True
+        task.title = "Benchmark {}".format(task.pk)
+        task.latitude_min, task.latitude_max = cube.latitude
+        task.longitude_min, task.longitude_max = cube.longitude
+        task.time_start, task.time_end = cube.dates[0].date(), cube.dates[-1].date()
+        task.complete = False
+        task.status = ""
+        task.message = ""
+        task.preview_task_id = None
+        task.intermediate_path = ""
+        task.save(force_insert=True)
+        return task
+
+    def wait_for_task(self, task, timeout):
+        start = time.time()
+        while time.time() - start < timeout:
+            task.refresh_from_db()
+            if task.complete or task.status in ['ERROR', 'CANCELLED']:
+                return
+            time.sleep(1)
+        self.stderr.write("Timed out waiting for task " + str(task.pk))
+
+    def get_commit(self):
+        try:
+            return subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR).decode('utf-8').strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,169 @@
+import logging
+
+from django.db.models import F
+
+import numpy as np
+
+from apps.data_cube_manager.models import DatasetType
+from .models import ChunkSplit
+from .estimator import get_bytes_per_pixel, get_pixel_count
+
+logger = logging.getLogger(__name__)
+
+# Fraction of the memory available on a worker host that a single chunk may use. Other worker processes on the
+# same host load their own chunks concurrently, so this should leave room for them.
+MEMORY_BUDGET_FRACTION = 0.5
+# Ratio of peak memory to the size of the loaded data - clean masks, float conversions, and compositor copies.
+MEMORY_OVERHEAD_FACTOR = 4
+# Chunks are not split below this many pixels, they are processed as is.
+MIN_CHUNK_PIXELS = 256 * 256
+# Number of recent splits used when planning the chunks of a new task.
+PLANNING_HISTORY = 10
+
+
+def get_available_memory():
+    """Get the memory available for new allocations on this host in bytes, None if it can't be determined"""
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    # values are in kilobytes.
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def get_memory_budget():
+    """Get the number of bytes that a single chunk may use on this worker, None if it can't be determined"""
+    available_memory = get_available_memory()
+    return int(available_memory * MEMORY_BUDGET_FRACTION) if available_memory is not None else None
+
+
+def get_acquisitions_per_load(task, acquisitions):
+    """Get the number of acquisitions that a chunk holds in memory at once - iterative tasks load one at a time"""
+    return min(acquisitions, 1) if task.get_iterative() else acquisitions
+
+
+def estimate_chunk_memory(task, geographic_chunk, acquisitions, parameters):
+    """Estimate the peak memory required to process a chunk
+
+    Uses the storage resolution and measurement dtypes of each product (or the requested resolution for previews)
+    and assumes that every requested measurement is loaded for every acquisition held in memory at once.
+
+    Args:
+        task: task model instance
+        geographic_chunk: dict with latitude and longitude (min, max) tuples
+        acquisitions: number of acquisitions in the chunk
+        parameters: load parameters of the chunk
+
+    Returns:
+        Tuple of (estimated bytes, pixel count), (None, None) if no products were found.
+
+    """
+    measurements = parameters.get('measurements', task.satellite.get_measurements())
+    dataset_types = DatasetType.objects.using('agdc').filter(name__in=task.satellite.get_products(task.area_id))
+    estimated_bytes, pixels = None, None
+    for dataset_type in dataset_types:
+        if 'resolution' in parameters:
+            product_pixels = int(
+                np.ceil((geographic_chunk['latitude'][1] - geographic_chunk['latitude'][0]) /
+                        abs(parameters['resolution'][0])) *
+                np.ceil((geographic_chunk['longitude'][1] - geographic_chunk['longitude'][0]) /
+                        abs(parameters['resolution'][1])))
+        else:
+            product_pixels = get_pixel_count(dataset_type, geographic_chunk['latitude'], geographic_chunk['longitude'])
+        product_bytes = product_pixels * get_acquisitions_per_load(task, acquisitions) * get_bytes_per_pixel(
+            dataset_type, measurements) * MEMORY_OVERHEAD_FACTOR
+        # stacked products are loaded one after another and then merged.
+        estimated_bytes = max(estimated_bytes or 0, product_bytes)
+        pixels = max(pixels or 0, product_pixels)
+    return estimated_bytes, pixels
+
+
+def get_geographic_chunk_area(geographic_chunk):
+    return (geographic_chunk['latitude'][1] - geographic_chunk['latitude'][0]) * (
+        geographic_chunk['longitude'][1] - geographic_chunk['longitude'][0])
+
+
+def split_geographic_chunk(geographic_chunk):
+    """Split a geographic chunk in half across its longer axis"""
+    latitude, longitude = geographic_chunk['latitude'], geographic_chunk['longitude']
+    if latitude[1] - latitude[0] >= longitude[1] - longitude[0]:
+        midpoint = (latitude[0] + latitude[1]) / 2
+        return [{'latitude': (latitude[0], midpoint), 'longitude': longitude},
+                {'latitude': (midpoint, latitude[1]), 'longitude': longitude}]
+    midpoint = (longitude[0] + longitude[1]) / 2
+    return [{'latitude': latitude, 'longitude': (longitude[0], midpoint)},
+            {'latitude': latitude, 'longitude': (midpoint, longitude[1])}]
+
+
+def split_chunk_over_memory_budget(task, geographic_chunk, time_chunk, parameters):
+    """Check the estimated footprint of a chunk against the worker's memory budget before any data is loaded
+
+    Chunks that are over budget are split geographically, the split is recorded for future planning, and the
+    task's scene total is increased as each half reports its own progress. Animated tasks are never split as
+    their per chunk animation products are keyed by chunk id.
+
+    Args:
+        task: task model instance
+        geographic_chunk: dict with latitude and longitude (min, max) tuples
+        time_chunk: list of acquisition dates in the chunk
+        parameters: load parameters of the chunk
+
+    Returns:
+        None if the chunk can be processed as is, otherwise a list of geographic chunks to process instead.
+
+    """
+    animated_product = getattr(task, 'animated_product', None)
+    if animated_product is not None and animated_product.animation_id != "none":
+        return None
+    memory_budget = get_memory_budget()
+    if memory_budget is None:
+        return None
+    estimated_bytes, pixels = estimate_chunk_memory(task, geographic_chunk, len(time_chunk), parameters)
+    if estimated_bytes is None or estimated_bytes <= memory_budget:
+        return None
+    if pixels < 2 * MIN_CHUNK_PIXELS:
+        logger.warning("Chunk of task {} is estimated to use {} bytes with a budget of {} but is too small to split.".
+                       format(task.pk, estimated_bytes, memory_budget))
+        return None
+
+    ChunkSplit.objects.create(
+        app_name=task._meta.app_label,
+        datacube_platform=task.satellite.datacube_platform,
+        area_id=task.area_id,
+        geographic_chunk_size=get_geographic_chunk_area(geographic_chunk),
+        acquisitions=get_acquisitions_per_load(task, len(time_chunk)),
+        estimated_bytes=estimated_bytes,
+        memory_budget=memory_budget)
+    task.total_scenes = F('total_scenes') + len(time_chunk)
+    task.save(update_fields=['total_scenes'])
+    logger.info("Splitting chunk of task {} - estimated {} bytes with a budget of {}.".format(
+        task.pk, estimated_bytes, memory_budget))
+    return split_geographic_chunk(geographic_chunk)
+
+
+def get_planned_geographic_chunk_size(task, chunk_size, dates):
+    """Reduce an app's geographic chunk size using the chunks that were split for similar tasks
+
+    The memory per square degree per acquisition and the memory budget of recent splits for the same app,
+    satellite, and area give the largest chunk area that fits on the workers.
+
+    Args:
+        task: task model instance
+        chunk_size: result of task.get_chunk_size()
+        dates: list of acquisition dates that will be chunked
+
+    Returns:
+        geographic chunk size in square degrees.
+
+    """
+    splits = ChunkSplit.objects.filter(
+        app_name=task._meta.app_label, datacube_platform=task.satellite.datacube_platform,
+        area_id=task.area_id)[:PLANNING_HISTORY]
+    if not splits or not dates:
+        return chunk_size['geographic']
+    acquisitions = get_acquisitions_per_load(task, min(chunk_size['time'] or len(dates), len(dates)))
+    planned_size = min(split.memory_budget / (split.get_bytes_per_unit() * acquisitions) for split in splits)
+    return min(chunk_size['geographic'], planned_size)
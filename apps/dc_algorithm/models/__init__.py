@@ -1,3 +1,5 @@
 from .abstract_base_models import (Query, Metadata, Result, GenericTask, ResultType, UserHistory, AnimationType,
                                    ToolInfo)
 from .application_models import (Application, ApplicationGroup, Area, Compositor, Satellite)
+from .tracing_models import TaskSpan
+from .planning_models import ChunkSplit
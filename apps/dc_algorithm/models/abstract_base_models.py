@@ -26,6 +26,15 @@ from django.conf import settings
 import datetime
 import uuid
 import os
+import xarray as xr
+
+from apps.dc_algorithm.utils import write_dataset_store, open_dataset_store
+from data_cube_ui import serialization
+
+
+def normalize_acquisition(acquisition):
+    """Get an acquisition datetime as a naive datetime with millisecond precision like the keys of task metadata"""
+    return acquisition.replace(tzinfo=None, microsecond=acquisition.microsecond - acquisition.microsecond % 1000)
 
 
 class Query(models.Model):
@@ -76,10 +85,18 @@ class Query(models.Model):
 
     pixel_drill_task = models.BooleanField(default=False)
 
+    # previews are low resolution copies of a task that are processed first so a provisional result is available.
+    preview = models.BooleanField(default=False)
+    preview_task_id = models.UUIDField(null=True, blank=True)
+
     #false by default, only change is false-> true
     complete = models.BooleanField(default=False)
 
     config_path = '/home/' + settings.LOCAL_USER + '/Datacube/data_cube_ui/config/.datacube.conf'
+    # max number of pixels along either axis of a preview.
+    preview_size = 1000
+    # chunk size along each axis of the stored intermediate product - see store_intermediate.
+    intermediate_chunk_size = 512
 
     class Meta:
         abstract = True
@@ -108,6 +125,63 @@ class Query(models.Model):
             pass
         return temp_dir
 
+    def get_chunk_details_path(self):
+        return os.path.join(self.get_temp_path(), "chunk_details.msgpack")
+
+    def store_chunk_details(self, chunk_details):
+        """Write the parameters and chunks of a task once so that processing messages only carry chunk ids
+
+        Args:
+            chunk_details: dict with parameters, geographic_chunks, and optionally time_chunks from the chunking task
+
+        """
+        with open(self.get_chunk_details_path(), 'wb') as chunk_details_file:
+            chunk_details_file.write(serialization.dumps(chunk_details))
+
+    def get_chunk_parameters(self, geo_chunk_id, time_chunk_id=None, geographic_chunk=None):
+        """Get the geographic chunk, time chunk, and load parameters of a chunk from the stored chunk details
+
+        Args:
+            geo_chunk_id, time_chunk_id: ids of the chunk - the indices of its geographic and time chunks
+            geographic_chunk: geographic chunk passed with the message, used instead of the stored chunk for
+                chunks that were split after chunking.
+
+        Returns:
+            Tuple of (geographic_chunk, time_chunk, parameters), time_chunk is None for apps without time chunks.
+
+        """
+        with open(self.get_chunk_details_path(), 'rb') as chunk_details_file:
+            chunk_details = serialization.loads(chunk_details_file.read())
+        if geographic_chunk is None:
+            geographic_chunk = chunk_details['geographic_chunks'][int(geo_chunk_id)]
+        time_chunks = chunk_details.get('time_chunks')
+        time_chunk = time_chunks[time_chunk_id] if time_chunks is not None and time_chunk_id is not None else None
+        return geographic_chunk, time_chunk, dict(chunk_details['parameters'])
+
+    def store_chunk_metadata(self, path, metadata):
+        """Write the metadata of a chunk alongside its data and get a reference to it for the chunk's result
+
+        Chunk results only carry the reference through the result backend, so chords over many chunks don't
+        fetch every chunk's per acquisition metadata from it.
+
+        Args:
+            path: path to the chunk's data - the metadata is written next to it
+            metadata: metadata dict of the chunk
+
+        Returns:
+            path to the metadata, to be passed to get_chunk_metadata by the recombination tasks.
+
+        """
+        metadata_path = os.path.splitext(path)[0] + "_metadata.msgpack"
+        with open(metadata_path, 'wb') as metadata_file:
+            metadata_file.write(serialization.dumps(metadata))
+        return metadata_path
+
+    def get_chunk_metadata(self, metadata_path):
+        """Read the metadata dict of a chunk written by store_chunk_metadata"""
+        with open(metadata_path, 'rb') as metadata_file:
+            return serialization.loads(metadata_file.read())
+
     def get_result_path(self):
         """Get the result directory for the task from base_result_dir and the pk"""
         if not self.base_result_dir:
@@ -126,6 +200,65 @@ class Query(models.Model):
         self.longitude_max = max(dataset.longitude)
         self.save()
 
+    def get_point_query_parameters(self):
+        """Get the kwargs required to load a pixel time series with dc_algorithm.utils.get_pixel_time_series
+
+        Used by pixel drilling tasks to load only the drilled pixel once its parameters are validated.
+
+        Returns:
+            Dict containing products, measurements, time, latitude, and longitude.
+
+        """
+        return {
+            'products': self.satellite.get_products(self.area_id),
+            'measurements': self.satellite.get_measurements(),
+            'time': (self.time_start, self.time_end),
+            'latitude': (self.latitude_min, self.latitude_max),
+            'longitude': (self.longitude_min, self.longitude_max)
+        }
+
+    def create_preview(self):
+        """Create a preview task - a copy of this task that is loaded at a reduced resolution
+
+        The preview is processed by the same pipeline as this task and is not added to any user history.
+        Its title is derived from this task's id to satisfy the unique together constraint.
+
+        Returns:
+            The saved preview task
+
+        """
+        preview = type(self).objects.get(pk=self.pk)
+        preview.pk = uuid.uuid4()
+        preview._state.adding = True
+        preview.title = "Preview of {}".format(self.pk)
+        preview.preview = True
+        preview.save(force_insert=True)
+        self.preview_task_id = preview.pk
+        self.save(update_fields=['preview_task_id'])
+        return preview
+
+    def get_preview(self):
+        """Get the preview task created by create_preview, None if there is no preview"""
+        if self.preview_task_id is None:
+            return None
+        return type(self).objects.filter(pk=self.preview_task_id).first()
+
+    def get_preview_load_parameters(self):
+        """Get the additional kwargs used to load data for a preview
+
+        Data is resampled to a resolution where neither axis exceeds preview_size pixels.
+
+        Returns:
+            Dict containing output_crs and resolution for previews, otherwise an empty dict.
+
+        """
+        if not self.preview:
+            return {}
+        from apps.dc_algorithm.estimator import DEFAULT_RESOLUTION
+        resolution = max((self.latitude_max - self.latitude_min) / self.preview_size,
+                         (self.longitude_max - self.longitude_min) / self.preview_size, DEFAULT_RESOLUTION)
+        return {'output_crs': 'EPSG:4326', 'resolution': (-resolution, resolution)}
+
     def get_chunk_size(self):
         """gets the required geographic and time chunk sizes
 
@@ -165,6 +298,88 @@ class Query(models.Model):
         #return self.compositor.id == "most_recent"
         raise NotImplementedError("You must define 'get_reverse_time' in the inheriting class.")
 
+    def get_extendable(self):
+        """Defines whether a completed task can be extended with newly ingested acquisitions
+
+        Extending a task folds only the new acquisitions into its stored intermediate product using the
+        processing method, so this should only return true for iterative algorithms whose apps store an
+        intermediate product in create_output_products and define an extend task.
+
+        Returns:
+            Boolean signifying whether the task can be extended.
+        """
+        #return self.compositor.is_iterative() and self.animated_product.animation_id == "none"
+        return False
+
+    def has_intermediate(self):
+        """Check that a task is complete, successful, and has a stored intermediate product"""
+        return self.complete and self.status == "OK" and not self.preview and bool(self.intermediate_path) and \
+            os.path.exists(self.intermediate_path)
+
+    def can_be_extended(self):
+        """Check that a task has a stored intermediate product and can be extended - see get_extendable"""
+        return self.has_intermediate() and self.get_extendable()
+
+    def is_subset_of(self, parent):
+        """Check whether this task can be created by slicing the stored intermediate product of a parent task
+
+        All unique fields other than the bounds, title, and description must match the parent - e.g. the time
+        range and compositor - and the bounds must fall within the parent's bounds. Animations are excluded as
+        their frames are not stored.
+
+        Args:
+            parent: completed task of the same model
+
+        Returns:
+            Boolean signifying whether this task is a spatial subset of the parent.
+        """
+        if not parent.has_intermediate() or self.pixel_drill_task:
+            return False
+        animated_product = getattr(self, 'animated_product', None)
+        if animated_product is not None and animated_product.animation_id != "none":
+            return False
+        excluded_fields = ['latitude_min', 'latitude_max', 'longitude_min', 'longitude_max', 'title', 'description']
+        for field in self._meta.unique_together[0]:
+            if field not in excluded_fields and getattr(self, field) != getattr(parent, field):
+                return False
+        return parent.latitude_min <= self.latitude_min and self.latitude_max <= parent.latitude_max and \
+            parent.longitude_min <= self.longitude_min and self.longitude_max <= parent.longitude_max
+
+    def store_intermediate(self, path, metadata):
+        """Keep the final intermediate product and its metadata dict in the result directory
+
+        The intermediate product is the dataset passed to create_output_products. It is written to a chunked and
+        compressed Zarr store so that windows of it can be read without loading the full dataset, e.g. to extend
+        the task with new acquisitions or to create subsets of the task without reprocessing.
+
+        Args:
+            path: path to the output of recombine_time_chunks
+            metadata: metadata dict returned by recombine_time_chunks
+
+        """
+        self.intermediate_path = os.path.join(self.get_result_path(), "intermediate.zarr")
+        with xr.open_dataset(path) as dataset:
+            write_dataset_store(dataset, self.intermediate_path, chunk_size=self.intermediate_chunk_size)
+        with open(self._get_intermediate_metadata_path(), 'wb') as metadata_file:
+            metadata_file.write(serialization.dumps(metadata))
+
+    def open_intermediate(self):
+        """Lazily open the stored intermediate product - only the chunks that are indexed are read"""
+        return open_dataset_store(self.intermediate_path)
+
+    def load_intermediate(self, path):
+        """Write the stored intermediate product to path as NetCDF, returning its metadata dict"""
+        self.open_intermediate().to_netcdf(path)
+        return self.get_intermediate_metadata()
+
+    def get_intermediate_metadata(self):
+        """Get the metadata dict stored alongside the intermediate product"""
+        with open(self._get_intermediate_metadata_path(), 'rb') as metadata_file:
+            return serialization.loads(metadata_file.read())
+
+    def _get_intermediate_metadata_path(self):
+        return os.path.splitext(self.intermediate_path)[0] + "_metadata.msgpack"
+
     def get_processing_method(self):
         """Map a keyword to a function used for data processing.
 
@@ -352,6 +567,54 @@ class Metadata(models.Model):
         """
         raise NotImplementedError("You must define 'metadata_from_dict' in the inheriting class.")
 
+    def drop_acquisition_statistics(self):
+        """Replace the per acquisition statistics with N/A, keeping the acquisition list
+
+        Used for tasks sliced from the result of a parent task - the per acquisition statistics of the parent
+        describe its full extent and can't be recomputed from its composited intermediate product.
+        """
+        placeholders = ",".join(["N/A"] * len(self._get_field_as_list('acquisition_list')))
+        for field_name in self.zipped_metadata_fields or []:
+            if field_name.endswith("_per_acquisition"):
+                setattr(self, field_name, placeholders)
+        self.save()
+
+    def get_unprocessed_acquisitions(self, acquisitions):
+        """Filter a list of acquisition datetimes to those that were not processed for this task
+
+        Used to find the acquisitions that were ingested after a task was processed. The processed acquisitions are
+        the datetime keys of the stored intermediate metadata rather than the acquisition list, as the list only has
+        the date of each acquisition and would drop additional acquisitions on a processed day.
+
+        Args:
+            acquisitions: list of datetimes e.g. from DataAccessApi.list_combined_acquisition_dates
+
+        Returns:
+            list of datetimes that have not been processed.
+        """
+
+        processed = set(normalize_acquisition(acquisition) for acquisition in self.get_intermediate_metadata())
+        return [acquisition for acquisition in acquisitions if normalize_acquisition(acquisition) not in processed]
+
+    def has_backfilled_acquisitions(self, acquisitions):
+        """Check whether any unprocessed acquisition predates the latest processed acquisition
+
+        Extensions recombine the new acquisitions after the stored intermediate product - or before it when
+        processing in reverse time - as if they were newer than every processed acquisition. Backfilled
+        acquisitions would be composited out of order, so tasks with any are processed again in full.
+
+        Args:
+            acquisitions: list of unprocessed datetimes - see get_unprocessed_acquisitions
+
+        Returns:
+            Boolean signifying whether the acquisitions can't be folded into the intermediate product.
+        """
+        processed = [normalize_acquisition(acquisition) for acquisition in self.get_intermediate_metadata()]
+        if len(processed) == 0:
+            return False
+        latest = max(processed)
+        return any(normalize_acquisition(acquisition) < latest for acquisition in acquisitions)
+
     def _get_field_as_list(self, field_name):
         """Convert comma seperated strings into lists
 
@@ -419,6 +682,8 @@ class Result(models.Model):
     total_scenes = models.IntegerField(default=0)
     #default display result.
     result_path = models.CharField(max_length=250, default="")
+    #chunked store of the final intermediate product used to extend or subset the result.
+    intermediate_path = models.CharField(max_length=250, default="")
 
     class Meta:
         abstract = True
@@ -0,0 +1,40 @@
+from django.db import models
+
+import datetime
+
+
+class ChunkSplit(models.Model):
+    """Records a processing chunk that was split because its estimated footprint exceeded a worker's memory budget
+
+    Splits are recorded by apps.dc_algorithm.memory.split_chunk_over_memory_budget and used when chunking future
+    tasks for the same app, satellite, and area so that their chunks fit in memory up front.
+
+    Attributes:
+        app_name: name of the app that the task belongs to, e.g. custom_mosaic_tool
+        datacube_platform, area_id: satellite platform and area of the task
+        geographic_chunk_size: area of the chunk that was split in square degrees
+        acquisitions: number of acquisitions loaded at once by the chunk
+        estimated_bytes: estimated peak memory of the chunk
+        memory_budget: memory available to the worker when the chunk was split
+        created: datetime of the split
+
+    """
+
+    app_name = models.CharField(max_length=50)
+    datacube_platform = models.CharField(max_length=50)
+    area_id = models.CharField(max_length=100)
+
+    geographic_chunk_size = models.FloatField()
+    acquisitions = models.IntegerField()
+    estimated_bytes = models.BigIntegerField()
+    memory_budget = models.BigIntegerField()
+
+    created = models.DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        ordering = ['-created']
+        index_together = (('app_name', 'datacube_platform', 'area_id'),)
+
+    def get_bytes_per_unit(self):
+        """Get the estimated bytes per square degree per acquisition of the split chunk"""
+        return self.estimated_bytes / max(self.geographic_chunk_size * self.acquisitions, 1e-12)
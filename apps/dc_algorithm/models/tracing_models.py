@@ -0,0 +1,49 @@
+from django.db import models
+
+
+class TaskSpan(models.Model):
+    """Timing for a single stage of a task's processing pipeline or a step within a stage
+
+    Spans are recorded by DCAlgorithmBase for every celery task that is called with a task_id kwarg - see
+    apps.dc_algorithm.tracing. Each stage (e.g. processing_task, recombine_geographic_chunks) produces a span with
+    an empty step name, and named steps within a stage (e.g. load, process, export) produce their own spans.
+    The spans of a task form its timeline.
+
+    Attributes:
+        app_name: name of the app that the task belongs to, e.g. custom_mosaic_tool
+        task_id: pk of the app's task model
+        celery_task_id: id of the celery task that ran the stage
+        stage: name of the celery task without the app prefix
+        step: name of the step within the stage, empty for the stage itself
+        chunk_id: geo and time chunk ids joined with an underscore for chunked stages
+        start: datetime that the span started
+        wall_seconds, cpu_seconds: elapsed wall clock and process cpu time
+        bytes_in, bytes_out: bytes loaded from the Data Cube and written to disk
+        process_peak_memory: peak resident set size of the worker process over its lifetime in bytes, sampled at
+            the end of the span. This is not the memory used by the span itself.
+        status: OK, ERROR if an exception was raised during the span, or IGNORED/RETRY if celery ignored or
+            retried the task e.g. when it was replaced.
+
+    """
+
+    app_name = models.CharField(max_length=50)
+    task_id = models.UUIDField()
+    celery_task_id = models.CharField(max_length=50, blank=True, default="")
+    stage = models.CharField(max_length=100)
+    step = models.CharField(max_length=100, blank=True, default="")
+    chunk_id = models.CharField(max_length=50, blank=True, default="")
+
+    start = models.DateTimeField()
+    wall_seconds = models.FloatField(default=0)
+    cpu_seconds = models.FloatField(default=0)
+    bytes_in = models.BigIntegerField(default=0)
+    bytes_out = models.BigIntegerField(default=0)
+    process_peak_memory = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=10, default="OK")
+
+    class Meta:
+        ordering = ['start']
+        index_together = (('app_name', 'task_id'),)
+
+    def __str__(self):
+        return "{}.{}{}".format(self.app_name, self.stage, ":" + self.step if self.step else "")
@@ -0,0 +1,178 @@
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+
+from .models import Application
+
+# Priority classes for the task_processing queue. The redis broker serves lower values first.
+# Interactive requests are pixel drills, previews are decimated passes over a full request.
+# Messages sent without a priority use the full class - see CELERY_DEFAULT_PRIORITY in settings.
+PRIORITY_CLASSES = {'interactive': 0, 'preview': 2, 'full': 4}
+# The redis broker supports priorities 0-9 - see BROKER_TRANSPORT_OPTIONS in settings.
+LOWEST_PRIORITY = 9
+
+# Fair-share weights keyed by username and app name. A user or app with a weight of 2 can have twice as many
+# active tasks as one with the default weight of 1 before its chunks are pushed back in the queue.
+USER_WEIGHTS = {}
+APP_WEIGHTS = {}
+DEFAULT_WEIGHT = 1
+# Number of active tasks in an app before its chunks drop a priority level.
+APP_TASKS_PER_PRIORITY_STEP = 5
+# Chunks of a single task drop a priority level every CHUNKS_PER_PRIORITY_STEP chunks, so the first chunks
+# of a newly submitted task are interleaved with the remaining chunks of large tasks rather than queued behind them.
+CHUNKS_PER_PRIORITY_STEP = 4
+
+# Admission control - once this many tasks are active across all apps, users that already have an active task
+# can not submit more until the load drops. A value of `None` indicates no limit.
+MAX_ACTIVE_TASKS = 20
+
+
+def get_active_tasks():
+    """Get all of the tasks across all apps that have been submitted but not completed
+
+    Pixel drilling tasks are excluded as they run on their own queue.
+
+    Returns:
+        Dict mapping app name to a queryset of active tasks.
+
+    """
+    active_tasks = {}
+    for app in Application.objects.all():
+        camel_case = "".join(x.title() for x in app.pk.split('_'))
+        task_model = apps.get_model(".".join([app.pk, camel_case + "Task"]))
+        active_tasks[app.pk] = task_model.objects.filter(
+            complete=False, pixel_drill_task=False).exclude(status__in=['ERROR', 'CANCELLED'])
+    return active_tasks
+
+
+def count_active_user_tasks(user_ids, active_tasks, exclude_task=None):
+    """Count the active tasks in the history of each user across all apps with a single query per app
+
+    Args:
+        user_ids: list of user ids
+        active_tasks: result of get_active_tasks
+        exclude_task: optional task model instance that is not counted, e.g. the task being prioritized
+
+    Returns:
+        Dict mapping each user id to its number of active tasks.
+
+    """
+    counts = {user_id: 0 for user_id in user_ids}
+    for app_name, queryset in active_tasks.items():
+        if exclude_task is not None and app_name == exclude_task._meta.app_label:
+            queryset = queryset.exclude(pk=exclude_task.pk)
+        history_model = apps.get_model(".".join([app_name, "UserHistory"]))
+        user_counts = history_model.objects.filter(
+            user_id__in=user_ids, task_id__in=queryset.values('pk')).values('user_id').annotate(
+                active_tasks=Count('task_id', distinct=True))
+        for user_count in user_counts:
+            counts[user_count['user_id']] += user_count['active_tasks']
+    return counts
+
+
+def get_user_weights(user_ids):
+    """Get the fair-share weight of each user id with a single query"""
+    usernames = dict(get_user_model().objects.filter(pk__in=user_ids).values_list('pk', 'username'))
+    return {user_id: USER_WEIGHTS.get(usernames.get(user_id), DEFAULT_WEIGHT) for user_id in user_ids}
+
+
+def admit(user_id, active_tasks=None):
+    """Admission controller for new task requests
+
+    Users without any active tasks are always admitted so that no one is starved. Otherwise, once
+    MAX_ACTIVE_TASKS are active system wide, further requests are rejected until the load drops.
+    Only requests that create a new task are checked - see SubmitNewRequest.post.
+
+    Args:
+        user_id: id of the user submitting the request
+        active_tasks: optional result of get_active_tasks
+
+    Returns:
+        Tuple of (admitted, message) where message describes why the request was rejected.
+
+    """
+    if MAX_ACTIVE_TASKS is None:
+        return True, None
+    active_tasks = active_tasks or get_active_tasks()
+    num_active_tasks = sum(queryset.count() for queryset in active_tasks.values())
+    if num_active_tasks < MAX_ACTIVE_TASKS:
+        return True, None
+    if count_active_user_tasks([user_id], active_tasks)[user_id] > 0:
+        return False, "The system is currently at capacity. Please wait for your active tasks to complete."
+    return True, None
+
+
+def get_task_priority(task, priority_class='full'):
+    """Get the base priority of a task from its priority class and the fair-share usage of its users and app
+
+    The priority is lowered by one level for each active task its least loaded user has per unit of weight,
+    and by one level for every APP_TASKS_PER_PRIORITY_STEP active tasks in its app per unit of weight.
+
+    Args:
+        task: task model instance
+        priority_class: key of PRIORITY_CLASSES
+
+    Returns:
+        integer priority, lower values are served first.
+
+    """
+    app_name = task._meta.app_label
+    active_tasks = get_active_tasks()
+    active_app_tasks = active_tasks[app_name].exclude(pk=task.pk).count() if app_name in active_tasks else 0
+    app_penalty = active_app_tasks // (APP_WEIGHTS.get(app_name, DEFAULT_WEIGHT) * APP_TASKS_PER_PRIORITY_STEP)
+
+    # tasks are shared by users that submit identical requests - use the least loaded user.
+    history_model = apps.get_model(".".join([app_name, "UserHistory"]))
+    user_ids = list(history_model.objects.filter(task_id=task.pk).values_list('user_id', flat=True).distinct())
+    active_user_tasks = count_active_user_tasks(user_ids, active_tasks, exclude_task=task)
+    user_weights = get_user_weights(user_ids)
+    user_penalty = min(
+        (int(active_user_tasks[user_id] / user_weights[user_id]) for user_id in user_ids), default=0)
+
+    return min(PRIORITY_CLASSES[priority_class] + app_penalty + user_penalty, LOWEST_PRIORITY)
+
+
+def get_chunk_priority(task_priority, chunk_index):
+    """Get the priority of a processing chunk, dropping a level every CHUNKS_PER_PRIORITY_STEP chunks"""
+    return min(task_priority + chunk_index // CHUNKS_PER_PRIORITY_STEP, LOWEST_PRIORITY)
+
+
+def _iter_signatures(signature):
+    """Iterate over the task signatures of a canvas (chains, groups, chords) in dispatch order"""
+    children = getattr(signature, 'tasks', None)
+    if children is None:
+        yield signature
+        return
+    for child in children:
+        yield from _iter_signatures(child)
+    body = getattr(signature, 'body', None)
+    if body is not None:
+        yield from _iter_signatures(body)
+
+
+def prioritize(canvas, task, priority_class=None):
+    """Set the priority of every task in a processing canvas
+
+    processing_task chunks are assigned priorities from get_chunk_priority in the order that they are defined
+    while all other tasks (recombination, output products) use the base task priority so that a task finishes
+    promptly once its chunks are complete.
+
+    Args:
+        canvas: celery canvas built in an app's start_chunk_processing
+        task: task model instance
+        priority_class: key of PRIORITY_CLASSES - defaults to preview for preview tasks, otherwise full.
+
+    Returns:
+        The canvas with updated options, ready for apply_async.
+
+    """
+    priority_class = priority_class or ('preview' if task.preview else 'full')
+    task_priority = get_task_priority(task, priority_class=priority_class)
+    chunk_index = 0
+    for signature in _iter_signatures(canvas):
+        if signature.task.endswith('.processing_task'):
+            signature.set(priority=get_chunk_priority(task_priority, chunk_index))
+            chunk_index += 1
+        else:
+            signature.set(priority=task_priority)
+    return canvas
@@ -4,15 +4,34 @@ from celery.decorators import periodic_task
 from celery.task.schedules import crontab
 from datetime import datetime, timedelta
 import shutil
+import os
+import xarray as xr
 from django.apps import apps
 
-from .models import Application
+from utils.data_cube_utilities.data_access_api import DataAccessApi
+from utils.data_cube_utilities.dc_chunker import combine_geographic_chunks
+from utils.data_cube_utilities.import_export import export_xarray_to_netcdf
+
+from .models import Application, TaskSpan
+from .tracing import trace_stage, get_chunk_id
 
 
 class DCAlgorithmBase(celery.Task):
     """Serves as a base class for all DC algorithm celery tasks"""
     app_name = None
 
+    def __call__(self, *args, **kwargs):
+        """Trace the task as a pipeline stage of the task model identified by the 'task_id' kwarg"""
+        if kwargs.get('task_id') is None:
+            return super(DCAlgorithmBase, self).__call__(*args, **kwargs)
+        with trace_stage(
+                self._get_app_name(),
+                self.name.split('.')[-1],
+                kwargs.get('task_id'),
+                chunk_id=get_chunk_id(kwargs),
+                celery_task_id=self.request.id):
+            return super(DCAlgorithmBase, self).__call__(*args, **kwargs)
+
     def on_failure(self, exc, task_id, args, kwargs, einfo):
         """Onfailure call for celery tasks
 
@@ -28,6 +47,10 @@ class DCAlgorithmBase(celery.Task):
         try:
             task = task_model.objects.get(pk=task_id)
             if task.complete:
+                # a failed extension leaves the previous result in place.
+                if task.status == "WAIT":
+                    task.update_status("OK", "The result could not be extended with new acquisitions.")
+                    task_clean_up.s(task_id=task_id, task_model=task_model_name).apply_async()
                 return
             task.complete = True
             task.update_status("ERROR", "There was an unhandled exception during the processing of your task.")
@@ -87,12 +110,94 @@ def clear_cache():
         tasks = task_model.objects.filter(execution_start__lt=time_threshold)
         for task in tasks:
             history_model.objects.filter(task_id=task.pk).delete()
+            TaskSpan.objects.filter(app_name=app.pk, task_id=task.pk).delete()
             shutil.rmtree(task.get_result_path())
             task.delete()
     print("Cache Cleared.")
 
 
-@task(name="dc_algorithm.task_clean_up")
+@task(name="dc_algorithm.extend_tasks", ignore_result=True)
+def extend_tasks(products=None):
+    """Extend completed tasks with acquisitions that were ingested after they were processed
+
+    Queues the app's extend task for every task that can be extended, loads data from one of the products, and
+    has acquisitions in its bounds that it hasn't processed - see Query.get_unprocessed_acquisitions.
+    Apps without an extend task never store an intermediate product, so none of their tasks are queued.
+
+    Args:
+        products: list of product names with new datasets - all products if None.
+    """
+    dcs = {}
+    try:
+        for app in Application.objects.all():
+            camel_case = "".join(x.title() for x in app.pk.split('_'))
+            task_model = apps.get_model(".".join([app.pk, camel_case + "Task"]))
+            tasks = task_model.objects.filter(
+                complete=True, status="OK", preview=False, pixel_drill_task=False).exclude(intermediate_path="")
+            for task in tasks:
+                task_products = task.satellite.get_products(task.area_id)
+                if products is not None and not set(task_products) & set(products):
+                    continue
+                if not task.can_be_extended():
+                    continue
+                if task.config_path not in dcs:
+                    dcs[task.config_path] = DataAccessApi(config=task.config_path)
+                acquisitions = dcs[task.config_path].list_combined_acquisition_dates(
+                    products=task_products,
+                    platforms=task.satellite.get_platforms(),
+                    time=(task.time_start, task.time_end),
+                    longitude=(task.longitude_min, task.longitude_max),
+                    latitude=(task.latitude_min, task.latitude_max))
+                if len(task.get_unprocessed_acquisitions(acquisitions)) > 0:
+                    celery.current_app.send_task("{}.extend".format(app.pk), kwargs={'task_id': task.pk})
+    finally:
+        for dc in dcs.values():
+            dc.close()
+
+
+@task(name="dc_algorithm.combine_split_chunks", acks_late=True)
+def combine_split_chunks(chunks, task_id=None, app_name=None, geo_chunk_id=None, time_chunk_id=None):
+    """Combine the results of a processing chunk that was split by apps.dc_algorithm.memory
+
+    The products of each part are combined geographically and written under the original chunk id, so the
+    recombination tasks receive a single result for the chunk just as if it was never split.
+
+    Args:
+        chunks: list of processing_task results for the parts - paths, metadata path, and {chunk ids}
+        task_id: pk of the app's task model
+        app_name: name of the app, e.g. custom_mosaic_tool
+        geo_chunk_id, time_chunk_id: ids of the chunk that was split
+
+    Returns:
+        result in the format of the app's processing_task for the original chunk, None if no part had data.
+    """
+    camel_case = "".join(x.title() for x in app_name.split('_'))
+    task_model = apps.get_model(".".join([app_name, camel_case + "Task"]))
+    task = task_model.objects.get(pk=task_id)
+
+    chunks = chunks if isinstance(chunks, list) else [chunks]
+    chunks = [chunk for chunk in chunks if chunk is not None]
+    if len(chunks) == 0:
+        return None
+
+    chunk_id = get_chunk_id({'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id})
+    part_chunk_id = get_chunk_id(chunks[0][-1])
+    metadata = {}
+    for chunk in chunks:
+        metadata = task.combine_metadata(metadata, task.get_chunk_metadata(chunk[-2]))
+
+    paths = []
+    # all but the last two items of a result are paths to products.
+    for index in range(len(chunks[0]) - 2):
+        part_path = chunks[0][index]
+        path = os.path.join(os.path.dirname(part_path), os.path.basename(part_path).replace(part_chunk_id, chunk_id, 1))
+        export_xarray_to_netcdf(combine_geographic_chunks([xr.open_dataset(chunk[index]) for chunk in chunks]), path)
+        paths.append(path)
+    metadata_path = task.store_chunk_metadata(paths[0], metadata)
+    return tuple(paths) + (metadata_path, dict(chunks[0][-1], geo_chunk_id=geo_chunk_id))
+
+
+@task(name="dc_algorithm.task_clean_up", ignore_result=True)
 def task_clean_up(*args, **kwargs):
     """
     Cleans up after tasks. By default, this involves removing a temporary directory,
@@ -0,0 +1,345 @@
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from unittest import mock
+import uuid
+
+from django.test import SimpleTestCase
+import numpy as np
+
+from data_cube_ui import serialization
+from apps.custom_mosaic_tool.models import CustomMosaicToolTask
+from apps.dc_algorithm import estimator, memory, scheduler, tasks
+from apps.dc_algorithm.models import ChunkSplit
+
+
+class SerializationTestCase(SimpleTestCase):
+    """Round trip the values passed between pipeline stages through data_cube_ui.serialization"""
+
+    def round_trip(self, obj):
+        return serialization.loads(serialization.dumps(obj))
+
+    def test_tuples(self):
+        chunk = ("/datacube/ui_results_temp/geo_0_time_0.nc", "/datacube/ui_results_temp/geo_0_time_0_metadata.msgpack",
+                 {'geo_chunk_id': 0, 'time_chunk_id': 1})
+        result = self.round_trip(chunk)
+        self.assertIsInstance(result, tuple)
+        self.assertEqual(result, chunk)
+        self.assertEqual(self.round_trip({'latitude': (-1.5, 1.5)})['latitude'], (-1.5, 1.5))
+
+    def test_datetime_keys(self):
+        metadata = {
+            datetime(2017, 1, 2, 10, 30, 15, 123000): {'clean_pixels': 10, 'satellite': "LANDSAT_7"},
+            datetime(2017, 1, 2, 10, 31, tzinfo=timezone.utc): {'clean_pixels': 5, 'satellite': "LANDSAT_8"},
+            date(2017, 1, 3): {'clean_pixels': 0, 'satellite': "NODATA"},
+        }
+        result = self.round_trip(metadata)
+        self.assertEqual(result, metadata)
+        self.assertEqual(
+            [key.tzinfo for key in result if isinstance(key, datetime)],
+            [key.tzinfo for key in metadata if isinstance(key, datetime)])
+
+    def test_other_types(self):
+        values = [uuid.uuid4(), timedelta(days=1, microseconds=5), {1, 2, 3}]
+        self.assertEqual(self.round_trip(values), values)
+
+    def test_numpy_scalars(self):
+        for value in [np.int16(-9999), np.int64(2**40), np.float32(0.5), np.float64(1e-10), np.bool_(True)]:
+            result = self.round_trip(value)
+            self.assertEqual(result.dtype, value.dtype)
+            self.assertEqual(result, value)
+
+    def test_numpy_arrays(self):
+        arrays = [
+            np.arange(12, dtype=np.int16).reshape(3, 4),
+            np.array([[0.5, np.nan], [np.inf, -1.0]], dtype=np.float32),
+            np.array(['2017-01-02T10:30:15.123'], dtype='datetime64[ms]'),
+            np.zeros((0, 3), dtype=np.uint8),
+        ]
+        for array in arrays:
+            result = self.round_trip(array)
+            self.assertEqual(result.dtype, array.dtype)
+            self.assertEqual(result.shape, array.shape)
+            np.testing.assert_array_equal(result, array)
+            self.assertTrue(result.flags.writeable)
+
+    def test_ordered_dict(self):
+        # OrderedDict is packed as a plain dict by the builtin fallback in _default, keeping its order.
+        ordered = OrderedDict([('time', 2), ('latitude', 1), ('longitude', 0)])
+        result = self.round_trip(ordered)
+        self.assertEqual(type(result), dict)
+        self.assertEqual(list(result.items()), list(ordered.items()))
+
+
+class ExtensionAcquisitionsTestCase(SimpleTestCase):
+    """Find the acquisitions that a completed task can be extended with - see Query.get_unprocessed_acquisitions"""
+
+    processed = [datetime(2017, 1, 2, 10, 30, 15, 123000), datetime(2017, 3, 4, 10, 30, 15, 456000)]
+
+    def setUp(self):
+        self.task = CustomMosaicToolTask()
+        patcher = mock.patch.object(
+            self.task, 'get_intermediate_metadata', return_value={acquisition: {} for acquisition in self.processed})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unprocessed_acquisitions(self):
+        acquisitions = [
+            datetime(2017, 1, 2, 10, 30, 15, 123456),
+            datetime(2017, 3, 4, 10, 30, 15, 456000, tzinfo=timezone.utc),
+            datetime(2017, 3, 4, 11, 0),
+            datetime(2017, 5, 6, 10, 30),
+        ]
+        self.assertEqual(self.task.get_unprocessed_acquisitions(acquisitions), acquisitions[2:])
+
+    def test_new_acquisitions_are_not_backfilled(self):
+        self.assertFalse(self.task.has_backfilled_acquisitions([datetime(2017, 3, 4, 11, 0), datetime(2017, 5, 6)]))
+
+    def test_backfilled_acquisitions(self):
+        # acquisitions ingested late that are older than the latest processed acquisition require a full run.
+        self.assertTrue(self.task.has_backfilled_acquisitions([datetime(2017, 2, 1), datetime(2017, 5, 6)]))
+        self.assertTrue(self.task.has_backfilled_acquisitions([datetime(2016, 12, 31)]))
+
+
+class MemoryTestCase(SimpleTestCase):
+    """Split chunks that don't fit in a worker's memory budget and plan chunk sizes from past splits"""
+
+    geographic_chunk = {'latitude': (0.0, 1.0), 'longitude': (10.0, 10.5)}
+
+    def setUp(self):
+        self.task = mock.Mock(pk=1, area_id="colombia", animated_product=None)
+        self.task._meta.app_label = "custom_mosaic_tool"
+        self.task.satellite.datacube_platform = "LANDSAT_7"
+        self.task.get_iterative.return_value = False
+
+    def test_split_geographic_chunk(self):
+        self.assertEqual(
+            memory.split_geographic_chunk(self.geographic_chunk), [{
+                'latitude': (0.0, 0.5),
+                'longitude': (10.0, 10.5)
+            }, {
+                'latitude': (0.5, 1.0),
+                'longitude': (10.0, 10.5)
+            }])
+        self.assertEqual(
+            memory.split_geographic_chunk({
+                'latitude': (0.0, 0.5),
+                'longitude': (10.0, 11.0)
+            }), [{
+                'latitude': (0.0, 0.5),
+                'longitude': (10.0, 10.5)
+            }, {
+                'latitude': (0.0, 0.5),
+                'longitude': (10.5, 11.0)
+            }])
+
+    def split_chunk(self, estimated_bytes, pixels, memory_budget=1024):
+        with mock.patch.object(memory, 'get_memory_budget', return_value=memory_budget), \
+                mock.patch.object(memory, 'estimate_chunk_memory', return_value=(estimated_bytes, pixels)), \
+                mock.patch.object(memory, 'ChunkSplit') as chunk_split:
+            geographic_chunks = memory.split_chunk_over_memory_budget(
+                self.task, self.geographic_chunk, [datetime(2017, 1, 2), datetime(2017, 1, 18)], {})
+        return geographic_chunks, chunk_split.objects.create
+
+    def test_chunk_within_budget(self):
+        geographic_chunks, create_split = self.split_chunk(512, 4 * memory.MIN_CHUNK_PIXELS)
+        self.assertIsNone(geographic_chunks)
+        create_split.assert_not_called()
+
+    def test_chunk_over_budget(self):
+        geographic_chunks, create_split = self.split_chunk(2048, 2 * memory.MIN_CHUNK_PIXELS)
+        self.assertEqual(geographic_chunks, memory.split_geographic_chunk(self.geographic_chunk))
+        create_split.assert_called_once_with(
+            app_name="custom_mosaic_tool",
+            datacube_platform="LANDSAT_7",
+            area_id="colombia",
+            geographic_chunk_size=0.5,
+            acquisitions=2,
+            estimated_bytes=2048,
+            memory_budget=1024)
+        self.task.save.assert_called_once_with(update_fields=['total_scenes'])
+
+    def test_min_chunk_pixels(self):
+        # each half of the chunk would be smaller than MIN_CHUNK_PIXELS, so it is processed as is.
+        geographic_chunks, create_split = self.split_chunk(2048, 2 * memory.MIN_CHUNK_PIXELS - 1)
+        self.assertIsNone(geographic_chunks)
+        create_split.assert_not_called()
+
+    def test_animated_chunks_are_not_split(self):
+        self.task.animated_product = mock.Mock(animation_id="scene")
+        geographic_chunks, create_split = self.split_chunk(2048, 2 * memory.MIN_CHUNK_PIXELS)
+        self.assertIsNone(geographic_chunks)
+        create_split.assert_not_called()
+
+    def get_planned_size(self, splits, chunk_size, dates):
+        with mock.patch.object(memory, 'ChunkSplit') as chunk_split:
+            chunk_split.objects.filter.return_value = splits
+            return memory.get_planned_geographic_chunk_size(self.task, chunk_size, dates)
+
+    def test_planned_geographic_chunk_size(self):
+        dates = [datetime(2017, 1, 2) + timedelta(days=16 * index) for index in range(10)]
+        chunk_size = {'geographic': 0.5, 'time': 5}
+        # 20000 bytes per square degree per acquisition.
+        splits = [
+            ChunkSplit(geographic_chunk_size=0.01, acquisitions=5, estimated_bytes=1000, memory_budget=5000),
+            ChunkSplit(geographic_chunk_size=0.02, acquisitions=5, estimated_bytes=2000, memory_budget=8000)
+        ]
+        self.assertEqual(self.get_planned_size([], chunk_size, dates), 0.5)
+        self.assertEqual(self.get_planned_size(splits, chunk_size, []), 0.5)
+        # the smallest budget of five acquisitions loaded at once.
+        self.assertAlmostEqual(self.get_planned_size(splits, chunk_size, dates), 0.05)
+        self.assertAlmostEqual(self.get_planned_size(splits, {'geographic': 0.5, 'time': 2}, dates), 0.125)
+        # iterative tasks load a single acquisition at a time.
+        self.task.get_iterative.return_value = True
+        self.assertAlmostEqual(self.get_planned_size(splits, chunk_size, dates), 0.25)
+
+    def test_combine_split_chunks(self):
+        task = mock.Mock()
+        task.combine_metadata.side_effect = lambda metadata, chunk_metadata: dict(metadata, **chunk_metadata)
+        task.get_chunk_metadata.side_effect = lambda metadata_path: {metadata_path: {}}
+        task.store_chunk_metadata.return_value = "/datacube/ui_results_temp/3.0_1/3_1_metadata.msgpack"
+        chunks = [("/datacube/ui_results_temp/3.0_1/3.{}_1.nc".format(index),
+                   "/datacube/ui_results_temp/3.0_1/3.{}_1_metadata.msgpack".format(index), {
+                       'geo_chunk_id': "3.{}".format(index),
+                       'time_chunk_id': 1
+                   }) for index in range(2)]
+        with mock.patch.object(tasks.apps, 'get_model') as get_model, \
+                mock.patch.object(tasks.xr, 'open_dataset'), \
+                mock.patch.object(tasks, 'combine_geographic_chunks'), \
+                mock.patch.object(tasks, 'export_xarray_to_netcdf') as export:
+            get_model.return_value.objects.get.return_value = task
+            result = tasks.combine_split_chunks.run(
+                chunks + [None], task_id=1, app_name="custom_mosaic_tool", geo_chunk_id=3, time_chunk_id=1)
+
+        # only the file name is rewritten to the original chunk id.
+        path = "/datacube/ui_results_temp/3.0_1/3_1.nc"
+        self.assertEqual(export.call_args[0][1], path)
+        self.assertEqual(result, (path, "/datacube/ui_results_temp/3.0_1/3_1_metadata.msgpack", {
+            'geo_chunk_id': 3,
+            'time_chunk_id': 1
+        }))
+        task.store_chunk_metadata.assert_called_once_with(path, {chunk[1]: {} for chunk in chunks})
+
+
+class SchedulerTestCase(SimpleTestCase):
+    """Prioritize tasks by their priority class and the fair-share usage of their users and app"""
+
+    def setUp(self):
+        self.task = CustomMosaicToolTask(pk=uuid.uuid4())
+
+    def get_task_priority(self, active_app_tasks, active_user_tasks, user_weights=None, priority_class='full'):
+        active_tasks = {'custom_mosaic_tool': mock.Mock()}
+        active_tasks['custom_mosaic_tool'].exclude.return_value.count.return_value = active_app_tasks
+        with mock.patch.object(scheduler, 'get_active_tasks', return_value=active_tasks), \
+                mock.patch.object(scheduler.apps, 'get_model') as get_model, \
+                mock.patch.object(scheduler, 'count_active_user_tasks', return_value=active_user_tasks), \
+                mock.patch.object(scheduler, 'get_user_weights',
+                                  return_value=user_weights or {user_id: 1 for user_id in active_user_tasks}):
+            get_model.return_value.objects.filter.return_value.values_list.return_value.distinct.return_value = list(
+                active_user_tasks)
+            return scheduler.get_task_priority(self.task, priority_class=priority_class)
+
+    def test_task_priority(self):
+        self.assertEqual(self.get_task_priority(0, {}), scheduler.PRIORITY_CLASSES['full'])
+        self.assertEqual(self.get_task_priority(0, {1: 0}, priority_class='interactive'), 0)
+        # a level for every APP_TASKS_PER_PRIORITY_STEP active tasks in the app and every active task of the
+        # least loaded user.
+        self.assertEqual(self.get_task_priority(scheduler.APP_TASKS_PER_PRIORITY_STEP, {1: 3, 2: 1}), 6)
+        self.assertEqual(self.get_task_priority(0, {1: 3, 2: 1}, priority_class='preview'), 3)
+
+    def test_task_priority_weights(self):
+        self.assertEqual(self.get_task_priority(0, {1: 2}, user_weights={1: 2}), 5)
+        with mock.patch.dict(scheduler.APP_WEIGHTS, {'custom_mosaic_tool': 2}):
+            self.assertEqual(self.get_task_priority(scheduler.APP_TASKS_PER_PRIORITY_STEP, {}), 4)
+
+    def test_lowest_priority(self):
+        self.assertEqual(self.get_task_priority(100, {1: 100}), scheduler.LOWEST_PRIORITY)
+        self.assertEqual(scheduler.get_chunk_priority(4, 3), 4)
+        self.assertEqual(scheduler.get_chunk_priority(4, 4), 5)
+        self.assertEqual(scheduler.get_chunk_priority(8, 100), scheduler.LOWEST_PRIORITY)
+
+    def admit(self, num_active_tasks, active_user_tasks):
+        active_tasks = {'custom_mosaic_tool': mock.Mock(), 'slip': mock.Mock()}
+        active_tasks['custom_mosaic_tool'].count.return_value = num_active_tasks
+        active_tasks['slip'].count.return_value = 0
+        with mock.patch.object(scheduler, 'count_active_user_tasks', return_value={1: active_user_tasks}):
+            return scheduler.admit(1, active_tasks=active_tasks)
+
+    def test_admit(self):
+        self.assertEqual(self.admit(scheduler.MAX_ACTIVE_TASKS - 1, 1), (True, None))
+        # users without active tasks are admitted at capacity so that no one is starved.
+        self.assertEqual(self.admit(scheduler.MAX_ACTIVE_TASKS, 0), (True, None))
+        admitted, message = self.admit(scheduler.MAX_ACTIVE_TASKS, 1)
+        self.assertFalse(admitted)
+        self.assertIsNotNone(message)
+        with mock.patch.object(scheduler, 'MAX_ACTIVE_TASKS', None):
+            self.assertEqual(self.admit(100, 1), (True, None))
+
+
+class EstimatorTestCase(SimpleTestCase):
+    """Estimate the resources required by a request from the Data Cube index"""
+
+    def setUp(self):
+        self.dataset_type = mock.Mock(
+            definition={
+                'storage': {
+                    'resolution': {
+                        'latitude': -0.25,
+                        'longitude': 0.25
+                    }
+                },
+                'measurements': [{
+                    'name': "red",
+                    'dtype': "int16"
+                }, {
+                    'name': "nir",
+                    'dtype': "int16"
+                }, {
+                    'name': "pixel_qa",
+                    'dtype': "uint16"
+                }, {
+                    'name': "cloud_mask",
+                    'dtype': "uint8"
+                }]
+            })
+        self.satellite = mock.Mock()
+        self.satellite.get_measurements.return_value = ["red", "nir", "cloud_mask"]
+
+    def test_pixels_and_bytes(self):
+        self.assertEqual(estimator.get_pixel_count(self.dataset_type, (0, 1), (0, 2)), 32)
+        self.assertEqual(estimator.get_bytes_per_pixel(self.dataset_type, ["red", "nir", "cloud_mask"]), 5)
+
+    def estimate(self, compositor=None, active_tasks=3):
+        active_app_tasks = mock.Mock()
+        active_app_tasks.count.return_value = active_tasks
+        with mock.patch.object(estimator, 'DatasetType') as dataset_type, \
+                mock.patch.object(estimator, 'count_acquisitions', return_value=10), \
+                mock.patch.object(estimator.scheduler, 'get_active_tasks',
+                                  return_value={'custom_mosaic_tool': active_app_tasks}), \
+                mock.patch.object(estimator, 'CPU_SECONDS_PER_MILLION_PIXELS', 1e6), \
+                mock.patch.object(estimator, 'WORKER_CONCURRENCY', 10):
+            dataset_type.objects.using.return_value.filter.return_value = [self.dataset_type]
+            return estimator.estimate_task_cost(
+                self.satellite, "colombia", (0, 1), (0, 2), (date(2017, 1, 1), date(2017, 12, 31)),
+                compositor=compositor)
+
+    def test_estimate(self):
+        estimate = self.estimate()
+        self.assertEqual(estimate['acquisitions'], 10)
+        self.assertEqual(estimate['pixels'], 32)
+        self.assertEqual(estimate['bytes'], 32 * 10 * 5)
+        self.assertEqual(estimate['cpu_seconds'], 320)
+        # the workers are shared evenly with the 3 active tasks.
+        self.assertEqual(estimate['wall_time'], 128)
+        self.assertEqual(estimate['active_tasks'], 3)
+        self.assertEqual(estimate['recommendation'], 'run')
+        self.assertEqual(self.estimate(compositor='geo_median')['cpu_seconds'], 320 * 20)
+
+    def test_recommendation(self):
+        with mock.patch.object(estimator, 'LARGE_TASK_WALL_TIME', 100):
+            self.assertEqual(self.estimate()['recommendation'], 'confirm')
+        with mock.patch.object(estimator, 'MAX_ESTIMATED_CPU_SECONDS', 300):
+            estimate = self.estimate()
+            self.assertEqual(estimate['recommendation'], 'reject')
+            self.assertIsNotNone(estimate['message'])
+        with mock.patch.object(estimator, 'MAX_ESTIMATED_BYTES', 1000):
+            self.assertEqual(self.estimate()['recommendation'], 'reject')
@@ -0,0 +1,225 @@
+import os
+import time
+import logging
+import resource
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from celery.exceptions import Ignore, Retry
+from django.db import DatabaseError
+from django.db.models import Case, Count, IntegerField, Max, Sum, When
+
+from .models import TaskSpan
+
+logger = logging.getLogger(__name__)
+
+# stages that are being traced in this thread - eager execution nests stages within each other.
+_local = threading.local()
+
+
+def get_peak_rss():
+    """Get the peak resident set size of this process in bytes"""
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Span:
+    """Timing and io counters for a stage or a step within a stage
+
+    Steps add to the counters while they are open, e.g.:
+        with trace_step("load") as span:
+            data = dc.get_dataset_by_extent(**parameters)
+            span.add_input(data)
+
+    """
+
+    def __init__(self, stage, step=""):
+        self.stage = stage
+        self.step = step
+        self.start = datetime.now()
+        self.wall_seconds = 0
+        self.cpu_seconds = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # ru_maxrss can't be reset, so this is the peak of the worker process up to the end of the span.
+        self.process_peak_memory = 0
+        self.status = "OK"
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    def add_input(self, dataset):
+        """Add the in memory size of a loaded dataset to bytes_in"""
+        if dataset is not None:
+            self.bytes_in += int(dataset.nbytes)
+
+    def add_output(self, *paths):
+        """Add the size of written files to bytes_out"""
+        for path in paths:
+            if path and os.path.isfile(path):
+                self.bytes_out += os.path.getsize(path)
+
+    def finish(self, status="OK"):
+        self.wall_seconds = time.perf_counter() - self._wall_start
+        self.cpu_seconds = time.process_time() - self._cpu_start
+        self.process_peak_memory = get_peak_rss()
+        self.status = status
+
+
+def get_exception_status(exception):
+    """Get the span status for an exception - celery raises Ignore and Retry for tasks that didn't fail"""
+    if isinstance(exception, Ignore):
+        return "IGNORED"
+    if isinstance(exception, Retry):
+        return "RETRY"
+    return "ERROR"
+
+
+def _get_stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def get_chunk_id(kwargs):
+    """Get a chunk id in the format used for chunk file names from the kwargs of a celery task"""
+    return "_".join(str(kwargs[key]) for key in ['geo_chunk_id', 'time_chunk_id'] if kwargs.get(key) is not None)
+
+
+@contextmanager
+def trace_stage(app_name, stage, task_id, chunk_id="", celery_task_id=None):
+    """Trace a pipeline stage, saving its span and the spans of its steps as TaskSpans when it finishes
+
+    Used by DCAlgorithmBase to wrap every celery task. Tracing failures are logged rather than raised so that
+    they never fail a task.
+
+    Args:
+        app_name: name of the app, e.g. custom_mosaic_tool
+        stage: name of the celery task without the app prefix
+        task_id: pk of the app's task model
+        chunk_id: optional chunk id - see get_chunk_id
+        celery_task_id: id of the running celery task
+
+    """
+    stage_span = Span(stage)
+    _get_stack().append({'span': stage_span, 'steps': []})
+    status = "OK"
+    try:
+        yield stage_span
+    except Exception as e:
+        status = get_exception_status(e)
+        raise
+    finally:
+        frame = _get_stack().pop()
+        stage_span.finish(status=status)
+        stage_span.bytes_in += sum(step.bytes_in for step in frame['steps'])
+        stage_span.bytes_out += sum(step.bytes_out for step in frame['steps'])
+        spans = [
+            TaskSpan(
+                app_name=app_name,
+                task_id=task_id,
+                celery_task_id=celery_task_id or "",
+                stage=span.stage,
+                step=span.step,
+                chunk_id=chunk_id,
+                start=span.start,
+                wall_seconds=span.wall_seconds,
+                cpu_seconds=span.cpu_seconds,
+                bytes_in=span.bytes_in,
+                bytes_out=span.bytes_out,
+                process_peak_memory=span.process_peak_memory,
+                status=span.status) for span in [stage_span] + frame['steps']
+        ]
+        try:
+            TaskSpan.objects.bulk_create(spans)
+        except DatabaseError:
+            logger.warning("Unable to save the spans of {} for task {}".format(stage, task_id))
+
+
+@contextmanager
+def trace_step(step):
+    """Trace a step within the stage that is running in this thread
+
+    Outside of a traced stage the span is still yielded so callers can add to its counters, but it isn't saved.
+
+    Args:
+        step: name of the step, e.g. load, process, export, write_png
+
+    """
+    stack = _get_stack()
+    span = Span(stack[-1]['span'].stage if stack else "", step=step)
+    status = "OK"
+    try:
+        yield span
+    except Exception as e:
+        status = get_exception_status(e)
+        raise
+    finally:
+        span.finish(status=status)
+        if stack:
+            stack[-1]['steps'].append(span)
+
+
+def get_task_timeline(app_name, task_id):
+    """Get the spans of a task along with their offset from the start of the task
+
+    Returns:
+        List of dicts containing a span and its offset and wall_seconds as percentages of the task's duration,
+        ordered by start time.
+
+    """
+    spans = list(TaskSpan.objects.filter(app_name=app_name, task_id=task_id))
+    if not spans:
+        return []
+    start = min(span.start for span in spans)
+    duration = max((span.start - start).total_seconds() + span.wall_seconds for span in spans) or 1
+    return [{
+        'span': span,
+        'offset': 100 * (span.start - start).total_seconds() / duration,
+        'width': max(100 * span.wall_seconds / duration, 0.1)
+    } for span in spans]
+
+
+def _format_labels(**labels):
+    escaped = {
+        key: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        for key, value in labels.items()
+    }
+    return "{" + ",".join('{}="{}"'.format(key, escaped[key]) for key in sorted(escaped)) + "}"
+
+
+# metric name, help, aggregate key
+# These are exported as gauges over the spans that are currently stored - clear_cache deletes the spans of old tasks,
+# so the values can go down and don't satisfy the monotonic counter/summary types.
+PROMETHEUS_METRICS = [
+    ('dc_algorithm_spans', "Recorded pipeline stages and steps.", 'count'),
+    ('dc_algorithm_span_seconds', "Wall clock seconds spent in recorded pipeline stages and steps.", 'wall_seconds'),
+    ('dc_algorithm_span_cpu_seconds', "Process cpu seconds spent in recorded pipeline stages and steps.",
+     'cpu_seconds'),
+    ('dc_algorithm_span_bytes_in', "Bytes loaded from the Data Cube by recorded spans.", 'bytes_in'),
+    ('dc_algorithm_span_bytes_out', "Bytes written to disk by recorded spans.", 'bytes_out'),
+    ('dc_algorithm_span_errors', "Recorded spans that raised an exception.", 'errors'),
+    ('dc_algorithm_span_process_peak_memory_bytes',
+     "Largest lifetime peak memory of a worker process seen at the end of a recorded span.", 'process_peak_memory'),
+]
+
+
+def get_prometheus_metrics():
+    """Aggregate all recorded spans by app, stage, and step in the Prometheus text exposition format"""
+    rows = TaskSpan.objects.values('app_name', 'stage', 'step').annotate(
+        count=Count('id'),
+        wall_seconds=Sum('wall_seconds'),
+        cpu_seconds=Sum('cpu_seconds'),
+        bytes_in=Sum('bytes_in'),
+        bytes_out=Sum('bytes_out'),
+        errors=Sum(Case(When(status="ERROR", then=1), default=0, output_field=IntegerField())),
+        process_peak_memory=Max('process_peak_memory')).order_by('app_name', 'stage', 'step')
+
+    lines = []
+    for name, description, key in PROMETHEUS_METRICS:
+        lines.append("# HELP {} {}".format(name, description))
+        lines.append("# TYPE {} gauge".format(name))
+        for row in rows:
+            labels = _format_labels(app=row['app_name'], stage=row['stage'], step=row['step'])
+            lines.append("{}{} {}".format(name, labels, row[key] or 0))
+    return "\n".join(lines) + "\n"
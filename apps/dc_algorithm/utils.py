@@ -1,20 +1,69 @@
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-
+import json
+import threading
+from collections import OrderedDict
 import numpy as np
-from collections import Iterable
+import xarray as xr
+from numcodecs import Blosc
+
+
+def _to_epoch_milliseconds(dates):
+    """Convert a list of datetimes or datetime64 values to integer milliseconds since the epoch"""
+    return np.array(dates, dtype='datetime64[ms]').astype('int64')
+
+
+def downsample_series(x, y, max_points=None):
+    """Reduce a series to at most max_points values while keeping its extremes
+
+    The series is split into max_points / 2 evenly sized buckets and the minimum and maximum
+    of each bucket are kept, so spikes and dips in long series are still visible once plotted.
+    NaN values are ignored and buckets containing only NaNs are dropped.
+
+    Args:
+        x: iterable of x values (e.g. epoch milliseconds)
+        y: iterable of numeric y values of the same length as x
+        max_points: maximum number of values to return - None or a value >= len(y) returns the series as is.
+            A max_points of 1 keeps only the maximum of the series.
+
+    Returns:
+        Tuple of numpy arrays (x, y) in the original order.
+
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype='float64')
+    if max_points is None or len(y) <= max_points:
+        return x, y
+    if max_points < 1:
+        raise ValueError("max_points must be a positive integer.")
+
+    keep = []
+    for bucket in np.array_split(np.arange(len(y)), max(max_points // 2, 1)):
+        valid = bucket[~np.isnan(y[bucket])]
+        if len(valid) == 0:
+            continue
+        if max_points == 1:
+            keep.append(valid[np.argmax(y[valid])])
+        else:
+            keep.extend(sorted({valid[np.argmin(y[valid])], valid[np.argmax(y[valid])]}))
+    keep = np.array(keep, dtype='int64')
+    return x[keep], y[keep]
 
 
-def create_2d_plot(path, dates=None, datasets=None, data_labels=None, style='', titles=None, vertical=True):
-    """Create a 2d image and save it to disk
+def write_2d_plot_data(path, dates=None, datasets=None, data_labels=None, style='', titles=None, max_points=None):
+    """Write a set of time series to disk as compact JSON to be plotted client side
+
+    Replaces image generation - the arguments mirror the old plotting call so that each series
+    becomes a single plot in the browser. Dates are stored as epoch milliseconds and missing
+    values as null.
 
     Args:
-        path: path to save the image
+        path: path to save the json document
         dates: list of datetimes or list of list of datetimes, will be put on the x axis
-        datasets: iterable or list of iterables, plot in seperate figures side by side.
+        datasets: iterable or list of iterables, plotted in seperate figures.
         data_labels: string or list of strings of the same len as datasets, used as axis labels.
-        title: string or list of strings of the same len as datasets, used as plot titles.
+        style: string or list of strings of the same len as datasets, matplotlib style format strings
+            e.g. 'ro' or '.' that are interpretted by the client.
+        titles: string or list of strings of the same len as datasets, used as plot titles.
+        max_points: optional maximum number of points per series - see downsample_series
 
     """
     _iterable = isinstance(datasets[0], list) or isinstance(datasets[0], np.ndarray)
@@ -26,17 +75,264 @@ def create_2d_plot(path, dates=None, datasets=None, data_labels=None, style='',
     data_labels = data_labels if _iterable else [data_labels]
     titles = titles if _iterable else [titles]
 
-    plot_count = len(datasets)
-    figure = plt.figure(figsize=(6, plot_count * 4)) if vertical else plt.figure(figsize=(plot_count * 6, 4))
+    plots = []
     for index, dataset in enumerate(datasets):
-        axes = figure.add_subplot(plot_count, 1, index + 1) if vertical else figure.add_subplot(1, plot_count,
-                                                                                                index + 1)
-        axes.plot(dates[index], datasets[index], style if isinstance(style, str) else style[index])
-        axes.set_title(titles[index])
-        axes.set_xlabel('Acquisition Date')
-        axes.set_ylabel(data_labels[index])
-
-    figure.tight_layout()
-    figure.autofmt_xdate()
-    orientation = "portrait" if vertical else "landscape"
-    figure.savefig(path, orientation=orientation, format='png')
+        x, y = downsample_series(
+            _to_epoch_milliseconds(dates[index]), np.asarray(dataset, dtype='float64').ravel(), max_points=max_points)
+        plots.append({
+            'title': titles[index],
+            'label': data_labels[index],
+            'style': style if isinstance(style, str) else style[index],
+            'x': x.tolist(),
+            'y': [None if np.isnan(value) else value for value in y.tolist()]
+        })
+
+    with open(path, 'w') as plot_file:
+        json.dump({'plots': plots}, plot_file, separators=(',', ':'))
+
+
+def load_2d_plot_data(path, max_points=None):
+    """Load a json document written by write_2d_plot_data, optionally downsampling each series
+
+    Args:
+        path: path to the json document
+        max_points: optional maximum number of points per series - see downsample_series
+
+    Returns:
+        Dict containing a list of plots keyed by 'plots'. Tasks completed before plots were written as json
+        have an image plot_path - for those, the list is empty and the image path is keyed by 'image'.
+
+    """
+    if not path.endswith('.json'):
+        return {'plots': [], 'image': path}
+    with open(path) as plot_file:
+        plot_data = json.load(plot_file)
+    if max_points is not None:
+        for plot in plot_data['plots']:
+            x, y = downsample_series(
+                plot['x'], [np.nan if value is None else value for value in plot['y']], max_points=max_points)
+            plot['x'] = x.tolist()
+            plot['y'] = [None if np.isnan(value) else value for value in y.tolist()]
+    return plot_data
+
+
+def slice_dataset_to_extent(dataset, latitude=None, longitude=None):
+    """Select the pixels of a dataset that fall within a bounding box
+
+    Coordinates are compared directly so the result does not depend on the order of the latitude axis.
+
+    Args:
+        dataset: xarray Dataset with latitude and longitude coordinates
+        latitude, longitude: (min, max) tuples, both inclusive
+
+    Returns:
+        xarray Dataset containing only the pixels within the bounds.
+
+    """
+    latitudes, longitudes = dataset.latitude.values, dataset.longitude.values
+    return dataset.isel(
+        latitude=np.where((latitudes >= latitude[0]) & (latitudes <= latitude[1]))[0],
+        longitude=np.where((longitudes >= longitude[0]) & (longitudes <= longitude[1]))[0])
+
+
+def write_dataset_store(dataset, path, chunk_size=512, compressor=None):
+    """Write a dataset to a chunked and compressed Zarr directory store
+
+    Every variable is chunked along each of its dimensions so that a window of the dataset can be read
+    by only decompressing the chunks that intersect it. Any existing store at path is overwritten.
+
+    Args:
+        dataset: xarray Dataset to write
+        path: path to the store directory
+        chunk_size: maximum size of a chunk along each dimension
+        compressor: numcodecs compressor - defaults to zstd with bit shuffling.
+
+    """
+    compressor = compressor or Blosc(cname='zstd', clevel=3, shuffle=Blosc.BITSHUFFLE)
+    dataset = dataset.copy()
+    encoding = {}
+    for name, variable in dataset.variables.items():
+        # drop the encoding of the source file, e.g. NetCDF compression options.
+        variable.encoding = {}
+        if name not in dataset.coords:
+            encoding[name] = {
+                'compressor': compressor,
+                'chunks': tuple(min(chunk_size, size) for size in variable.shape)
+            }
+    dataset.to_zarr(path, mode='w', encoding=encoding)
+
+
+def open_dataset_store(path):
+    """Lazily open a store written by write_dataset_store without requiring dask"""
+    return xr.open_zarr(path, chunks=None)
+
+
+def _load_pixel_time_series(dc, product, measurements=None, latitude=None, longitude=None, time=None):
+    """Load a single product for a pixel extent, reading only the datasets that intersect it"""
+    query = {'latitude': latitude, 'longitude': longitude}
+    if time is not None:
+        query['time'] = time
+    datasets = dc.find_datasets(product=product, **query)
+    if len(datasets) == 0:
+        return None
+    data = dc.load(product=product, measurements=measurements, datasets=datasets, **query)
+    return data if 'time' in data else None
+
+
+class PixelTimeSeriesCache:
+    """In memory LRU cache of the full time series for small windows of a product
+
+    Pixel drills tend to be repeated over neighbouring pixels. Rather than caching single pixels,
+    every acquisition is loaded for a fixed window snapped to a grid of window_size degrees
+    around the requested pixel, so any later drill that falls in the same window is served
+    from memory. Windows are kept in their native dtypes and the least recently used
+    windows are evicted once max_bytes is exceeded.
+
+    The index is still queried on every request - only datasets that are not already cached are
+    read, so newly ingested acquisitions are appended rather than invalidating the window.
+
+    The cache lives in the worker process, so it is only useful for workers that are not
+    recycled after each task, e.g. the pixel_drill queue.
+
+    """
+
+    def __init__(self, window_size=0.005, max_bytes=256 * 1024 * 1024):
+        self.window_size = window_size
+        self.max_bytes = max_bytes
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_pixel(self, dc, product, measurements=None, latitude=None, longitude=None, time=None):
+        """Get the time series for the pixel at the center of the latitude/longitude extent
+
+        Args:
+            dc: datacube.Datacube instance
+            product: product name to load
+            measurements: list of measurements to load
+            latitude, longitude: (min, max) tuples of the pixel extent
+            time: optional (start, end) tuple of dates, both inclusive
+
+        Returns:
+            xarray Dataset with a single latitude and longitude
+            -or-
+            None if there is no data for the pixel.
+
+        """
+        center_lat, center_lon = sum(latitude) / 2, sum(longitude) / 2
+        window = self._get_window(dc, product, measurements, center_lat, center_lon)
+        if window is None:
+            return None
+        pixel = self._select_pixel(window, center_lat, center_lon)
+        if pixel is None:
+            # the window's data doesn't reach the point, e.g. at the edge of a product, so it is loaded directly.
+            return _load_pixel_time_series(
+                dc, product, measurements=measurements, latitude=latitude, longitude=longitude, time=time)
+        if time is not None:
+            times = pixel.time.values
+            in_range = (times >= np.datetime64(time[0], 'D')) & \
+                       (times < np.datetime64(time[1], 'D') + np.timedelta64(1, 'D'))
+            pixel = pixel.isel(time=np.where(in_range)[0])
+        return pixel if len(pixel.time) > 0 else None
+
+    @staticmethod
+    def _select_pixel(window, latitude, longitude):
+        """Select the pixel nearest to a point, None if the point is more than a pixel from the window's data"""
+        pixel = window
+        for dimension, value in [('latitude', latitude), ('longitude', longitude)]:
+            coordinates = window[dimension].values
+            if len(coordinates) < 2:
+                return None
+            try:
+                pixel = pixel.sel(
+                    **{dimension: [value]}, method='nearest', tolerance=np.abs(np.diff(coordinates)).min())
+            except KeyError:
+                return None
+        return pixel
+
+    def clear(self):
+        with self._lock:
+            self._windows.clear()
+
+    @property
+    def nbytes(self):
+        return sum(entry['data'].nbytes for entry in self._windows.values())
+
+    def _get_window(self, dc, product, measurements, latitude, longitude):
+        """Get the cached window containing a point, loading any datasets that have not been read yet"""
+        lat_index, lon_index = int(np.floor(latitude / self.window_size)), int(np.floor(longitude / self.window_size))
+        key = (getattr(dc.index, 'url', None), product, tuple(sorted(measurements or [])), lat_index, lon_index)
+        # pad by a fraction of a window so pixels straddling the window edges are included.
+        padding = self.window_size / 10
+        query = {
+            'latitude': (lat_index * self.window_size - padding, (lat_index + 1) * self.window_size + padding),
+            'longitude': (lon_index * self.window_size - padding, (lon_index + 1) * self.window_size + padding)
+        }
+
+        datasets = dc.find_datasets(product=product, **query)
+        dataset_ids = {dataset.id for dataset in datasets}
+
+        with self._lock:
+            entry = self._windows.pop(key, None)
+        if entry is not None and not entry['dataset_ids'] <= dataset_ids:
+            # datasets were removed from the index so the window is reloaded from scratch.
+            entry = None
+        cached_ids = entry['dataset_ids'] if entry is not None else set()
+        new_datasets = [dataset for dataset in datasets if dataset.id not in cached_ids]
+
+        data = entry['data'] if entry is not None else None
+        if len(new_datasets) > 0:
+            new_data = dc.load(product=product, measurements=measurements, datasets=new_datasets, **query)
+            if 'time' in new_data:
+                data = new_data if data is None else xr.concat([data, new_data], dim='time').sortby('time')
+        if data is None:
+            return None
+
+        with self._lock:
+            self._windows[key] = {'dataset_ids': dataset_ids, 'data': data}
+            while len(self._windows) > 1 and self.nbytes > self.max_bytes:
+                self._windows.popitem(last=False)
+        return data
+
+
+# Shared by all pixel drilling tasks running in a worker process.
+pixel_time_series_cache = PixelTimeSeriesCache()
+
+
+def get_pixel_time_series(dc, products=None, measurements=None, latitude=None, longitude=None, time=None, cache=None):
+    """Load every acquisition of a single pixel, reading only the storage units that contain it
+
+    The index is queried for the datasets that intersect the point before anything is loaded, and
+    each dataset is then read with the single pixel extent so only a 1x1 window is read per file.
+    This skips the acquisition listing and full extent load used by the processing pipeline.
+
+    Args:
+        dc: datacube.Datacube instance
+        products: list of product names to load from - e.g. the products of a combined Satellite.
+        measurements: list of measurements to load
+        latitude, longitude: (min, max) tuples of the pixel extent
+        time: optional (start, end) tuple
+        cache: optional PixelTimeSeriesCache used to serve nearby pixels from memory
+
+    Returns:
+        xarray Dataset with a single latitude and longitude and a 'satellite' variable holding the index
+        of the product that each acquisition was loaded from, sorted by time.
+        -or-
+        None if there is no data for the pixel.
+
+    """
+    load = _load_pixel_time_series if cache is None else cache.get_pixel
+
+    pixels = []
+    for product_index, product in enumerate(products):
+        data = load(dc, product, measurements=measurements, latitude=latitude, longitude=longitude, time=time)
+        if data is None:
+            continue
+        # products may sit on slightly different grids - the pixel is the same so share the coordinates.
+        if len(pixels) > 0:
+            data = data.assign_coords(latitude=pixels[0].latitude, longitude=pixels[0].longitude)
+        data['satellite'] = xr.DataArray(np.full(len(data.time), product_index, dtype='int8'), dims=['time'])
+        pixels.append(data)
+
+    if len(pixels) == 0:
+        return None
+    return xr.concat(pixels, dim='time').sortby('time')
@@ -27,10 +27,13 @@ from django.forms.models import model_to_dict
 from django.views import View
 from django.apps import apps
 
-from apps.dc_algorithm.forms import DataSelectionForm
+from apps.dc_algorithm.forms import DataSelectionForm, SubsetBoundsForm
 from .models import Application, Satellite, Area
 from apps.dc_algorithm.tasks import task_clean_up
+from apps.dc_algorithm.utils import load_2d_plot_data
+from apps.dc_algorithm import scheduler
 
+import os
 import time
 
 class ToolClass:
@@ -440,10 +443,15 @@ class SubmitNewRequest(View, ToolClass):
         task_model_name: Name of the model that represents your task - see models.Task for more information
         form_list: list [] of form classes (e.g. AdditionalOptionsForm, GeospatialForm) to be used to validate all provided input.
 
+    Optional Attributes:
+        preview_large_tasks: If True, tasks that the cost estimate flags as large are preceded by a low
+            resolution preview task so a provisional result is shown quickly. See Query.create_preview.
+
     """
 
     celery_task_func = None
     form_list = None
+    preview_large_tasks = True
 
     @method_decorator(login_required)
     def post(self, request):
@@ -468,11 +476,7 @@ class SubmitNewRequest(View, ToolClass):
 
         response = {'status': "OK"}
         task_model_class = self._get_tool_model(self._get_task_model_name())
-        user_history = self._get_tool_model('userhistory').objects.filter(user_id=user_id)
-        forms = []
-        for form in self._get_form_list():
-            forms.append(form(request.POST, user_id=user_id, user_history=user_history, task_model_class=task_model_class)
-                         if issubclass(form, DataSelectionForm) else form(request.POST))
+        forms = self.get_forms(request, user_id)
         #validate all forms, print any/all errors
         parameter_set = {}
         for form in forms:
@@ -484,14 +488,37 @@ class SubmitNewRequest(View, ToolClass):
         self.get_missing_parameters(parameter_set)
 
         task, new_task = task_model_class.get_or_create_query_from_post(parameter_set)
+        # requests served by an existing identical task add no load, so only new tasks are subject to admission.
+        if new_task:
+            admitted, message = scheduler.admit(user_id)
+            if not admitted:
+                task.delete()
+                return JsonResponse({'status': "ERROR", 'message': message})
         #associate task w/ history
         history_model, _ = self._get_tool_model('userhistory').objects.get_or_create(user_id=user_id, task_id=task.pk)
         if new_task:
+            estimates = [form.cost_estimate for form in forms if isinstance(form, DataSelectionForm)]
+            if self.preview_large_tasks and estimates and estimates[0] and estimates[0]['recommendation'] == 'confirm':
+                preview_task = task.create_preview()
+                self._get_celery_task_func().delay(task_id=preview_task.pk)
             self._get_celery_task_func().delay(task_id=task.pk)
         response.update(model_to_dict(task))
 
         return JsonResponse(response)
 
+    def get_forms(self, request, user_id):
+        """Create an instance of each form in the form_list from the POST data
+
+        DataSelectionForms are passed the user and task model so that user limits and cost estimates can be checked.
+        """
+        task_model_class = self._get_tool_model(self._get_task_model_name())
+        user_history = self._get_tool_model('userhistory').objects.filter(user_id=user_id)
+        forms = []
+        for form in self._get_form_list():
+            forms.append(form(request.POST, user_id=user_id, user_history=user_history, task_model_class=task_model_class)
+                         if issubclass(form, DataSelectionForm) else form(request.POST))
+        return forms
+
     def get_missing_parameters(self, parameter_set):
         """
         Used to get parameters that aren't directly set by an app's form.
@@ -528,6 +555,41 @@ class SubmitNewRequest(View, ToolClass):
         return self.form_list
 
 
+class EstimateTaskCost(SubmitNewRequest):
+    """Estimate the cost of a request before it is submitted
+
+    Validates the same form set as SubmitNewRequest without creating a task. See apps.dc_algorithm.estimator
+    for the cost model.
+
+    Required Attributes:
+        tool_name: Descriptive string name for the tool - used to identify the tool in the database.
+        task_model_name: Name of the model that represents your task - see models.Task for more information
+        form_list: list [] of form classes (e.g. AdditionalOptionsForm, GeospatialForm) to be used to validate all provided input.
+
+    """
+
+    @method_decorator(login_required)
+    def post(self, request):
+        """Get a JsonResponse containing the cost estimate for a form set
+
+        Args:
+            POST data including a full form set, see SubmitNewRequest.post
+
+        Returns:
+            JsonResponse containing:
+                A 'status' with either OK or ERROR
+                estimate: dict containing the estimate, see estimator.estimate_task_cost. This is None
+                    if the request could not be estimated, e.g. for apps without a start and end date.
+        """
+        forms = self.get_forms(request, request.user.id)
+        for form in forms:
+            if not form.is_valid():
+                for error in form.errors:
+                    return JsonResponse({'status': "ERROR", 'message': form.errors[error][0]})
+        estimates = [form.cost_estimate for form in forms if isinstance(form, DataSelectionForm)]
+        return JsonResponse({'status': "OK", 'estimate': estimates[0] if estimates else None})
+
+
 class SubmitPixelDrillRequest(View, ToolClass):
     """Submit a new request for pixel drilling using a task created with form data
 
@@ -545,10 +607,15 @@ class SubmitPixelDrillRequest(View, ToolClass):
         task_model_name: Name of the model that represents your task - see models.Task for more information
         form_list: list [] of form classes (e.g. AdditionalOptionsForm, GeospatialForm) to be used to validate all provided input.
 
+    Optional Attributes:
+        celery_task_timeout: Seconds to wait for the pixel drill before giving up. Pixel drill tasks are routed
+            to the dedicated pixel_drill queue so this should only be hit if that queue has no workers.
+
     """
 
     celery_task_func = None
     form_list = None
+    celery_task_timeout = 30
 
     @method_decorator(login_required)
     def post(self, request):
@@ -567,6 +634,7 @@ class SubmitPixelDrillRequest(View, ToolClass):
             JsonResponse containing:
                 A 'status' with either OK or ERROR
                 A Json representation of the task object created from form data.
+                plots: the plot data generated by the pixel drill, see GetTaskPlotData.
         """
 
         user_id = request.user.id
@@ -587,9 +655,15 @@ class SubmitPixelDrillRequest(View, ToolClass):
         #associate task w/ history
         history_model, __ = self._get_tool_model('userhistory').objects.get_or_create(user_id=user_id, task_id=task.pk)
         try:
-            response['png_path'] = self._get_celery_task_func().delay(task_id=task.pk).get()
+            if new_task or not task.complete:
+                self._get_celery_task_func().apply_async(
+                    kwargs={'task_id': task.pk},
+                    priority=scheduler.PRIORITY_CLASSES['interactive']).get(timeout=self.celery_task_timeout)
             task.refresh_from_db()
+            if task.status == "ERROR":
+                return JsonResponse({'status': "ERROR", 'message': task.message})
             response.update(model_to_dict(task))
+            response.update(load_2d_plot_data(task.plot_path))
             return JsonResponse(response)
         except:
             return JsonResponse({
@@ -662,6 +736,7 @@ class GetTaskResult(View, ToolClass):
                 status: WAIT, OK, ERROR
                 if completed: Task obj
                 if WAIT: progress, containing an integer 0-100 to signify progress.
+                    preview, containing the preview Task obj if a preview has completed.
 
         """
         task_model = self._get_tool_model(self._get_task_model_name())
@@ -676,12 +751,68 @@ class GetTaskResult(View, ToolClass):
                 response['message'] = requested_task.message
             else:
                 response['progress'] = requested_task.get_progress()
+                # a completed preview is returned as a provisional result until the task is complete.
+                preview = requested_task.get_preview()
+                if preview is not None and preview.status == "OK" and preview.complete:
+                    response['preview'] = model_to_dict(preview)
         except task_model.DoesNotExist:
             response['status'] = "ERROR"
             response['message'] = "Task matching id does not exist."
         return JsonResponse(response)
 
 
+class GetTaskPlotData(View, ToolClass):
+    """Fetch the per-acquisition series of a task as JSON so they can be plotted client side
+
+    REST API Endpoint for getting the plot data written by a task to its plot_path.
+    This is a GET only view, so only the get function is defined. A Task id is provided in the
+    request along with an optional max_points parameter used to downsample very long series.
+
+    Abstract properties and methods are used to define the required attributes for an implementation.
+    Inheriting GetTaskPlotData without defining the required abstracted elements will throw an error.
+    Due to some complications with django and ABC, NotImplementedErrors are manually raised.
+
+    Required Attributes:
+        tool_name: Descriptive string name for the tool - used to identify the tool in the database.
+        task_model_name: Name of the model that represents your task - see models.Task for more information
+
+    """
+
+    def get(self, request):
+        """Get a JsonResponse containing a status and the plots generated by a task
+
+        Args:
+            'id' in request.GET
+            'max_points' in request.GET (optional): maximum number of points per series
+
+        Returns:
+            A JsonResponse containing:
+                status: OK, ERROR
+                if OK: plots, a list of dicts with a title, label, style, and x/y values.
+
+        """
+        task_model = self._get_tool_model(self._get_task_model_name())
+        try:
+            requested_task = task_model.objects.get(pk=request.GET['id'])
+        except task_model.DoesNotExist:
+            return JsonResponse({'status': "ERROR", 'message': "Task matching id does not exist."})
+
+        if not requested_task.plot_path or not os.path.exists(requested_task.plot_path):
+            return JsonResponse({'status': "ERROR", 'message': "There is no plot data available for this task."})
+
+        max_points = request.GET.get('max_points', None)
+        if max_points:
+            try:
+                max_points = int(max_points)
+            except ValueError:
+                max_points = 0
+            if max_points < 1:
+                return JsonResponse({'status': "ERROR", 'message': "max_points must be a positive integer."})
+        response = {'status': "OK"}
+        response.update(load_2d_plot_data(requested_task.plot_path, max_points=max_points or None))
+        return JsonResponse(response)
+
+
 class SubmitNewSubsetRequest(View, ToolClass):
     """Submit a new subset request based on an existing task result
 
@@ -699,10 +830,17 @@ class SubmitNewSubsetRequest(View, ToolClass):
         task_model_update_func: function used to modify an existing task model using any number of kwargs
             params should be the tasks to update and kwargs
 
+    Optional Attributes:
+        subset_task_func: A celery task called with .delay() with the pk of the new task model and the pk of the
+            existing task as task_id and parent_id. Requests with bounds are only accepted when this is defined and
+            the bounds fall within the existing task, so that the products are sliced from the existing result.
+
     """
 
     celery_task_func = None
     task_model_update_func = None
+    subset_task_func = None
+    bounds_fields = ['latitude_min', 'latitude_max', 'longitude_min', 'longitude_max']
 
     def post(self, request):
         """Use post data to get and modify an existing task model and submit for processing
@@ -713,6 +851,9 @@ class SubmitNewSubsetRequest(View, ToolClass):
         POST data is required to have:
             id: pk of the task tasks
             any number of named attributes and values used to update the tasks model.
+            -or-
+            latitude_min, latitude_max, longitude_min, longitude_max: bounds of a spatial subset that fall within
+                the bounds of the existing task - see Query.is_subset_of.
 
         Returns:
             JsonResponse containing:
@@ -724,9 +865,30 @@ class SubmitNewSubsetRequest(View, ToolClass):
         task_model = self._get_tool_model(self._get_task_model_name())
         response = {'status': "OK"}
 
-        requested_task = task_model.objects.get(pk=request.POST['id'])
-
-        updated_task = self._get_task_model_update_func()(requested_task, **request.POST)
+        try:
+            requested_task = task_model.objects.get(pk=request.POST['id'])
+        except task_model.DoesNotExist:
+            return JsonResponse({'status': "ERROR", 'message': "Task matching id does not exist."})
+        # the update funcs modify the task in place, so keep an unmodified copy to slice from.
+        parent_task = task_model.objects.get(pk=request.POST['id'])
+
+        # subsets are only sliced from the existing result - they never start a new run over the requested bounds.
+        subset = any(field in request.POST for field in self.bounds_fields)
+        if subset:
+            if self.subset_task_func is None:
+                return JsonResponse({'status': "ERROR", 'message': "Subsets of results are not supported by this tool."})
+            form = SubsetBoundsForm(request.POST)
+            if not form.is_valid():
+                for error in form.errors:
+                    return JsonResponse({'status': "ERROR", 'message': form.errors[error][0]})
+            updated_task = self.update_task_bounds(requested_task, form.cleaned_data)
+            if not updated_task.is_subset_of(parent_task):
+                return JsonResponse({
+                    'status': "ERROR",
+                    'message': "Subsets must fall within the bounds of a completed result without an animation."
+                })
+        else:
+            updated_task = self._get_task_model_update_func()(requested_task, **request.POST)
         updated_task.pk = None
         updated_task_data = {field: getattr(updated_task, field) for field in task_model._meta.unique_together[0]}
         try:
@@ -735,7 +897,10 @@ class SubmitNewSubsetRequest(View, ToolClass):
             updated_task = task_model(**updated_task_data)
             updated_task.save()
             #only run if this is a new task
-            self._get_celery_task_func().delay(task_id=updated_task.pk)
+            if subset:
+                self.subset_task_func.delay(task_id=updated_task.pk, parent_id=parent_task.pk)
+            else:
+                self._get_celery_task_func().delay(task_id=updated_task.pk)
 
         user_id = request.user.id
         history_model, __ = self._get_tool_model('userhistory').objects.get_or_create(
@@ -758,6 +923,16 @@ class SubmitNewSubsetRequest(View, ToolClass):
             )
         return self.celery_task_func
 
+    def update_task_bounds(self, task_model, bounds):
+        """Update a task model with the cleaned bounds of a spatial subset, resetting its results"""
+        for field in self.bounds_fields:
+            setattr(task_model, field, bounds[field])
+        task_model.complete = False
+        task_model.scenes_processed = 0
+        task_model.total_scenes = 0
+        task_model.title = "Subset of {}".format(task_model.title)[:100]
+        return task_model
+
     def _get_task_model_update_func(self):
         """Gets the task_model_update_func and raises an error if it is not defined.
 
@@ -773,6 +948,68 @@ class SubmitNewSubsetRequest(View, ToolClass):
         return self.task_model_update_func
 
 
+class ExtendRequest(View, ToolClass):
+    """Extend a completed task with acquisitions that were ingested after it was processed
+
+    REST API Endpoint for extending an existing result. This is a POST only view,
+    so only the post function is defined. Only tasks that can be extended (see Query.get_extendable) are accepted -
+    the new acquisitions are folded into the task's stored intermediate product rather than reprocessing everything.
+
+    Abstract properties and methods are used to define the required attributes for an implementation.
+    Inheriting ExtendRequest without defining the required abstracted elements will throw an error.
+    Due to some complications with django and ABC, NotImplementedErrors are manually raised.
+
+    Required Attributes:
+        tool_name: Descriptive string name for the tool - used to identify the tool in the database.
+        celery_task_func: A celery task called with .delay() with the only parameter being the pk of a task model
+        task_model_name: Name of the model that represents your task - see models.Task for more information
+
+    """
+
+    celery_task_func = None
+
+    def post(self, request):
+        """Queue the extension of a completed task
+
+        POST data is required to have:
+            id: pk of the task to extend
+
+        Returns:
+            JsonResponse containing:
+                A 'status' with either OK or ERROR
+                A 'message' describing the error, if any.
+
+        """
+
+        task_model = self._get_tool_model(self._get_task_model_name())
+        try:
+            task = task_model.objects.get(pk=request.POST['id'])
+        except task_model.DoesNotExist:
+            return JsonResponse({'status': "ERROR", 'message': "Task matching id does not exist."})
+        if not task.can_be_extended():
+            return JsonResponse({
+                'status': "ERROR",
+                'message': "Only completed tasks using an iterative compositor without an animation can be extended."
+            })
+
+        self._get_celery_task_func().delay(task_id=task.pk)
+        return JsonResponse({'status': "OK"})
+
+    def _get_celery_task_func(self):
+        """Gets the celery task function and raises an error if it is not defined.
+
+        Checks if celery_task_func property is None, otherwise return the function.
+        The celery_task_func must be a function callable with .delay() with the only
+        parameters being the pk of a task model.
+
+        """
+        if self.celery_task_func is None:
+            raise NotImplementedError(
+                "You must specify a celery_task_func in classes that inherit ExtendRequest. See the ExtendRequest docstring for more details."
+            )
+        return self.celery_task_func
+
+
 class CancelRequest(View, ToolClass):
     """Cancel a running task and disassociate it with the user's history.
 
@@ -818,6 +1055,9 @@ class CancelRequest(View, ToolClass):
 
         # Mark the task as cancelled so it can know to stop if it is running.
         task.update_status('CANCELLED', 'The task has been cancelled.')
+        preview = task.get_preview()
+        if preview is not None and not preview.complete:
+            preview.update_status('CANCELLED', 'The task has been cancelled.')
 
         # Clean up asynchronously.
         time.sleep(10) # Wait a few seconds for the task to stop.
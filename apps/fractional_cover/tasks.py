@@ -16,12 +16,16 @@ from utils.data_cube_utilities.dc_chunker import (create_geographic_chunks, crea
                                                   combine_geographic_chunks)
 from utils.data_cube_utilities.dc_fractional_coverage_classifier import frac_coverage_classify
 from utils.data_cube_utilities.dc_water_classifier import wofs_classify
-from apps.dc_algorithm.utils import create_2d_plot
+from apps.dc_algorithm.utils import (write_2d_plot_data, get_pixel_time_series, pixel_time_series_cache,
+                                     slice_dataset_to_extent)
 from utils.data_cube_utilities.import_export import export_xarray_to_netcdf
 
 from .models import FractionalCoverTask
 from apps.dc_algorithm.models import Satellite
-from apps.dc_algorithm.tasks import DCAlgorithmBase, check_cancel_task, task_clean_up
+from apps.dc_algorithm.tasks import DCAlgorithmBase, check_cancel_task, task_clean_up, combine_split_chunks
+from apps.dc_algorithm.scheduler import prioritize
+from apps.dc_algorithm.tracing import trace_step
+from apps.dc_algorithm.memory import split_chunk_over_memory_budget, get_planned_geographic_chunk_size
 
 logger = get_task_logger(__name__)
 
@@ -30,7 +34,7 @@ class BaseTask(DCAlgorithmBase):
     app_name = 'fractional_cover'
 
 
-@task(name="fractional_cover.pixel_drill", base=BaseTask)
+@task(name="fractional_cover.pixel_drill", base=BaseTask, queue="pixel_drill")
 def pixel_drill(task_id=None):
     parameters = parse_parameters_from_task(task_id=task_id)
     validate_parameters(parameters, task_id=task_id)
@@ -40,7 +44,13 @@ def pixel_drill(task_id=None):
         return None
 
     dc = DataAccessApi(config=task.config_path)
-    single_pixel = dc.get_stacked_datasets_by_extent(**parameters)
+    single_pixel = get_pixel_time_series(dc.dc, cache=pixel_time_series_cache, **task.get_point_query_parameters())
+    dc.close()
+    if single_pixel is None:
+        task.complete = True
+        task.update_status("ERROR", "There are no acquistions for this parameter set.")
+        return None
+
     clear_mask = task.satellite.get_clean_mask_func()(single_pixel.isel(latitude=0, longitude=0))
     single_pixel = single_pixel.where(single_pixel != task.satellite.no_data_value)
 
@@ -77,8 +87,9 @@ def pixel_drill(task_id=None):
     ]
     style = ['ro', 'go', 'bo', '.']
 
-    task.plot_path = os.path.join(task.get_result_path(), "plot_path.png")
-    create_2d_plot(task.plot_path, dates=dates, datasets=datasets, data_labels=data_labels, titles=titles, style=style)
+    task.plot_path = os.path.join(task.get_result_path(), "plot_data.json")
+    write_2d_plot_data(
+        task.plot_path, dates=dates, datasets=datasets, data_labels=data_labels, titles=titles, style=style)
 
     task.complete = True
     task.update_status("OK", "Done processing pixel drill.")
@@ -96,6 +107,47 @@ def run(task_id=None):
                  start_chunk_processing.s(task_id=task_id))()
 
 
+@task(name="fractional_cover.subset", base=BaseTask)
+def subset(task_id=None, parent_id=None):
+    """Create the output products of a task by slicing the stored intermediate product of a parent task
+
+    See Query.is_subset_of for the requirements. No data is loaded from the Data Cube - the parent's
+    intermediate product is sliced to the task's bounds and passed directly to create_output_products.
+    """
+    return chain(slice_parent_result.s(task_id=task_id, parent_id=parent_id),
+                 create_output_products.s(task_id=task_id, subset=True),
+                 task_clean_up.si(task_id=task_id, task_model='FractionalCoverTask'))()
+
+
+@task(name="fractional_cover.slice_parent_result", base=BaseTask, bind=True)
+def slice_parent_result(self, task_id=None, parent_id=None):
+    """Slice the stored intermediate product of a parent task to the bounds of a task
+
+    The parent's metadata dict is reused for the acquisition list. Its per acquisition statistics describe the
+    parent's extent and can't be recomputed from the composited product, so create_output_products drops them.
+
+    Returns:
+        path to the sliced product, path to its metadata, and a dict containing the geo/time ids
+    """
+    task = FractionalCoverTask.objects.get(pk=task_id)
+    parent = FractionalCoverTask.objects.get(pk=parent_id)
+
+    task.execution_start = datetime.now()
+    if check_cancel_task(self, task): return
+    task.update_status("WAIT", "Slicing the result of an existing task.")
+
+    dataset = slice_dataset_to_extent(
+        parent.open_intermediate(),
+        latitude=(task.latitude_min, task.latitude_max),
+        longitude=(task.longitude_min, task.longitude_max))
+    path = os.path.join(task.get_temp_path(), "subset.nc")
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(dataset, path)
+        span.add_output(path)
+    metadata_path = task.store_chunk_metadata(path, parent.get_intermediate_metadata())
+    return path, metadata_path, {'geo_chunk_id': 0, 'time_chunk_id': 0}
+
+
 @task(name="fractional_cover.parse_parameters_from_task", base=BaseTask, bind=True)
 def parse_parameters_from_task(self, task_id=None):
     """Parse out required DC parameters from the task model.
@@ -120,6 +172,8 @@ def parse_parameters_from_task(self, task_id=None):
         'measurements': task.satellite.get_measurements()
     }
 
+    parameters.update(task.get_preview_load_parameters())
+
     task.execution_start = datetime.now()
     if check_cancel_task(self, task): return
     task.update_status("WAIT", "Parsed out parameters.")
@@ -198,7 +252,7 @@ def perform_task_chunking(self, parameters, task_id=None):
     geographic_chunks = create_geographic_chunks(
         longitude=parameters['longitude'],
         latitude=parameters['latitude'],
-        geographic_chunk_size=task_chunk_sizing['geographic'])
+        geographic_chunk_size=get_planned_geographic_chunk_size(task, task_chunk_sizing, dates))
 
     time_chunks = create_time_chunks(
         dates, _reversed=task.get_reverse_time(), time_chunk_size=task_chunk_sizing['time'])
@@ -224,7 +278,6 @@ def start_chunk_processing(self, chunk_details, task_id=None):
     if chunk_details is None:
         return None
 
-    parameters = chunk_details.get('parameters')
     geographic_chunks = chunk_details.get('geographic_chunks')
     time_chunks = chunk_details.get('time_chunks')
 
@@ -246,6 +299,9 @@ def start_chunk_processing(self, chunk_details, task_id=None):
     task.scenes_processed = 0
     task.save(update_fields=['total_scenes', 'scenes_processed'])
 
+    # processing tasks read their parameters and chunks from the stored details rather than their messages.
+    task.store_chunk_details(chunk_details)
+
     if check_cancel_task(self, task): return
     task.update_status("WAIT", "Starting processing.")
 
@@ -256,16 +312,14 @@ def start_chunk_processing(self, chunk_details, task_id=None):
             processing_task.s(
                 task_id=task_id,
                 geo_chunk_id=geo_index,
-                time_chunk_id=time_index,
-                geographic_chunk=geographic_chunk,
-                time_chunk=time_chunk,
-                **parameters) for time_index, time_chunk in enumerate(time_chunks)
+                time_chunk_id=time_index) for time_index in range(len(time_chunks))
         ]) | recombine_time_chunks.s(task_id=task_id, num_scn_per_chk=num_scn_per_chk)
            | process_band_math.s(task_id=task_id, num_scn_per_chk=2*num_scn_per_chk_geo)
-        for geo_index, geographic_chunk in enumerate(geographic_chunks)
+        for geo_index in range(len(geographic_chunks))
     ]) | recombine_geographic_chunks.s(task_id=task_id)
        | create_output_products.s(task_id=task_id)
-       | task_clean_up.si(task_id=task_id, task_model='FractionalCoverTask')).apply_async()
+       | task_clean_up.si(task_id=task_id, task_model='FractionalCoverTask'))
+    prioritize(processing_pipeline, task).apply_async()
 
     return True
 
@@ -276,12 +330,11 @@ def processing_task(self,
                     geo_chunk_id=None,
                     time_chunk_id=None,
                     geographic_chunk=None,
-                    time_chunk=None,
-                    **parameters):
+                    time_chunk=None):
     """Process a parameter set and save the results to disk.
 
     Uses the geographic and time chunk id to identify output products.
-    **params is updated with time and geographic ranges then used to load data.
+    The load parameters are read from the stored chunk details and updated with time and geographic ranges.
     the task model holds the iterative property that signifies whether the algorithm
     is iterative or if all data needs to be loaded at once.
 
@@ -289,10 +342,9 @@ def processing_task(self,
         task_id, geo_chunk_id, time_chunk_id: identification for the main task and what chunk this is processing
         geographic_chunk: range of latitude and longitude to load - dict with keys latitude, longitude
         time_chunk: list of acquisition dates
-        parameters: all required kwargs to load data.
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
     """
     chunk_id = "_".join([str(geo_chunk_id), str(time_chunk_id)])
     task = FractionalCoverTask.objects.get(pk=task_id)
@@ -302,6 +354,22 @@ def processing_task(self,
     if not os.path.exists(task.get_temp_path()):
         return None
 
+    geographic_chunk, time_chunk, parameters = task.get_chunk_parameters(
+        geo_chunk_id, time_chunk_id, geographic_chunk=geographic_chunk)
+
+    # over budget chunks are processed as smaller chunks that are combined before recombination.
+    geographic_chunks = split_chunk_over_memory_budget(task, geographic_chunk, time_chunk, parameters)
+    if geographic_chunks is not None:
+        return self.replace(
+            group([
+                processing_task.s(
+                    task_id=task_id,
+                    geo_chunk_id="{}.{}".format(geo_chunk_id, index),
+                    time_chunk_id=time_chunk_id,
+                    geographic_chunk=split_chunk) for index, split_chunk in enumerate(geographic_chunks)
+            ]) | combine_split_chunks.s(
+                task_id=task_id, app_name='fractional_cover', geo_chunk_id=geo_chunk_id, time_chunk_id=time_chunk_id))
+
     iteration_data = None
     metadata = {}
 
@@ -317,7 +385,9 @@ def processing_task(self,
     iteration_data = None
     for time_index, time in enumerate(times):
         updated_params.update({'time': time})
-        data = dc.get_stacked_datasets_by_extent(**updated_params)
+        with trace_step("load") as span:
+            data = dc.get_stacked_datasets_by_extent(**updated_params)
+            span.add_input(data)
 
         if check_cancel_task(self, task): return
 
@@ -330,11 +400,12 @@ def processing_task(self,
 
         metadata = task.metadata_from_dataset(metadata, data, clear_mask, updated_params)
 
-        iteration_data = task.get_processing_method()(data,
-                                                      clean_mask=clear_mask,
-                                                      intermediate_product=iteration_data,
-                                                      no_data=task.satellite.no_data_value,
-                                                      reverse_time=task.get_reverse_time())
+        with trace_step("process"):
+            iteration_data = task.get_processing_method()(data,
+                                                          clean_mask=clear_mask,
+                                                          intermediate_product=iteration_data,
+                                                          no_data=task.satellite.no_data_value,
+                                                          reverse_time=task.get_reverse_time())
 
         if check_cancel_task(self, task): return
         task.scenes_processed = F('scenes_processed') + 1
@@ -344,10 +415,13 @@ def processing_task(self,
         return None
 
     path = os.path.join(task.get_temp_path(), chunk_id + ".nc")
-    export_xarray_to_netcdf(iteration_data, path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(iteration_data, path)
+        span.add_output(path)
     dc.close()
     logger.info("Done with chunk: " + chunk_id)
-    return path, metadata, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
+    metadata_path = task.store_chunk_metadata(path, metadata)
+    return path, metadata_path, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
 
 
 @task(name="fractional_cover.recombine_time_chunks", base=BaseTask, bind=True)
@@ -359,11 +433,11 @@ def recombine_time_chunks(self, chunks, task_id=None, num_scn_per_chk=None):
     simply return the data again.
 
     Args:
-        chunks: list of the return from the processing_task function - path, metadata, and {chunk ids}
+        chunks: list of the return from the processing_task function - path, metadata path, and {chunk ids}
         num_scn_per_chk: The number of scenes per chunk. Used to determine task progress.
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
     """
     task = FractionalCoverTask.objects.get(pk=task_id)
     if check_cancel_task(self, task): return
@@ -380,7 +454,7 @@ def recombine_time_chunks(self, chunks, task_id=None, num_scn_per_chk=None):
     metadata = {}
     combined_data = None
     for index, chunk in enumerate(total_chunks):
-        metadata.update(chunk[1])
+        metadata.update(task.get_chunk_metadata(chunk[1]))
         data = xr.open_dataset(chunk[0])
         if combined_data is None:
             combined_data = data
@@ -392,11 +466,12 @@ def recombine_time_chunks(self, chunks, task_id=None, num_scn_per_chk=None):
         data['time'] = [0]
         clear_mask = task.satellite.get_clean_mask_func()(data)
 
-        combined_data = task.get_processing_method()(data,
-                                                     clean_mask=clear_mask,
-                                                     intermediate_product=combined_data,
-                                                     no_data=task.satellite.no_data_value,
-                                                     reverse_time=task.get_reverse_time())
+        with trace_step("process"):
+            combined_data = task.get_processing_method()(data,
+                                                         clean_mask=clear_mask,
+                                                         intermediate_product=combined_data,
+                                                         no_data=task.satellite.no_data_value,
+                                                         reverse_time=task.get_reverse_time())
         if check_cancel_task(self, task): return
         task.scenes_processed = F('scenes_processed') + num_scn_per_chk
         task.save(update_fields=['scenes_processed'])
@@ -404,9 +479,12 @@ def recombine_time_chunks(self, chunks, task_id=None, num_scn_per_chk=None):
         return None
 
     path = os.path.join(task.get_temp_path(), "recombined_time_{}.nc".format(geo_chunk_id))
-    export_xarray_to_netcdf(combined_data, path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(combined_data, path)
+        span.add_output(path)
     logger.info("Done combining time chunks for geo: " + str(geo_chunk_id))
-    return path, metadata, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
+    metadata_path = task.store_chunk_metadata(path, metadata)
+    return path, metadata_path, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
 
 
 @task(name="fractional_cover.process_band_math", base=BaseTask, bind=True)
@@ -419,7 +497,7 @@ def process_band_math(self, chunk, task_id=None, num_scn_per_chk=None):
     result to disk in the same path as the nc file already exists.
 
     Args:
-        chunk: The return from the recombine_time_chunks function - path, metadata, and {chunk ids}
+        chunk: The return from the recombine_time_chunks function - path, metadata path, and {chunk ids}
         num_scn_per_chk: The number of scenes per chunk. Used to determine task progress.
     """
     task = FractionalCoverTask.objects.get(pk=task_id)
@@ -439,7 +517,9 @@ def process_band_math(self, chunk, task_id=None, num_scn_per_chk=None):
     dataset = xr.merge([dataset, _apply_band_math(dataset)])
     #remove previous nc and write band math to disk
     os.remove(chunk[0])
-    export_xarray_to_netcdf(dataset, chunk[0])
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(dataset, chunk[0])
+        span.add_output(chunk[0])
     task.scenes_processed = F('scenes_processed') + num_scn_per_chk
     task.save(update_fields=['scenes_processed'])
     return chunk
@@ -453,10 +533,10 @@ def recombine_geographic_chunks(self, chunks, task_id=None):
     and combine it into a single dataset. Combine metadata as well, writing to disk.
 
     Args:
-        chunks: list of the return from the processing_task function - path, metadata, and {chunk ids}
+        chunks: list of the return from the processing_task function - path, metadata path, and {chunk ids}
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
     """
     task = FractionalCoverTask.objects.get(pk=task_id)
     if check_cancel_task(self, task): return
@@ -471,19 +551,22 @@ def recombine_geographic_chunks(self, chunks, task_id=None):
     metadata = {}
     chunk_data = []
     for index, chunk in enumerate(total_chunks):
-        metadata = task.combine_metadata(metadata, chunk[1])
+        metadata = task.combine_metadata(metadata, task.get_chunk_metadata(chunk[1]))
         current_chunk_data = xr.open_dataset(chunk[0])
         chunk_data.append(current_chunk_data)
     combined_data = combine_geographic_chunks(chunk_data)
 
     path = os.path.join(task.get_temp_path(), "recombined_geo_{}.nc".format(time_chunk_id))
-    export_xarray_to_netcdf(combined_data, path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(combined_data, path)
+        span.add_output(path)
     logger.info("Done combining geographic chunks for time: " + str(time_chunk_id))
-    return path, metadata, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
+    metadata_path = task.store_chunk_metadata(path, metadata)
+    return path, metadata_path, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
 
 
 @task(name="fractional_cover.create_output_products", base=BaseTask, bind=True)
-def create_output_products(self, data, task_id=None):
+def create_output_products(self, data, task_id=None, subset=False):
     """Create the final output products for this algorithm.
 
     Open the final dataset and metadata and generate all remaining metadata.
@@ -491,12 +574,13 @@ def create_output_products(self, data, task_id=None):
     Update status and exit.
 
     Args:
-        data: tuple in the format of processing_task function - path, metadata, and {chunk ids}
+        data: tuple in the format of processing_task function - path, metadata path, and {chunk ids}
+        subset: whether data was sliced from the result of a parent task - see slice_parent_result
     """
     task = FractionalCoverTask.objects.get(pk=task_id)
     if check_cancel_task(self, task): return
 
-    full_metadata = data[1]
+    full_metadata = task.get_chunk_metadata(data[1])
     dataset = xr.open_dataset(data[0])
 
     task.result_path = os.path.join(task.get_result_path(), "band_math.png")
@@ -505,29 +589,44 @@ def create_output_products(self, data, task_id=None):
     task.data_netcdf_path = os.path.join(task.get_result_path(), "data_netcdf.nc")
     task.final_metadata_from_dataset(dataset)
     task.metadata_from_dict(full_metadata)
+    if subset:
+        task.drop_acquisition_statistics()
 
     bands = task.satellite.get_measurements() + ['pv', 'npv', 'bs']
 
-    export_xarray_to_netcdf(dataset, task.data_netcdf_path)
-    write_geotiff_from_xr(task.data_path, dataset.astype('int32'), bands=bands, no_data=task.satellite.no_data_value)
-    write_png_from_xr(
-        task.mosaic_path,
-        dataset,
-        bands=['red', 'green', 'blue'],
-        scale=task.satellite.get_scale(),
-        no_data=task.satellite.no_data_value)
-    write_png_from_xr(task.result_path, dataset, bands=['bs', 'pv', 'npv'])
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(dataset, task.data_netcdf_path)
+        span.add_output(task.data_netcdf_path)
+    with trace_step("export") as span:
+        write_geotiff_from_xr(
+            task.data_path, dataset.astype('int32'), bands=bands, no_data=task.satellite.no_data_value)
+        span.add_output(task.data_path)
+    with trace_step("write_png") as span:
+        write_png_from_xr(
+            task.mosaic_path,
+            dataset,
+            bands=['red', 'green', 'blue'],
+            scale=task.satellite.get_scale(),
+            no_data=task.satellite.no_data_value)
+        span.add_output(task.mosaic_path)
+    with trace_step("write_png") as span:
+        write_png_from_xr(task.result_path, dataset, bands=['bs', 'pv', 'npv'])
+        span.add_output(task.result_path)
 
     dates = list(map(lambda x: datetime.strptime(x, "%m/%d/%Y"), task._get_field_as_list('acquisition_list')))
-    if len(dates) > 1:
-        task.plot_path = os.path.join(task.get_result_path(), "plot_path.png")
-        create_2d_plot(
+    if len(dates) > 1 and not subset:
+        task.plot_path = os.path.join(task.get_result_path(), "plot_data.json")
+        write_2d_plot_data(
             task.plot_path,
             dates=dates,
             datasets=task._get_field_as_list('clean_pixel_percentages_per_acquisition'),
             data_labels="Clean Pixel Percentage (%)",
             titles="Clean Pixel Percentage Per Acquisition")
 
+    # keep the final dataset so the task can be subset without reprocessing.
+    if not task.preview:
+        task.store_intermediate(data[0], full_metadata)
+
     logger.info("All products created.")
     # task.update_bounds_from_dataset(dataset)
     task.complete = True
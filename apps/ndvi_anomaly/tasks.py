@@ -14,12 +14,15 @@ from utils.data_cube_utilities.dc_utilities import (create_cfmask_clean_mask, cr
 from utils.data_cube_utilities.dc_chunker import (create_geographic_chunks, group_datetimes_by_month,
                                                   combine_geographic_chunks)
 from utils.data_cube_utilities.dc_ndvi_anomaly import compute_ndvi_anomaly
-from apps.dc_algorithm.utils import create_2d_plot
+from apps.dc_algorithm.utils import write_2d_plot_data, slice_dataset_to_extent
 from utils.data_cube_utilities.import_export import export_xarray_to_netcdf
 
 from .models import NdviAnomalyTask
 from apps.dc_algorithm.models import Satellite
-from apps.dc_algorithm.tasks import DCAlgorithmBase, check_cancel_task, task_clean_up
+from apps.dc_algorithm.tasks import DCAlgorithmBase, check_cancel_task, task_clean_up, combine_split_chunks
+from apps.dc_algorithm.scheduler import prioritize
+from apps.dc_algorithm.tracing import trace_step
+from apps.dc_algorithm.memory import split_chunk_over_memory_budget, get_planned_geographic_chunk_size
 
 logger = get_task_logger(__name__)
 
@@ -40,6 +43,47 @@ def run(task_id=None):
                  start_chunk_processing.s(task_id=task_id))()
 
 
+@task(name="ndvi_anomaly.subset", base=BaseTask)
+def subset(task_id=None, parent_id=None):
+    """Create the output products of a task by slicing the stored intermediate product of a parent task
+
+    See Query.is_subset_of for the requirements. No data is loaded from the Data Cube - the parent's
+    intermediate product is sliced to the task's bounds and passed directly to create_output_products.
+    """
+    return chain(slice_parent_result.s(task_id=task_id, parent_id=parent_id),
+                 create_output_products.s(task_id=task_id, subset=True),
+                 task_clean_up.si(task_id=task_id, task_model='NdviAnomalyTask'))()
+
+
+@task(name="ndvi_anomaly.slice_parent_result", base=BaseTask, bind=True)
+def slice_parent_result(self, task_id=None, parent_id=None):
+    """Slice the stored intermediate product of a parent task to the bounds of a task
+
+    The parent's metadata dict is reused for the acquisition list. Its per acquisition statistics describe the
+    parent's extent and can't be recomputed from the composited product, so create_output_products drops them.
+
+    Returns:
+        path to the sliced product, path to its metadata, and a dict containing the geo/time ids
+    """
+    task = NdviAnomalyTask.objects.get(pk=task_id)
+    parent = NdviAnomalyTask.objects.get(pk=parent_id)
+
+    task.execution_start = datetime.now()
+    if check_cancel_task(self, task): return
+    task.update_status("WAIT", "Slicing the result of an existing task.")
+
+    dataset = slice_dataset_to_extent(
+        parent.open_intermediate(),
+        latitude=(task.latitude_min, task.latitude_max),
+        longitude=(task.longitude_min, task.longitude_max))
+    path = os.path.join(task.get_temp_path(), "subset.nc")
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(dataset, path)
+        span.add_output(path)
+    metadata_path = task.store_chunk_metadata(path, parent.get_intermediate_metadata())
+    return path, metadata_path, {'geo_chunk_id': 0, 'time_chunk_id': 0}
+
+
 @task(name="ndvi_anomaly.parse_parameters_from_task", base=BaseTask, bind=True)
 def parse_parameters_from_task(self, task_id=None):
     """Parse out required DC parameters from the task model.
@@ -64,6 +108,8 @@ def parse_parameters_from_task(self, task_id=None):
         'measurements': task.satellite.get_measurements()
     }
 
+    parameters.update(task.get_preview_load_parameters())
+
     task.execution_start = datetime.now()
     if check_cancel_task(self, task): return
     task.update_status("WAIT", "Parsed out parameters.")
@@ -149,11 +195,6 @@ def perform_task_chunking(self, parameters, task_id=None):
     dc = DataAccessApi(config=task.config_path)
     task_chunk_sizing = task.get_chunk_size()
 
-    geographic_chunks = create_geographic_chunks(
-        longitude=parameters['longitude'],
-        latitude=parameters['latitude'],
-        geographic_chunk_size=task_chunk_sizing['geographic'])
-
     grouped_dates_params = {**parameters}
     grouped_dates_params.update({'time': (datetime(1000, 1, 1), task.time_start - timedelta(microseconds=1))})
     acquisitions = dc.list_acquisition_dates(**grouped_dates_params)
@@ -165,6 +206,11 @@ def perform_task_chunking(self, parameters, task_id=None):
     # time chunks casted to a list, essnetially.
     time_chunks = [time_chunks]
 
+    geographic_chunks = create_geographic_chunks(
+        longitude=parameters['longitude'],
+        latitude=parameters['latitude'],
+        geographic_chunk_size=get_planned_geographic_chunk_size(task, task_chunk_sizing, time_chunks[0]))
+
     logger.info("Time chunks: {}, Geo chunks: {}".format(len(time_chunks), len(geographic_chunks)))
 
     dc.close()
@@ -187,7 +233,6 @@ def start_chunk_processing(self, chunk_details, task_id=None):
     if chunk_details is None:
         return None
 
-    parameters = chunk_details.get('parameters')
     geographic_chunks = chunk_details.get('geographic_chunks')
     time_chunks = chunk_details.get('time_chunks')
 
@@ -198,6 +243,9 @@ def start_chunk_processing(self, chunk_details, task_id=None):
                                                                      if task.get_chunk_size()['time'] is not None else
                                                                      len(time_chunks[0]))
     task.scenes_processed = 0
+    # processing tasks read their parameters and chunks from the stored details rather than their messages.
+    task.store_chunk_details(chunk_details)
+
     if check_cancel_task(self, task): return
     task.update_status("WAIT", "Starting processing.")
 
@@ -208,13 +256,11 @@ def start_chunk_processing(self, chunk_details, task_id=None):
             processing_task.s(
                 task_id=task_id,
                 geo_chunk_id=geo_index,
-                time_chunk_id=time_index,
-                geographic_chunk=geographic_chunk,
-                time_chunk=time_chunk,
-                **parameters) for time_index, time_chunk in enumerate(time_chunks)
-        ]) for geo_index, geographic_chunk in enumerate(geographic_chunks)
+                time_chunk_id=time_index) for time_index in range(len(time_chunks))
+        ]) for geo_index in range(len(geographic_chunks))
     ]) | recombine_geographic_chunks.s(task_id=task_id) | create_output_products.s(task_id=task_id) \
-       | task_clean_up.si(task_id=task_id, task_model='NdviAnomalyTask')).apply_async()
+       | task_clean_up.si(task_id=task_id, task_model='NdviAnomalyTask'))
+    prioritize(processing_pipeline, task).apply_async()
 
     return True
 
@@ -225,12 +271,11 @@ def processing_task(self,
                     geo_chunk_id=None,
                     time_chunk_id=None,
                     geographic_chunk=None,
-                    time_chunk=None,
-                    **parameters):
+                    time_chunk=None):
     """Process a parameter set and save the results to disk.
 
     Uses the geographic and time chunk id to identify output products.
-    **params is updated with time and geographic ranges then used to load data.
+    The load parameters are read from the stored chunk details and updated with time and geographic ranges.
     the task model holds the iterative property that signifies whether the algorithm
     is iterative or if all data needs to be loaded at once.
 
@@ -238,10 +283,9 @@ def processing_task(self,
         task_id, geo_chunk_id, time_chunk_id: identification for the main task and what chunk this is processing
         geographic_chunk: range of latitude and longitude to load - dict with keys latitude, longitude
         time_chunk: list of acquisition dates
-        parameters: all required kwargs to load data.
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
     """
     chunk_id = "_".join([str(geo_chunk_id), str(time_chunk_id)])
     task = NdviAnomalyTask.objects.get(pk=task_id)
@@ -251,6 +295,22 @@ def processing_task(self,
     if not os.path.exists(task.get_temp_path()):
         return None
 
+    geographic_chunk, time_chunk, parameters = task.get_chunk_parameters(
+        geo_chunk_id, time_chunk_id, geographic_chunk=geographic_chunk)
+
+    # over budget chunks are processed as smaller chunks that are combined before recombination.
+    geographic_chunks = split_chunk_over_memory_budget(task, geographic_chunk, time_chunk, parameters)
+    if geographic_chunks is not None:
+        return self.replace(
+            group([
+                processing_task.s(
+                    task_id=task_id,
+                    geo_chunk_id="{}.{}".format(geo_chunk_id, index),
+                    time_chunk_id=time_chunk_id,
+                    geographic_chunk=split_chunk) for index, split_chunk in enumerate(geographic_chunks)
+            ]) | combine_split_chunks.s(
+                task_id=task_id, app_name='ndvi_anomaly', geo_chunk_id=geo_chunk_id, time_chunk_id=time_chunk_id))
+
     metadata = {}
 
     def _get_datetime_range_containing(*time_ranges):
@@ -266,7 +326,9 @@ def processing_task(self,
     full_dataset = []
     for time_index, time in enumerate(time_chunk):
         updated_params.update({'time': _get_datetime_range_containing(time)})
-        data = dc.get_dataset_by_extent(**updated_params)
+        with trace_step("load") as span:
+            data = dc.get_dataset_by_extent(**updated_params)
+            span.add_input(data)
 
         if check_cancel_task(self, task): return
 
@@ -277,7 +339,9 @@ def processing_task(self,
 
     # load selected scene and mosaic just in case we got two scenes (handles scene boundaries/overlapping data)
     updated_params.update({'time': base_scene_time_range})
-    selected_scene = dc.get_dataset_by_extent(**updated_params)
+    with trace_step("load") as span:
+        selected_scene = dc.get_dataset_by_extent(**updated_params)
+        span.add_input(selected_scene)
 
     if check_cancel_task(self, task): return
 
@@ -291,10 +355,11 @@ def processing_task(self,
 
     selected_scene_clear_mask = task.satellite.get_clean_mask_func()(selected_scene)
     metadata = task.metadata_from_dataset(metadata, selected_scene, selected_scene_clear_mask, parameters)
-    selected_scene = task.get_processing_method()(selected_scene,
-                                                  clean_mask=selected_scene_clear_mask,
-                                                  intermediate_product=None,
-                                                  no_data=task.satellite.no_data_value)
+    with trace_step("process"):
+        selected_scene = task.get_processing_method()(selected_scene,
+                                                      clean_mask=selected_scene_clear_mask,
+                                                      intermediate_product=None,
+                                                      no_data=task.satellite.no_data_value)
     # we need to re generate the clear mask using the mosaic now.
     selected_scene_clear_mask = task.satellite.get_clean_mask_func()(selected_scene)
 
@@ -312,10 +377,13 @@ def processing_task(self,
     task.save(update_fields=['scenes_processed'])
 
     path = os.path.join(task.get_temp_path(), chunk_id + ".nc")
-    export_xarray_to_netcdf(full_product, path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(full_product, path)
+        span.add_output(path)
     dc.close()
     logger.info("Done with chunk: " + chunk_id)
-    return path, metadata, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
+    metadata_path = task.store_chunk_metadata(path, metadata)
+    return path, metadata_path, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
 
 
 @task(name="ndvi_anomaly.recombine_geographic_chunks", base=BaseTask, bind=True)
@@ -326,10 +394,10 @@ def recombine_geographic_chunks(self, chunks, task_id=None):
     and combine it into a single dataset. Combine metadata as well, writing to disk.
 
     Args:
-        chunks: list of the return from the processing_task function - path, metadata, and {chunk ids}
+        chunks: list of the return from the processing_task function - path, metadata path, and {chunk ids}
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
     """
     logger.info("recombine_geographic_chunks() begin!")
 
@@ -344,18 +412,21 @@ def recombine_geographic_chunks(self, chunks, task_id=None):
     metadata = {}
     chunk_data = []
     for index, chunk in enumerate(total_chunks):
-        metadata = task.combine_metadata(metadata, chunk[1])
+        metadata = task.combine_metadata(metadata, task.get_chunk_metadata(chunk[1]))
         chunk_data.append(xr.open_dataset(chunk[0]))
     combined_data = combine_geographic_chunks(chunk_data)
 
     path = os.path.join(task.get_temp_path(), "recombined_geo_{}.nc".format(time_chunk_id))
-    export_xarray_to_netcdf(combined_data, path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(combined_data, path)
+        span.add_output(path)
     logger.info("Done combining geographic chunks for time: " + str(time_chunk_id))
-    return path, metadata, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
+    metadata_path = task.store_chunk_metadata(path, metadata)
+    return path, metadata_path, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
 
 
 @task(name="ndvi_anomaly.create_output_products", base=BaseTask, bind=True)
-def create_output_products(self, data, task_id=None):
+def create_output_products(self, data, task_id=None, subset=False):
     """Create the final output products for this algorithm.
 
     Open the final dataset and metadata and generate all remaining metadata.
@@ -363,12 +434,13 @@ def create_output_products(self, data, task_id=None):
     Update status and exit.
 
     Args:
-        data: tuple in the format of processing_task function - path, metadata, and {chunk ids}
+        data: tuple in the format of processing_task function - path, metadata path, and {chunk ids}
+        subset: whether data was sliced from the result of a parent task - see slice_parent_result
     """
     task = NdviAnomalyTask.objects.get(pk=task_id)
     if check_cancel_task(self, task): return
 
-    full_metadata = data[1]
+    full_metadata = task.get_chunk_metadata(data[1])
     dataset = xr.open_dataset(data[0])
 
     task.result_path = os.path.join(task.get_result_path(), "ndvi_difference.png")
@@ -380,54 +452,75 @@ def create_output_products(self, data, task_id=None):
     task.data_netcdf_path = os.path.join(task.get_result_path(), "data_netcdf.nc")
     task.final_metadata_from_dataset(dataset)
     task.metadata_from_dict(full_metadata)
+    if subset:
+        task.drop_acquisition_statistics()
 
     bands = task.satellite.get_measurements() + ['scene_ndvi', 'baseline_ndvi',
                                                  'ndvi_difference', 'ndvi_percentage_change']
 
-    export_xarray_to_netcdf(dataset, task.data_netcdf_path)
-
-    write_geotiff_from_xr(task.data_path, dataset.astype('float64'), bands=bands, no_data=task.satellite.no_data_value)
-    write_single_band_png_from_xr(
-        task.result_path,
-        dataset,
-        'ndvi_difference',
-        color_scale=task.color_scales['ndvi_difference'],
-        no_data=task.satellite.no_data_value)
-    write_single_band_png_from_xr(
-        task.ndvi_percentage_change_path,
-        dataset,
-        'ndvi_percentage_change',
-        color_scale=task.color_scales['ndvi_percentage_change'],
-        no_data=task.satellite.no_data_value)
-    write_single_band_png_from_xr(
-        task.scene_ndvi_path,
-        dataset,
-        'scene_ndvi',
-        color_scale=task.color_scales['scene_ndvi'],
-        no_data=task.satellite.no_data_value)
-    write_single_band_png_from_xr(
-        task.baseline_ndvi_path,
-        dataset,
-        'baseline_ndvi',
-        color_scale=task.color_scales['baseline_ndvi'],
-        no_data=task.satellite.no_data_value)
-    write_png_from_xr(
-        task.result_mosaic_path,
-        dataset,
-        bands=['red', 'green', 'blue'],
-        scale=task.satellite.get_scale(),
-        no_data=task.satellite.no_data_value)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(dataset, task.data_netcdf_path)
+        span.add_output(task.data_netcdf_path)
+
+    with trace_step("export") as span:
+        write_geotiff_from_xr(
+            task.data_path, dataset.astype('float64'), bands=bands, no_data=task.satellite.no_data_value)
+        span.add_output(task.data_path)
+    with trace_step("write_png") as span:
+        write_single_band_png_from_xr(
+            task.result_path,
+            dataset,
+            'ndvi_difference',
+            color_scale=task.color_scales['ndvi_difference'],
+            no_data=task.satellite.no_data_value)
+        span.add_output(task.result_path)
+    with trace_step("write_png") as span:
+        write_single_band_png_from_xr(
+            task.ndvi_percentage_change_path,
+            dataset,
+            'ndvi_percentage_change',
+            color_scale=task.color_scales['ndvi_percentage_change'],
+            no_data=task.satellite.no_data_value)
+        span.add_output(task.ndvi_percentage_change_path)
+    with trace_step("write_png") as span:
+        write_single_band_png_from_xr(
+            task.scene_ndvi_path,
+            dataset,
+            'scene_ndvi',
+            color_scale=task.color_scales['scene_ndvi'],
+            no_data=task.satellite.no_data_value)
+        span.add_output(task.scene_ndvi_path)
+    with trace_step("write_png") as span:
+        write_single_band_png_from_xr(
+            task.baseline_ndvi_path,
+            dataset,
+            'baseline_ndvi',
+            color_scale=task.color_scales['baseline_ndvi'],
+            no_data=task.satellite.no_data_value)
+        span.add_output(task.baseline_ndvi_path)
+    with trace_step("write_png") as span:
+        write_png_from_xr(
+            task.result_mosaic_path,
+            dataset,
+            bands=['red', 'green', 'blue'],
+            scale=task.satellite.get_scale(),
+            no_data=task.satellite.no_data_value)
+        span.add_output(task.result_mosaic_path)
 
     dates = list(map(lambda x: datetime.strptime(x, "%m/%d/%Y"), task._get_field_as_list('acquisition_list')))
-    if len(dates) > 1:
-        task.plot_path = os.path.join(task.get_result_path(), "plot_path.png")
-        create_2d_plot(
+    if len(dates) > 1 and not subset:
+        task.plot_path = os.path.join(task.get_result_path(), "plot_data.json")
+        write_2d_plot_data(
             task.plot_path,
             dates=dates,
             datasets=task._get_field_as_list('clean_pixel_percentages_per_acquisition'),
             data_labels="Clean Pixel Percentage (%)",
             titles="Clean Pixel Percentage Per Acquisition")
 
+    # keep the final dataset so the task can be subset without reprocessing.
+    if not task.preview:
+        task.store_intermediate(data[0], full_metadata)
+
     logger.info("All products created.")
     # task.update_bounds_from_dataset(dataset)
     task.complete = True
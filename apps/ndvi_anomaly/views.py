@@ -32,12 +32,13 @@ import datetime
 from apps.dc_algorithm.models import Satellite, Area, Application
 from apps.dc_algorithm.forms import DataSelectionForm
 from .forms import AdditionalOptionsForm
-from .tasks import run
+from .tasks import run, subset
 
 from collections import OrderedDict
 
-from apps.dc_algorithm.views import (ToolView, SubmitNewRequest, GetTaskResult, SubmitNewSubsetRequest, CancelRequest,
-                                     UserHistory, ResultList, OutputList, RegionSelection, TaskDetails)
+from apps.dc_algorithm.views import (ToolView, SubmitNewRequest, EstimateTaskCost, GetTaskResult, GetTaskPlotData,
+                                     SubmitNewSubsetRequest, CancelRequest, UserHistory, ResultList, OutputList,
+                                     RegionSelection, TaskDetails)
 
 from apps.dc_algorithm.forms import MAX_NUM_YEARS
 
@@ -105,6 +106,19 @@ class SubmitNewRequest(SubmitNewRequest):
     form_list = [DataSelectionForm, AdditionalOptionsForm]
 
 
+class EstimateTaskCost(EstimateTaskCost):
+    """
+    Estimate task cost REST API Endpoint
+    Extends the EstimateTaskCost abstract class - required attributes are the tool_name,
+    task_model_name, and form_list
+
+    See the dc_algorithm.views docstrings for more information.
+    """
+    tool_name = 'ndvi_anomaly'
+    task_model_name = 'NdviAnomalyTask'
+    form_list = [DataSelectionForm, AdditionalOptionsForm]
+
+
 class GetTaskResult(GetTaskResult):
     """
     Get task result REST API endpoint
@@ -117,6 +131,18 @@ class GetTaskResult(GetTaskResult):
     task_model_name = 'NdviAnomalyTask'
 
 
+class GetTaskPlotData(GetTaskPlotData):
+    """
+    Get task plot data REST API endpoint
+    Extends the GetTaskPlotData abstract class, required attributes are the tool_name
+    and task_model_name
+
+    See the dc_algorithm.views docstrings for more information.
+    """
+    tool_name = 'ndvi_anomaly'
+    task_model_name = 'NdviAnomalyTask'
+
+
 class SubmitNewSubsetRequest(SubmitNewSubsetRequest):
     """
     Submit new subset request REST API endpoint
@@ -129,6 +155,7 @@ class SubmitNewSubsetRequest(SubmitNewSubsetRequest):
     task_model_name = 'NdviAnomalyTask'
 
     celery_task_func = run
+    subset_task_func = subset
 
     def task_model_update_func(self, task_model, **kwargs):
         """
@@ -17,15 +17,14 @@ from utils.data_cube_utilities.dc_utilities import (create_cfmask_clean_mask, cr
 from utils.data_cube_utilities.dc_chunker import (create_geographic_chunks, create_time_chunks,
                                                   combine_geographic_chunks)
 from utils.data_cube_utilities.clean_mask import landsat_clean_mask_invalid
-from apps.dc_algorithm.utils import create_2d_plot
+from apps.dc_algorithm.utils import write_2d_plot_data
 from utils.data_cube_utilities.import_export import export_xarray_to_netcdf
 
 from .models import SpectralAnomalyTask
 from apps.dc_algorithm.models import Satellite
 from apps.dc_algorithm.tasks import DCAlgorithmBase, check_cancel_task, task_clean_up
-
-import matplotlib.pyplot as plt
-import matplotlib as mpl
+from apps.dc_algorithm.scheduler import prioritize
+from apps.dc_algorithm.tracing import trace_step
 
 from utils.data_cube_utilities.dc_ndvi_anomaly import NDVI, EVI
 from utils.data_cube_utilities.dc_water_classifier import NDWI
@@ -97,6 +96,8 @@ def parse_parameters_from_task(self, task_id=None):
         'change_range': (task.change_threshold_min, task.change_threshold_max),
     }
 
+    parameters.update(task.get_preview_load_parameters())
+
     task.execution_start = datetime.now()
     if check_cancel_task(self, task): return
     task.update_status("WAIT", "Parsed out parameters.")
@@ -240,6 +241,9 @@ def start_chunk_processing(self, chunk_details, task_id=None):
     task.scenes_processed = 0
     task.save(update_fields=['total_scenes', 'scenes_processed'])
 
+    # processing tasks read their parameters and chunks from the stored details rather than their messages.
+    task.store_chunk_details(chunk_details)
+
     if check_cancel_task(self, task): return
     task.update_status("WAIT", "Starting processing.")
 
@@ -247,11 +251,10 @@ def start_chunk_processing(self, chunk_details, task_id=None):
             processing_task.s(
                 task_id=task_id,
                 geo_chunk_id=geo_index,
-                geographic_chunk=geographic_chunk,
-                num_scn_per_chk=num_scn_per_chk_geo,
-                **parameters) for geo_index, geographic_chunk in enumerate(geographic_chunks)
+                num_scn_per_chk=num_scn_per_chk_geo) for geo_index in range(len(geographic_chunks))
     ]) | recombine_geographic_chunks.s(task_id=task_id) | create_output_products.s(task_id=task_id) \
-       | task_clean_up.si(task_id=task_id, task_model='SpectralAnomalyTask')).apply_async()
+       | task_clean_up.si(task_id=task_id, task_model='SpectralAnomalyTask'))
+    prioritize(processing_pipeline, task).apply_async()
 
     return True
 
@@ -261,12 +264,11 @@ def processing_task(self,
                     task_id=None,
                     geo_chunk_id=None,
                     geographic_chunk=None,
-                    num_scn_per_chk=None,
-                    **parameters):
+                    num_scn_per_chk=None):
     """Process a parameter set and save the results to disk.
 
     Uses the geographic and time chunk id to identify output products.
-    **params is updated with time and geographic ranges then used to load data.
+    The load parameters are read from the stored chunk details and updated with time and geographic ranges.
     the task model holds the iterative property that signifies whether the algorithm
     is iterative or if all data needs to be loaded at once.
 
@@ -275,10 +277,9 @@ def processing_task(self,
         geographic_chunk: range of latitude and longitude to load - dict with keys latitude, longitude
         num_scn_per_chk: A dictionary of the number of scenes per chunk for the baseline
                          and analysis extents. Used to determine task progress.
-        parameters: all required kwargs to load data.
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
     """
     chunk_id = str(geo_chunk_id)
     task = SpectralAnomalyTask.objects.get(pk=task_id)
@@ -287,6 +288,8 @@ def processing_task(self,
     if not os.path.exists(task.get_temp_path()):
         return None
 
+    geographic_chunk, _, parameters = task.get_chunk_parameters(geo_chunk_id, geographic_chunk=geographic_chunk)
+
     metadata = {}
 
     # For both the baseline and analysis time ranges for this
@@ -307,7 +310,9 @@ def processing_task(self,
         # Use the corresponding time range for the baseline and analysis data.
         updated_params['time'] = \
             updated_params['baseline_time' if composite_name == 'baseline' else 'analysis_time']
-        time_column_data = dc.get_dataset_by_extent(**updated_params)
+        with trace_step("load") as span:
+            time_column_data = dc.get_dataset_by_extent(**updated_params)
+            span.add_input(time_column_data)
         # If this geographic chunk is outside the data extents, return None.
         if len(time_column_data.dims) == 0: return None
 
@@ -322,9 +327,10 @@ def processing_task(self,
         time_column_clean_mask = time_column_clean_mask | time_column_invalid_mask | no_data_mask
 
         # Obtain the composite.
-        composite = task.get_processing_method()(time_column_data,
-                                                 clean_mask=time_column_clean_mask,
-                                                 no_data=task.satellite.no_data_value)
+        with trace_step("process"):
+            composite = task.get_processing_method()(time_column_data,
+                                                     clean_mask=time_column_clean_mask,
+                                                     no_data=task.satellite.no_data_value)
         # Obtain the mask for valid Landsat values.
         composite_invalid_mask = landsat_clean_mask_invalid(composite).values
         # Also exclude data points with the no_data value via the compositing mask.
@@ -412,14 +418,21 @@ def processing_task(self,
     if check_cancel_task(self, task): return
 
     composite_path = os.path.join(task.get_temp_path(), chunk_id + ".nc")
-    export_xarray_to_netcdf(diff_composite, composite_path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(diff_composite, composite_path)
+        span.add_output(composite_path)
     composite_out_of_range_path = os.path.join(task.get_temp_path(), chunk_id + "_out_of_range.nc")
     logger.info("composite_out_of_range:" + str(composite_out_of_range))
-    export_xarray_to_netcdf(composite_out_of_range, composite_out_of_range_path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(composite_out_of_range, composite_out_of_range_path)
+        span.add_output(composite_out_of_range_path)
     composite_no_data_path = os.path.join(task.get_temp_path(), chunk_id + "_no_data.nc")
-    export_xarray_to_netcdf(composite_no_data, composite_no_data_path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(composite_no_data, composite_no_data_path)
+        span.add_output(composite_no_data_path)
+    metadata_path = task.store_chunk_metadata(composite_path, metadata)
     return composite_path, composite_out_of_range_path, composite_no_data_path, \
-           metadata, {'geo_chunk_id': geo_chunk_id}
+           metadata_path, {'geo_chunk_id': geo_chunk_id}
 
 
 @task(name="spectral_anomaly.recombine_geographic_chunks", base=BaseTask, bind=True)
@@ -430,10 +443,10 @@ def recombine_geographic_chunks(self, chunks, task_id=None):
     and combine it into a single dataset. Combine metadata as well, writing to disk.
 
     Args:
-        chunks: list of the return from the processing_task function - path, metadata, and {chunk ids}
+        chunks: list of the return from the processing_task function - path, metadata path, and {chunk ids}
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
     """
     total_chunks = [chunks] if not isinstance(chunks, list) else chunks
     total_chunks = [chunk for chunk in total_chunks if chunk is not None]
@@ -447,7 +460,7 @@ def recombine_geographic_chunks(self, chunks, task_id=None):
     out_of_range_chunk_data = []
     no_data_chunk_data = []
     for index, chunk in enumerate(total_chunks):
-        metadata = task.combine_metadata(metadata, chunk[3])
+        metadata = task.combine_metadata(metadata, task.get_chunk_metadata(chunk[3]))
         composite_chunk_data.append(xr.open_dataset(chunk[0]))
         out_of_range_chunk_data.append(xr.open_dataset(chunk[1]))
         no_data_chunk_data.append(xr.open_dataset(chunk[2]))
@@ -457,12 +470,19 @@ def recombine_geographic_chunks(self, chunks, task_id=None):
     combined_no_data = combine_geographic_chunks(no_data_chunk_data)
 
     composite_path = os.path.join(task.get_temp_path(), "full_composite.nc")
-    export_xarray_to_netcdf(combined_composite_data, composite_path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(combined_composite_data, composite_path)
+        span.add_output(composite_path)
     composite_out_of_range_path = os.path.join(task.get_temp_path(), "full_composite_out_of_range.nc")
-    export_xarray_to_netcdf(combined_out_of_range_data, composite_out_of_range_path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(combined_out_of_range_data, composite_out_of_range_path)
+        span.add_output(composite_out_of_range_path)
     no_data_path = os.path.join(task.get_temp_path(), "full_composite_no_data.nc")
-    export_xarray_to_netcdf(combined_no_data, no_data_path)
-    return composite_path, composite_out_of_range_path, no_data_path, metadata
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(combined_no_data, no_data_path)
+        span.add_output(no_data_path)
+    metadata_path = task.store_chunk_metadata(composite_path, metadata)
+    return composite_path, composite_out_of_range_path, no_data_path, metadata_path
 
 
 @task(name="spectral_anomaly.create_output_products", base=BaseTask, bind=True)
@@ -474,9 +494,15 @@ def create_output_products(self, data, task_id=None):
     Update status and exit.
 
     Args:
-        data: tuple in the format of processing_task function - path, metadata, and {chunk ids}
+        data: tuple in the format of processing_task function - path, metadata path, and {chunk ids}
 
     """
+    # matplotlib is only used for the colour mapping below, so avoid importing it when workers start.
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import matplotlib as mpl
+
     if data is None: return None
 
     task = SpectralAnomalyTask.objects.get(pk=task_id)
@@ -484,7 +510,7 @@ def create_output_products(self, data, task_id=None):
 
     spectral_index = task.query_type.result_id
 
-    full_metadata = data[3]
+    full_metadata = task.get_chunk_metadata(data[3])
     # This is the difference (or "change") composite.
     diff_composite = xr.open_dataset(data[0])
     # This indicates where either the baseline or analysis composite
@@ -547,16 +573,22 @@ def create_output_products(self, data, task_id=None):
     image_data[composite_no_data] = composite_no_data_color
 
     # Create output products (NetCDF, GeoTIFF, PNG).
-    export_xarray_to_netcdf(diff_composite, task.data_netcdf_path)
-    write_geotiff_from_xr(task.data_path, diff_composite.astype('float32'),
-                          bands=bands, no_data=task.satellite.no_data_value)
-    plt.imsave(task.result_path, image_data)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(diff_composite, task.data_netcdf_path)
+        span.add_output(task.data_netcdf_path)
+    with trace_step("export") as span:
+        write_geotiff_from_xr(task.data_path, diff_composite.astype('float32'),
+                              bands=bands, no_data=task.satellite.no_data_value)
+        span.add_output(task.data_path)
+    with trace_step("write_png") as span:
+        plt.imsave(task.result_path, image_data)
+        span.add_output(task.result_path)
 
     # Plot metadata.
     dates = list(map(lambda x: datetime.strptime(x, "%m/%d/%Y"), task._get_field_as_list('acquisition_list')))
     if len(dates) > 1:
-        task.plot_path = os.path.join(task.get_result_path(), "plot_path.png")
-        create_2d_plot(
+        task.plot_path = os.path.join(task.get_result_path(), "plot_data.json")
+        write_2d_plot_data(
             task.plot_path,
             dates=dates,
             datasets=task._get_field_as_list('clean_pixel_percentages_per_acquisition'),
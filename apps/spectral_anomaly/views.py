@@ -35,9 +35,9 @@ from .tasks import run
 
 from collections import OrderedDict
 
-from apps.dc_algorithm.views import (ToolView, SubmitNewRequest, SubmitPixelDrillRequest, SubmitPixelDrillRequest,
-                                     GetTaskResult, SubmitNewSubsetRequest, CancelRequest, UserHistory, ResultList,
-                                     OutputList, RegionSelection, TaskDetails)
+from apps.dc_algorithm.views import (ToolView, SubmitNewRequest, EstimateTaskCost, SubmitPixelDrillRequest,
+                                     SubmitPixelDrillRequest, GetTaskResult, GetTaskPlotData, SubmitNewSubsetRequest,
+                                     CancelRequest, UserHistory, ResultList, OutputList, RegionSelection, TaskDetails)
 
 from apps.dc_algorithm.forms import MAX_NUM_YEARS
 
@@ -122,6 +122,19 @@ class SubmitNewRequest(SubmitNewRequest):
         parameter_set['time_end'] = max(date_list)
 
 
+class EstimateTaskCost(EstimateTaskCost):
+    """
+    Estimate task cost REST API Endpoint
+    Extends the EstimateTaskCost abstract class - required attributes are the tool_name,
+    task_model_name, and form_list
+
+    See the dc_algorithm.views docstrings for more information.
+    """
+    tool_name = 'spectral_anomaly'
+    task_model_name = 'SpectralAnomalyTask'
+    form_list = [DataSelectionForm, AdditionalOptionsForm]
+
+
 class GetTaskResult(GetTaskResult):
     """
     Get task result REST API endpoint
@@ -134,6 +147,18 @@ class GetTaskResult(GetTaskResult):
     task_model_name = 'SpectralAnomalyTask'
 
 
+class GetTaskPlotData(GetTaskPlotData):
+    """
+    Get task plot data REST API endpoint
+    Extends the GetTaskPlotData abstract class, required attributes are the tool_name
+    and task_model_name
+
+    See the dc_algorithm.views docstrings for more information.
+    """
+    tool_name = 'spectral_anomaly'
+    task_model_name = 'SpectralAnomalyTask'
+
+
 class SubmitNewSubsetRequest(SubmitNewSubsetRequest):
     """
     Submit new subset request REST API endpoint
@@ -26,10 +26,12 @@ from . import views
 urlpatterns = [
     url(r'^region_selection', views.RegionSelection.as_view(), name='region_selection'),
     url(r'^submit$', views.SubmitNewRequest.as_view(), name='submit_new_request'),
+    url(r'^estimate$', views.EstimateTaskCost.as_view(), name='estimate_task_cost'),
     url(r'^submit_pixel_drill_request$', views.SubmitPixelDrillRequest.as_view(), name='submit_pixel_drill_request'),
     url(r'^submit_single$', views.SubmitNewSubsetRequest.as_view(), name='submit_new_single_request'),
     url(r'^cancel$', views.CancelRequest.as_view(), name='cancel_request'),
     url(r'^result$', views.GetTaskResult.as_view(), name='get_result'),
+    url(r'^plot_data$', views.GetTaskPlotData.as_view(), name='get_plot_data'),
     url(r'^task_details/(?P<uuid>[^/]+)', views.TaskDetails.as_view(), name='get_task_details'),
     url(r'^(?P<area_id>[\w\-]+)/task_history$', views.UserHistory.as_view(), name='get_task_history'),
     url(r'^(?P<area_id>[\w\-]+)/results_list$', views.ResultList.as_view(), name='get_results_list'),
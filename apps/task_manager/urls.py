@@ -29,5 +29,7 @@ from . import views
 # Last modified date:
 
 urlpatterns = [
+    url(r'^metrics$', views.get_metrics, name='get_metrics'),
+    url(r'^(?P<app_id>[\w\-]+)/timeline/(?P<task_id>[\w\-]+)$', views.get_task_timeline, name='get_task_timeline'),
     url(r'^(?P<app_id>[\w\-]+)', views.get_task_manager, name='get_task_manager'),
 ]
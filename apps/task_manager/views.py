@@ -19,12 +19,14 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-from django.shortcuts import render
+from django.shortcuts import render, get_object_or_404
 from django.template import loader, RequestContext
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse, JsonResponse
 from django.apps import apps
 
+from apps.dc_algorithm import tracing
+
 
 def get_task_manager(request, app_id):
     """
@@ -59,3 +61,40 @@ def get_task_manager(request, app_id):
     }
 
     return render(request, 'task_manager/task_manager.html', context)
+
+
+def get_task_timeline(request, app_id, task_id):
+    """
+    View method for rendering the timeline of pipeline stages and steps recorded for a task.
+
+    **Context**
+
+    ``task``
+        The task model instance.
+    ``timeline``
+        List of dicts containing a TaskSpan and its offset and width as percentages of the task's duration.
+    ``application_id``
+        The app id used to build links.
+
+    **Template**
+
+    :template:`task_manager/task_timeline.html`
+    """
+
+    app_id_camel_case = "".join(x.title() for x in app_id.split('_'))
+
+    task_model = apps.get_model(".".join([app_id, app_id_camel_case + "Task"]))
+    task = get_object_or_404(task_model, pk=task_id)
+
+    context = {
+        'task': task,
+        'timeline': tracing.get_task_timeline(app_id, task_id),
+        'application_id': app_id,
+    }
+
+    return render(request, 'task_manager/task_timeline.html', context)
+
+
+def get_metrics(request):
+    """Export the recorded pipeline spans in the Prometheus text exposition format"""
+    return HttpResponse(tracing.get_prometheus_metrics(), content_type="text/plain; version=0.0.4")
@@ -16,12 +16,16 @@ from utils.data_cube_utilities.dc_utilities import (
 from utils.data_cube_utilities.dc_chunker import (create_geographic_chunks, create_time_chunks,
                                                   combine_geographic_chunks)
 from utils.data_cube_utilities.dc_water_quality import tsm, mask_water_quality
-from apps.dc_algorithm.utils import create_2d_plot
+from apps.dc_algorithm.utils import (write_2d_plot_data, get_pixel_time_series, pixel_time_series_cache,
+                                     slice_dataset_to_extent)
 from utils.data_cube_utilities.import_export import export_xarray_to_netcdf
 
 from .models import TsmTask
 from apps.dc_algorithm.models import Satellite
-from apps.dc_algorithm.tasks import DCAlgorithmBase, check_cancel_task, task_clean_up
+from apps.dc_algorithm.tasks import DCAlgorithmBase, check_cancel_task, task_clean_up, combine_split_chunks
+from apps.dc_algorithm.scheduler import prioritize
+from apps.dc_algorithm.tracing import trace_step
+from apps.dc_algorithm.memory import split_chunk_over_memory_budget, get_planned_geographic_chunk_size
 
 logger = get_task_logger(__name__)
 
@@ -30,7 +34,7 @@ class BaseTask(DCAlgorithmBase):
     app_name = 'tsm'
 
 
-@task(name="tsm.pixel_drill", base=BaseTask)
+@task(name="tsm.pixel_drill", base=BaseTask, queue="pixel_drill")
 def pixel_drill(task_id=None):
     parameters = parse_parameters_from_task(task_id=task_id)
     validate_parameters(parameters, task_id=task_id)
@@ -40,7 +44,13 @@ def pixel_drill(task_id=None):
         return None
 
     dc = DataAccessApi(config=task.config_path)
-    single_pixel = dc.get_stacked_datasets_by_extent(**parameters)
+    single_pixel = get_pixel_time_series(dc.dc, cache=pixel_time_series_cache, **task.get_point_query_parameters())
+    dc.close()
+    if single_pixel is None:
+        task.complete = True
+        task.update_status("ERROR", "There are no acquistions for this parameter set.")
+        return None
+
     clear_mask = task.satellite.get_clean_mask_func()(single_pixel.isel(latitude=0, longitude=0))
     single_pixel = single_pixel.where(single_pixel != task.satellite.no_data_value)
 
@@ -49,10 +59,11 @@ def pixel_drill(task_id=None):
         task.update_status("ERROR", "There is only a single acquisition for your parameter set.")
         return None
 
-    wofs_data = task.get_processing_method()(single_pixel,
-                                             clean_mask=clear_mask,
-                                             enforce_float64=True,
-                                             no_data=task.satellite.no_data_value)
+    with trace_step("process"):
+        wofs_data = task.get_processing_method()(single_pixel,
+                                                 clean_mask=clear_mask,
+                                                 enforce_float64=True,
+                                                 no_data=task.satellite.no_data_value)
     wofs_data = wofs_data.where(wofs_data != task.satellite.no_data_value).isel(latitude=0, longitude=0)
     tsm_data = tsm(single_pixel, clean_mask=clear_mask, no_data=task.satellite.no_data_value)
     tsm_data = tsm_data.where(tsm_data != task.satellite.no_data_value).isel(
@@ -70,8 +81,9 @@ def pixel_drill(task_id=None):
     titles = ["Water/Non Water", "TSM Values"] + ["Clear Mask"]
     style = ['.', 'ro', '.']
 
-    task.plot_path = os.path.join(task.get_result_path(), "plot_path.png")
-    create_2d_plot(task.plot_path, dates=dates, datasets=datasets, data_labels=data_labels, titles=titles, style=style)
+    task.plot_path = os.path.join(task.get_result_path(), "plot_data.json")
+    write_2d_plot_data(
+        task.plot_path, dates=dates, datasets=datasets, data_labels=data_labels, titles=titles, style=style)
 
     task.complete = True
     task.update_status("OK", "Done processing pixel drill.")
@@ -89,6 +101,47 @@ def run(task_id=None):
                  start_chunk_processing.s(task_id=task_id))()
 
 
+@task(name="tsm.subset", base=BaseTask)
+def subset(task_id=None, parent_id=None):
+    """Create the output products of a task by slicing the stored intermediate product of a parent task
+
+    See Query.is_subset_of for the requirements. No data is loaded from the Data Cube - the parent's
+    intermediate product is sliced to the task's bounds and passed directly to create_output_products.
+    """
+    return chain(slice_parent_result.s(task_id=task_id, parent_id=parent_id),
+                 create_output_products.s(task_id=task_id, subset=True),
+                 task_clean_up.si(task_id=task_id, task_model='TsmTask'))()
+
+
+@task(name="tsm.slice_parent_result", base=BaseTask, bind=True)
+def slice_parent_result(self, task_id=None, parent_id=None):
+    """Slice the stored intermediate product of a parent task to the bounds of a task
+
+    The parent's metadata dict is reused for the acquisition list. Its per acquisition statistics describe the
+    parent's extent and can't be recomputed from the composited product, so create_output_products drops them.
+
+    Returns:
+        path to the sliced product, path to its metadata, and a dict containing the geo/time ids
+    """
+    task = TsmTask.objects.get(pk=task_id)
+    parent = TsmTask.objects.get(pk=parent_id)
+
+    task.execution_start = datetime.now()
+    if check_cancel_task(self, task): return
+    task.update_status("WAIT", "Slicing the result of an existing task.")
+
+    dataset = slice_dataset_to_extent(
+        parent.open_intermediate(),
+        latitude=(task.latitude_min, task.latitude_max),
+        longitude=(task.longitude_min, task.longitude_max))
+    path = os.path.join(task.get_temp_path(), "subset.nc")
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(dataset, path)
+        span.add_output(path)
+    metadata_path = task.store_chunk_metadata(path, parent.get_intermediate_metadata())
+    return path, metadata_path, {'geo_chunk_id': 0, 'time_chunk_id': 0}
+
+
 @task(name="tsm.parse_parameters_from_task", base=BaseTask, bind=True)
 def parse_parameters_from_task(self, task_id=None):
     """Parse out required DC parameters from the task model.
@@ -113,6 +166,8 @@ def parse_parameters_from_task(self, task_id=None):
         'measurements': task.satellite.get_measurements()
     }
 
+    parameters.update(task.get_preview_load_parameters())
+
     task.execution_start = datetime.now()
     if check_cancel_task(self, task): return
     task.update_status("WAIT", "Parsed out parameters.")
@@ -185,7 +240,7 @@ def perform_task_chunking(self, parameters, task_id=None):
     geographic_chunks = create_geographic_chunks(
         longitude=parameters['longitude'],
         latitude=parameters['latitude'],
-        geographic_chunk_size=task_chunk_sizing['geographic'])
+        geographic_chunk_size=get_planned_geographic_chunk_size(task, task_chunk_sizing, dates))
 
     time_chunks = create_time_chunks(
         dates, _reversed=task.get_reverse_time(), time_chunk_size=task_chunk_sizing['time'])
@@ -211,7 +266,6 @@ def start_chunk_processing(self, chunk_details, task_id=None):
     if chunk_details is None:
         return None
 
-    parameters = chunk_details.get('parameters')
     geographic_chunks = chunk_details.get('geographic_chunks')
     time_chunks = chunk_details.get('time_chunks')
 
@@ -231,6 +285,9 @@ def start_chunk_processing(self, chunk_details, task_id=None):
     task.scenes_processed = 0
     task.save(update_fields=['total_scenes', 'scenes_processed'])
 
+    # processing tasks read their parameters and chunks from the stored details rather than their messages.
+    task.store_chunk_details(chunk_details)
+
     if check_cancel_task(self, task): return
     task.update_status("WAIT", "Starting processing.")
 
@@ -241,14 +298,12 @@ def start_chunk_processing(self, chunk_details, task_id=None):
             processing_task.s(
                 task_id=task_id,
                 geo_chunk_id=geo_index,
-                time_chunk_id=time_index,
-                geographic_chunk=geographic_chunk,
-                time_chunk=time_chunk,
-                **parameters) for geo_index, geographic_chunk in enumerate(geographic_chunks)
+                time_chunk_id=time_index) for geo_index in range(len(geographic_chunks))
         ]) | recombine_geographic_chunks.s(task_id=task_id, num_scn_per_chk=num_scn_per_chk)
-        for time_index, time_chunk in enumerate(time_chunks)
+        for time_index in range(len(time_chunks))
     ]) | recombine_time_chunks.s(task_id=task_id) | create_output_products.s(task_id=task_id)\
-       | task_clean_up.si(task_id=task_id, task_model='TsmTask')).apply_async()
+       | task_clean_up.si(task_id=task_id, task_model='TsmTask'))
+    prioritize(processing_pipeline, task).apply_async()
 
     return True
 
@@ -259,12 +314,11 @@ def processing_task(self,
                     geo_chunk_id=None,
                     time_chunk_id=None,
                     geographic_chunk=None,
-                    time_chunk=None,
-                    **parameters):
+                    time_chunk=None):
     """Process a parameter set and save the results to disk.
 
     Uses the geographic and time chunk id to identify output products.
-    **params is updated with time and geographic ranges then used to load data.
+    The load parameters are read from the stored chunk details and updated with time and geographic ranges.
     the task model holds the iterative property that signifies whether the algorithm
     is iterative or if all data needs to be loaded at once.
 
@@ -272,10 +326,9 @@ def processing_task(self,
         task_id, geo_chunk_id, time_chunk_id: identification for the main task and what chunk this is processing
         geographic_chunk: range of latitude and longitude to load - dict with keys latitude, longitude
         time_chunk: list of acquisition dates
-        parameters: all required kwargs to load data.
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
     """
     chunk_id = "_".join([str(geo_chunk_id), str(time_chunk_id)])
     task = TsmTask.objects.get(pk=task_id)
@@ -285,6 +338,22 @@ def processing_task(self,
     if not os.path.exists(task.get_temp_path()):
         return None
 
+    geographic_chunk, time_chunk, parameters = task.get_chunk_parameters(
+        geo_chunk_id, time_chunk_id, geographic_chunk=geographic_chunk)
+
+    # over budget chunks are processed as smaller chunks that are combined before recombination.
+    geographic_chunks = split_chunk_over_memory_budget(task, geographic_chunk, time_chunk, parameters)
+    if geographic_chunks is not None:
+        return self.replace(
+            group([
+                processing_task.s(
+                    task_id=task_id,
+                    geo_chunk_id="{}.{}".format(geo_chunk_id, index),
+                    time_chunk_id=time_chunk_id,
+                    geographic_chunk=split_chunk) for index, split_chunk in enumerate(geographic_chunks)
+            ]) | combine_split_chunks.s(
+                task_id=task_id, app_name='tsm', geo_chunk_id=geo_chunk_id, time_chunk_id=time_chunk_id))
+
     metadata = {}
 
     def _get_datetime_range_containing(*time_ranges):
@@ -303,7 +372,9 @@ def processing_task(self,
     base_index = (task.get_chunk_size()['time'] if task.get_chunk_size()['time'] is not None else 1) * time_chunk_id
     for time_index, time in enumerate(times):
         updated_params.update({'time': time})
-        data = dc.get_stacked_datasets_by_extent(**updated_params)
+        with trace_step("load") as span:
+            data = dc.get_stacked_datasets_by_extent(**updated_params)
+            span.add_input(data)
 
         if check_cancel_task(self, task): return
 
@@ -313,10 +384,11 @@ def processing_task(self,
 
         clear_mask = task.satellite.get_clean_mask_func()(data)
 
-        wofs_data = task.get_processing_method()(data,
-                                                 clean_mask=clear_mask,
-                                                 enforce_float64=True,
-                                                 no_data=task.satellite.no_data_value)
+        with trace_step("process"):
+            wofs_data = task.get_processing_method()(data,
+                                                     clean_mask=clear_mask,
+                                                     enforce_float64=True,
+                                                     no_data=task.satellite.no_data_value)
         water_analysis = perform_timeseries_analysis(
             wofs_data, 'wofs', intermediate_product=water_analysis, no_data=task.satellite.no_data_value)
 
@@ -337,17 +409,22 @@ def processing_task(self,
                                 "animation_{}_{}.nc".format(str(geo_chunk_id), str(base_index + time_index)))
             animated_data = tsm_data.isel(
                 time=0, drop=True) if task.animated_product.animation_id == "scene" else combined_data
-            export_xarray_to_netcdf(animated_data, path)
+            with trace_step("export") as span:
+                export_xarray_to_netcdf(animated_data, path)
+                span.add_output(path)
 
         task.scenes_processed = F('scenes_processed') + 1
         task.save(update_fields=['scenes_processed'])
     if combined_data is None:
         return None
     path = os.path.join(task.get_temp_path(), chunk_id + ".nc")
-    export_xarray_to_netcdf(combined_data, path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(combined_data, path)
+        span.add_output(path)
     dc.close()
     logger.info("Done with chunk: " + chunk_id)
-    return path, metadata, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
+    metadata_path = task.store_chunk_metadata(path, metadata)
+    return path, metadata_path, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
 
 
 @task(name="tsm.recombine_geographic_chunks", base=BaseTask, bind=True)
@@ -358,11 +435,11 @@ def recombine_geographic_chunks(self, chunks, task_id=None, num_scn_per_chk=None
     and combine it into a single dataset. Combine metadata as well, writing to disk.
 
     Args:
-        chunks: list of the return from the processing_task function - path, metadata, and {chunk ids}
+        chunks: list of the return from the processing_task function - path, metadata path, and {chunk ids}
         num_scn_per_chk: The number of scenes per chunk. Used to determine task progress.
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
     """
     task = TsmTask.objects.get(pk=task_id)
     if check_cancel_task(self, task): return
@@ -377,7 +454,7 @@ def recombine_geographic_chunks(self, chunks, task_id=None, num_scn_per_chk=None
     metadata = {}
     chunk_data = []
     for index, chunk in enumerate(total_chunks):
-        metadata = task.combine_metadata(metadata, chunk[1])
+        metadata = task.combine_metadata(metadata, task.get_chunk_metadata(chunk[1]))
         chunk_data.append(xr.open_dataset(chunk[0]))
         task.scenes_processed = F('scenes_processed') + num_scn_per_chk
         task.save(update_fields=['scenes_processed'])
@@ -396,12 +473,17 @@ def recombine_geographic_chunks(self, chunks, task_id=None, num_scn_per_chk=None
                     animated_data.append(xr.open_dataset(path))
             path = os.path.join(task.get_temp_path(), "animation_{}.nc".format(base_index + index))
             if len(animated_data) > 0:
-                export_xarray_to_netcdf(combine_geographic_chunks(animated_data), path)
+                with trace_step("export") as span:
+                    export_xarray_to_netcdf(combine_geographic_chunks(animated_data), path)
+                    span.add_output(path)
 
     path = os.path.join(task.get_temp_path(), "recombined_geo_{}.nc".format(time_chunk_id))
-    export_xarray_to_netcdf(combined_data, path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(combined_data, path)
+        span.add_output(path)
     logger.info("Done combining geographic chunks for time: " + str(time_chunk_id))
-    return path, metadata, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
+    metadata_path = task.store_chunk_metadata(path, metadata)
+    return path, metadata_path, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
 
 
 @task(name="tsm.recombine_time_chunks", base=BaseTask, bind=True)
@@ -413,10 +495,10 @@ def recombine_time_chunks(self, chunks, task_id=None):
     simply return the data again.
 
     Args:
-        chunks: list of the return from the processing_task function - path, metadata, and {chunk ids}
+        chunks: list of the return from the processing_task function - path, metadata path, and {chunk ids}
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
     """
     task = TsmTask.objects.get(pk=task_id)
     if check_cancel_task(self, task): return
@@ -460,11 +542,13 @@ def recombine_time_chunks(self, chunks, task_id=None):
                     combine_intermediates(combined_data, animated_data)
                 # need to wait until last step to mask out wofs < 0.8
                 path = os.path.join(task.get_temp_path(), "animation_final_{}.nc".format(base_index + index))
-                export_xarray_to_netcdf(animated_data, path)
+                with trace_step("export") as span:
+                    export_xarray_to_netcdf(animated_data, path)
+                    span.add_output(path)
 
     combined_data = None
     for index, chunk in enumerate(total_chunks):
-        metadata.update(chunk[1])
+        metadata.update(task.get_chunk_metadata(chunk[1]))
         data = xr.open_dataset(chunk[0])
         if combined_data is None:
             if task.animated_product.animation_id != "none":
@@ -478,13 +562,16 @@ def recombine_time_chunks(self, chunks, task_id=None):
             generate_animation(index, combined_data)
 
     path = os.path.join(task.get_temp_path(), "recombined_time_{}.nc".format(geo_chunk_id))
-    export_xarray_to_netcdf(combined_data, path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(combined_data, path)
+        span.add_output(path)
     logger.info("Done combining time chunks for geo: " + str(geo_chunk_id))
-    return path, metadata, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
+    metadata_path = task.store_chunk_metadata(path, metadata)
+    return path, metadata_path, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
 
 
 @task(name="tsm.create_output_products", base=BaseTask, bind=True)
-def create_output_products(self, data, task_id=None):
+def create_output_products(self, data, task_id=None, subset=False):
     """Create the final output products for this algorithm.
 
     Open the final dataset and metadata and generate all remaining metadata.
@@ -492,12 +579,13 @@ def create_output_products(self, data, task_id=None):
     Update status and exit.
 
     Args:
-        data: tuple in the format of processing_task function - path, metadata, and {chunk ids}
+        data: tuple in the format of processing_task function - path, metadata path, and {chunk ids}
+        subset: whether data was sliced from the result of a parent task - see slice_parent_result
     """
     task = TsmTask.objects.get(pk=task_id)
     if check_cancel_task(self, task): return
 
-    full_metadata = data[1]
+    full_metadata = task.get_chunk_metadata(data[1])
     dataset = xr.open_dataset(data[0]).astype('float64')
     dataset['variability'] = dataset['max'] - dataset['normalized_data']
     dataset['wofs'] = dataset.wofs / dataset.wofs_total_clean
@@ -513,23 +601,31 @@ def create_output_products(self, data, task_id=None):
                                        "animation.gif") if task.animated_product.animation_id != 'none' else ""
     task.final_metadata_from_dataset(dataset_masked)
     task.metadata_from_dict(full_metadata)
+    if subset:
+        task.drop_acquisition_statistics()
 
     bands = [task.query_type.data_variable, 'total_clean', 'wofs']
     band_paths = [task.result_path, task.clear_observations_path, task.water_percentage_path]
 
-    export_xarray_to_netcdf(dataset_masked, task.data_netcdf_path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(dataset_masked, task.data_netcdf_path)
+        span.add_output(task.data_netcdf_path)
 
-    write_geotiff_from_xr(task.data_path, dataset_masked, bands=bands, no_data=task.satellite.no_data_value)
+    with trace_step("export") as span:
+        write_geotiff_from_xr(task.data_path, dataset_masked, bands=bands, no_data=task.satellite.no_data_value)
+        span.add_output(task.data_path)
 
     for band, band_path in zip(bands, band_paths):
-        write_single_band_png_from_xr(
-            band_path,
-            dataset_masked,
-            band,
-            color_scale=task.color_scales[band],
-            fill_color='black',
-            interpolate=False,
-            no_data=task.satellite.no_data_value)
+        with trace_step("write_png") as span:
+            write_single_band_png_from_xr(
+                band_path,
+                dataset_masked,
+                band,
+                color_scale=task.color_scales[band],
+                fill_color='black',
+                interpolate=False,
+                no_data=task.satellite.no_data_value)
+            span.add_output(band_path)
 
     if task.animated_product.animation_id != "none":
         with imageio.get_writer(task.animation_path, mode='I', duration=1.0) as writer:
@@ -542,27 +638,33 @@ def create_output_products(self, data, task_id=None):
                         xr.open_dataset(path).astype('float64'),
                         dataset.wofs) if task.animated_product.animation_id != "scene" else xr.open_dataset(
                             path)
-                    write_single_band_png_from_xr(
-                        png_path,
-                        animated_data,
-                        task.animated_product.data_variable,
-                        color_scale=task.color_scales[task.animated_product.data_variable],
-                        fill_color='black',
-                        interpolate=False,
-                        no_data=task.satellite.no_data_value)
+                    with trace_step("write_png") as span:
+                        write_single_band_png_from_xr(
+                            png_path,
+                            animated_data,
+                            task.animated_product.data_variable,
+                            color_scale=task.color_scales[task.animated_product.data_variable],
+                            fill_color='black',
+                            interpolate=False,
+                            no_data=task.satellite.no_data_value)
+                        span.add_output(png_path)
                     image = imageio.imread(png_path)
                     writer.append_data(image)
 
     dates = list(map(lambda x: datetime.strptime(x, "%m/%d/%Y"), task._get_field_as_list('acquisition_list')))
-    if len(dates) > 1:
-        task.plot_path = os.path.join(task.get_result_path(), "plot_path.png")
-        create_2d_plot(
+    if len(dates) > 1 and not subset:
+        task.plot_path = os.path.join(task.get_result_path(), "plot_data.json")
+        write_2d_plot_data(
             task.plot_path,
             dates=dates,
             datasets=task._get_field_as_list('clean_pixel_percentages_per_acquisition'),
             data_labels="Clean Pixel Percentage (%)",
             titles="Clean Pixel Percentage Per Acquisition")
 
+    # keep the final dataset so the task can be subset without reprocessing.
+    if not task.preview:
+        task.store_intermediate(data[0], full_metadata)
+
     logger.info("All products created.")
     task.update_bounds_from_dataset(dataset_masked)
     task.complete = True
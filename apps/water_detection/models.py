@@ -108,6 +108,13 @@ class Query(BaseQuery):
         """
         return True
 
+    def get_extendable(self):
+        """implements get_extendable as required by the base class
+
+        See the base query class docstring for more information.
+        """
+        return self.animated_product.animation_id == "none"
+
     def get_reverse_time(self):
         """implements get_reverse_time as required by the base class
 
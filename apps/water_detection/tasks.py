@@ -14,12 +14,16 @@ from utils.data_cube_utilities.dc_utilities import (create_cfmask_clean_mask, cr
                                                     add_timestamp_data_to_xr, clear_attrs, perform_timeseries_analysis)
 from utils.data_cube_utilities.dc_chunker import (create_geographic_chunks, create_time_chunks,
                                                   combine_geographic_chunks)
-from apps.dc_algorithm.utils import create_2d_plot
+from apps.dc_algorithm.utils import (write_2d_plot_data, get_pixel_time_series, pixel_time_series_cache,
+                                     slice_dataset_to_extent)
 from utils.data_cube_utilities.import_export import export_xarray_to_netcdf
 
 from .models import WaterDetectionTask
 from apps.dc_algorithm.models import Satellite
-from apps.dc_algorithm.tasks import DCAlgorithmBase, check_cancel_task, task_clean_up
+from apps.dc_algorithm.tasks import DCAlgorithmBase, check_cancel_task, task_clean_up, combine_split_chunks
+from apps.dc_algorithm.scheduler import prioritize
+from apps.dc_algorithm.tracing import trace_step
+from apps.dc_algorithm.memory import split_chunk_over_memory_budget, get_planned_geographic_chunk_size
 
 logger = get_task_logger(__name__)
 
@@ -28,7 +32,7 @@ class BaseTask(DCAlgorithmBase):
     app_name = 'water_detection'
 
 
-@task(name="water_detection.pixel_drill", base=BaseTask)
+@task(name="water_detection.pixel_drill", base=BaseTask, queue="pixel_drill")
 def pixel_drill(task_id=None):
     parameters = parse_parameters_from_task(task_id=task_id)
     validate_parameters(parameters, task_id=task_id)
@@ -38,7 +42,13 @@ def pixel_drill(task_id=None):
         return None
 
     dc = DataAccessApi(config=task.config_path)
-    single_pixel = dc.get_stacked_datasets_by_extent(**parameters)
+    single_pixel = get_pixel_time_series(dc.dc, cache=pixel_time_series_cache, **task.get_point_query_parameters())
+    dc.close()
+    if single_pixel is None:
+        task.complete = True
+        task.update_status("ERROR", "There are no acquistions for this parameter set.")
+        return None
+
     clear_mask = task.satellite.get_clean_mask_func()(single_pixel.isel(latitude=0, longitude=0))
     single_pixel = single_pixel.where(single_pixel != task.satellite.no_data_value)
 
@@ -47,10 +57,11 @@ def pixel_drill(task_id=None):
         task.update_status("ERROR", "There is only a single acquisition for your parameter set.")
         return None
 
-    wofs_data = task.get_processing_method()(single_pixel,
-                                             clean_mask=clear_mask,
-                                             enforce_float64=True,
-                                             no_data=task.satellite.no_data_value)
+    with trace_step("process"):
+        wofs_data = task.get_processing_method()(single_pixel,
+                                                 clean_mask=clear_mask,
+                                                 enforce_float64=True,
+                                                 no_data=task.satellite.no_data_value)
     wofs_data = wofs_data.where(wofs_data != task.satellite.no_data_value).isel(latitude=0, longitude=0)
 
     datasets = [wofs_data.wofs.values.transpose()] + [clear_mask]
@@ -58,8 +69,9 @@ def pixel_drill(task_id=None):
     titles = ["Water/Non Water"] + ["Clear Mask"]
     style = ['.', '.']
 
-    task.plot_path = os.path.join(task.get_result_path(), "plot_path.png")
-    create_2d_plot(task.plot_path, dates=dates, datasets=datasets, data_labels=data_labels, titles=titles, style=style)
+    task.plot_path = os.path.join(task.get_result_path(), "plot_data.json")
+    write_2d_plot_data(
+        task.plot_path, dates=dates, datasets=datasets, data_labels=data_labels, titles=titles, style=style)
 
     task.complete = True
     task.update_status("OK", "Done processing pixel drill.")
@@ -77,6 +89,62 @@ def run(task_id=None):
                  start_chunk_processing.s(task_id=task_id))()
 
 
+@task(name="water_detection.extend", base=BaseTask)
+def extend(task_id=None):
+    """Fold acquisitions ingested after a task was completed into its result
+
+    Chains the parsing of parameters, chunking of the new acquisitions, and the start to data processing.
+    The stored intermediate product is recombined with the new chunks so that only new acquisitions are loaded.
+    """
+    task = WaterDetectionTask.objects.get(pk=task_id)
+    if not task.can_be_extended():
+        return None
+    return chain(parse_parameters_from_task.s(task_id=task_id),
+                 perform_extension_chunking.s(task_id=task_id),
+                 start_chunk_processing.s(task_id=task_id))()
+
+
+@task(name="water_detection.subset", base=BaseTask)
+def subset(task_id=None, parent_id=None):
+    """Create the output products of a task by slicing the stored intermediate product of a parent task
+
+    See Query.is_subset_of for the requirements. No data is loaded from the Data Cube - the parent's
+    intermediate product is sliced to the task's bounds and passed directly to create_output_products.
+    """
+    return chain(slice_parent_result.s(task_id=task_id, parent_id=parent_id),
+                 create_output_products.s(task_id=task_id, subset=True),
+                 task_clean_up.si(task_id=task_id, task_model='WaterDetectionTask'))()
+
+
+@task(name="water_detection.slice_parent_result", base=BaseTask, bind=True)
+def slice_parent_result(self, task_id=None, parent_id=None):
+    """Slice the stored intermediate product of a parent task to the bounds of a task
+
+    The parent's metadata dict is reused for the acquisition list. Its per acquisition statistics describe the
+    parent's extent and can't be recomputed from the composited product, so create_output_products drops them.
+
+    Returns:
+        path to the sliced product, path to its metadata, and a dict containing the geo/time ids
+    """
+    task = WaterDetectionTask.objects.get(pk=task_id)
+    parent = WaterDetectionTask.objects.get(pk=parent_id)
+
+    task.execution_start = datetime.now()
+    if check_cancel_task(self, task): return
+    task.update_status("WAIT", "Slicing the result of an existing task.")
+
+    dataset = slice_dataset_to_extent(
+        parent.open_intermediate(),
+        latitude=(task.latitude_min, task.latitude_max),
+        longitude=(task.longitude_min, task.longitude_max))
+    path = os.path.join(task.get_temp_path(), "subset.nc")
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(dataset, path)
+        span.add_output(path)
+    metadata_path = task.store_chunk_metadata(path, parent.get_intermediate_metadata())
+    return path, metadata_path, {'geo_chunk_id': 0, 'time_chunk_id': 0}
+
+
 @task(name="water_detection.parse_parameters_from_task", base=BaseTask, bind=True)
 def parse_parameters_from_task(self, task_id=None):
     """Parse out required DC parameters from the task model.
@@ -101,6 +169,8 @@ def parse_parameters_from_task(self, task_id=None):
         'measurements': task.satellite.get_measurements()
     }
 
+    parameters.update(task.get_preview_load_parameters())
+
     task.execution_start = datetime.now()
     if check_cancel_task(self, task): return
     task.update_status("WAIT", "Parsed out parameters.")
@@ -172,7 +242,7 @@ def perform_task_chunking(self, parameters, task_id=None):
     geographic_chunks = create_geographic_chunks(
         longitude=parameters['longitude'],
         latitude=parameters['latitude'],
-        geographic_chunk_size=task_chunk_sizing['geographic'])
+        geographic_chunk_size=get_planned_geographic_chunk_size(task, task_chunk_sizing, dates))
 
     time_chunks = create_time_chunks(
         dates, _reversed=task.get_reverse_time(), time_chunk_size=task_chunk_sizing['time'])
@@ -184,6 +254,62 @@ def perform_task_chunking(self, parameters, task_id=None):
     return {'parameters': parameters, 'geographic_chunks': geographic_chunks, 'time_chunks': time_chunks}
 
 
+@task(name="water_detection.perform_extension_chunking", base=BaseTask, bind=True)
+def perform_extension_chunking(self, parameters, task_id=None):
+    """Chunk the acquisitions that have not been processed for a completed task
+
+    The stored intermediate product is added to the chunk details as an additional time chunk. Its id places it
+    after the new acquisitions when processing in reverse time and before them otherwise, so that
+    recombine_time_chunks folds the chunks in the same order as a full run. If any new acquisition predates the
+    latest processed acquisition, all acquisitions are chunked without the intermediate product instead.
+
+    Args:
+        parameters: parameter stream containing all kwargs to load data
+
+    Returns:
+        parameters with a list of geographic and time ranges and the id of the intermediate time chunk, if any
+    """
+    if parameters is None:
+        return None
+
+    task = WaterDetectionTask.objects.get(pk=task_id)
+    if check_cancel_task(self, task): return
+
+    dc = DataAccessApi(config=task.config_path)
+    acquisitions = dc.list_combined_acquisition_dates(**parameters)
+    dc.close()
+    dates = task.get_unprocessed_acquisitions(acquisitions)
+
+    if len(dates) < 1:
+        task.update_status("OK", "There are no new acquisitions for this task.")
+        return None
+
+    # acquisitions older than the latest processed acquisition can't be folded in order, so everything is reprocessed.
+    extend = not task.has_backfilled_acquisitions(dates)
+    if not extend:
+        logger.info("Backfilled acquisitions found, reprocessing all {} acquisitions.".format(len(acquisitions)))
+        dates = acquisitions
+
+    task_chunk_sizing = task.get_chunk_size()
+
+    geographic_chunks = create_geographic_chunks(
+        longitude=parameters['longitude'],
+        latitude=parameters['latitude'],
+        geographic_chunk_size=get_planned_geographic_chunk_size(task, task_chunk_sizing, dates))
+
+    time_chunks = create_time_chunks(
+        dates, _reversed=task.get_reverse_time(), time_chunk_size=task_chunk_sizing['time'])
+    logger.info("Extending with {} acquisitions. Time chunks: {}, Geo chunks: {}".format(
+        len(dates), len(time_chunks), len(geographic_chunks)))
+
+    if check_cancel_task(self, task): return
+    task.update_status("WAIT", "Chunked new acquisitions." if extend else "Chunked all acquisitions.")
+    chunk_details = {'parameters': parameters, 'geographic_chunks': geographic_chunks, 'time_chunks': time_chunks}
+    if extend:
+        chunk_details['intermediate_chunk_id'] = len(time_chunks) if task.get_reverse_time() else -1
+    return chunk_details
+
+
 @task(name="water_detection.start_chunk_processing", base=BaseTask, bind=True)
 def start_chunk_processing(self, chunk_details, task_id=None):
     """Create a fully asyncrhonous processing pipeline from paramters and a list of chunks.
@@ -198,7 +324,6 @@ def start_chunk_processing(self, chunk_details, task_id=None):
     if chunk_details is None:
         return None
 
-    parameters = chunk_details.get('parameters')
     geographic_chunks = chunk_details.get('geographic_chunks')
     time_chunks = chunk_details.get('time_chunks')
 
@@ -211,24 +336,31 @@ def start_chunk_processing(self, chunk_details, task_id=None):
     task.scenes_processed = 0
     task.save(update_fields=['total_scenes', 'scenes_processed'])
 
+    # processing tasks read their parameters and chunks from the stored details rather than their messages.
+    task.store_chunk_details(chunk_details)
+
     if check_cancel_task(self, task): return
     task.update_status("WAIT", "Starting processing.")
 
     logger.info("START_CHUNK_PROCESSING")
 
-    processing_pipeline = (group([
+    time_chunk_pipelines = [
         group([
             processing_task.s(
                 task_id=task_id,
                 geo_chunk_id=geo_index,
-                time_chunk_id=time_index,
-                geographic_chunk=geographic_chunk,
-                time_chunk=time_chunk,
-                **parameters) for geo_index, geographic_chunk in enumerate(geographic_chunks)
+                time_chunk_id=time_index) for geo_index in range(len(geographic_chunks))
         ]) | recombine_geographic_chunks.s(task_id=task_id)
-        for time_index, time_chunk in enumerate(time_chunks)
-    ]) | recombine_time_chunks.s(task_id=task_id) | create_output_products.s(task_id=task_id) \
-       | task_clean_up.si(task_id=task_id, task_model='WaterDetectionTask')).apply_async()
+        for time_index in range(len(time_chunks))
+    ]
+    # extensions recombine the stored intermediate product with the new acquisitions.
+    if 'intermediate_chunk_id' in chunk_details:
+        time_chunk_pipelines.append(
+            load_intermediate.si(task_id=task_id, time_chunk_id=chunk_details['intermediate_chunk_id']))
+
+    processing_pipeline = (group(time_chunk_pipelines) | recombine_time_chunks.s(task_id=task_id) | create_output_products.s(task_id=task_id) \
+       | task_clean_up.si(task_id=task_id, task_model='WaterDetectionTask'))
+    prioritize(processing_pipeline, task).apply_async()
 
     return True
 
@@ -239,12 +371,11 @@ def processing_task(self,
                     geo_chunk_id=None,
                     time_chunk_id=None,
                     geographic_chunk=None,
-                    time_chunk=None,
-                    **parameters):
+                    time_chunk=None):
     """Process a parameter set and save the results to disk.
 
     Uses the geographic and time chunk id to identify output products.
-    **params is updated with time and geographic ranges then used to load data.
+    The load parameters are read from the stored chunk details and updated with time and geographic ranges.
     the task model holds the iterative property that signifies whether the algorithm
     is iterative or if all data needs to be loaded at once.
 
@@ -252,10 +383,9 @@ def processing_task(self,
         task_id, geo_chunk_id, time_chunk_id: identification for the main task and what chunk this is processing
         geographic_chunk: range of latitude and longitude to load - dict with keys latitude, longitude
         time_chunk: list of acquisition dates
-        parameters: all required kwargs to load data.
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
     """
     chunk_id = "_".join([str(geo_chunk_id), str(time_chunk_id)])
     task = WaterDetectionTask.objects.get(pk=task_id)
@@ -265,6 +395,22 @@ def processing_task(self,
     if not os.path.exists(task.get_temp_path()):
         return None
 
+    geographic_chunk, time_chunk, parameters = task.get_chunk_parameters(
+        geo_chunk_id, time_chunk_id, geographic_chunk=geographic_chunk)
+
+    # over budget chunks are processed as smaller chunks that are combined before recombination.
+    geographic_chunks = split_chunk_over_memory_budget(task, geographic_chunk, time_chunk, parameters)
+    if geographic_chunks is not None:
+        return self.replace(
+            group([
+                processing_task.s(
+                    task_id=task_id,
+                    geo_chunk_id="{}.{}".format(geo_chunk_id, index),
+                    time_chunk_id=time_chunk_id,
+                    geographic_chunk=split_chunk) for index, split_chunk in enumerate(geographic_chunks)
+            ]) | combine_split_chunks.s(
+                task_id=task_id, app_name='water_detection', geo_chunk_id=geo_chunk_id, time_chunk_id=time_chunk_id))
+
     metadata = {}
 
     def _get_datetime_range_containing(*time_ranges):
@@ -281,7 +427,9 @@ def processing_task(self,
     base_index = (task.get_chunk_size()['time'] if task.get_chunk_size()['time'] is not None else 1) * time_chunk_id
     for time_index, time in enumerate(times):
         updated_params.update({'time': time})
-        data = dc.get_stacked_datasets_by_extent(**updated_params)
+        with trace_step("load") as span:
+            data = dc.get_stacked_datasets_by_extent(**updated_params)
+            span.add_input(data)
 
         if check_cancel_task(self, task): return
 
@@ -291,10 +439,11 @@ def processing_task(self,
 
         clear_mask = task.satellite.get_clean_mask_func()(data)
 
-        wofs_data = task.get_processing_method()(data,
-                                                 clean_mask=clear_mask,
-                                                 enforce_float64=True,
-                                                 no_data=task.satellite.no_data_value)
+        with trace_step("process"):
+            wofs_data = task.get_processing_method()(data,
+                                                     clean_mask=clear_mask,
+                                                     enforce_float64=True,
+                                                     no_data=task.satellite.no_data_value)
         water_analysis = perform_timeseries_analysis(
             wofs_data, 'wofs', intermediate_product=water_analysis, no_data=task.satellite.no_data_value)
 
@@ -304,7 +453,9 @@ def processing_task(self,
                                 "animation_{}_{}.nc".format(str(geo_chunk_id), str(base_index + time_index)))
             animated_data = wofs_data.isel(
                 time=0, drop=True) if task.animated_product.animation_id == "scene" else water_analysis
-            export_xarray_to_netcdf(animated_data, path)
+            with trace_step("export") as span:
+                export_xarray_to_netcdf(animated_data, path)
+                span.add_output(path)
 
         if check_cancel_task(self, task): return
 
@@ -313,10 +464,29 @@ def processing_task(self,
     if water_analysis is None:
         return None
     path = os.path.join(task.get_temp_path(), chunk_id + ".nc")
-    export_xarray_to_netcdf(water_analysis, path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(water_analysis, path)
+        span.add_output(path)
     dc.close()
     logger.info("Done with chunk: " + chunk_id)
-    return path, metadata, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
+    metadata_path = task.store_chunk_metadata(path, metadata)
+    return path, metadata_path, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
+
+
+@task(name="water_detection.load_intermediate", base=BaseTask, bind=True)
+def load_intermediate(self, task_id=None, time_chunk_id=None):
+    """Copy the stored intermediate product of a completed task into the temp path as a recombined time chunk
+
+    Returns:
+        path to the intermediate product, path to its metadata, and a dict containing the geo/time ids
+    """
+    task = WaterDetectionTask.objects.get(pk=task_id)
+    if check_cancel_task(self, task): return
+
+    path = os.path.join(task.get_temp_path(), "recombined_geo_{}.nc".format(time_chunk_id))
+    metadata = task.load_intermediate(path)
+    metadata_path = task.store_chunk_metadata(path, metadata)
+    return path, metadata_path, {'geo_chunk_id': 0, 'time_chunk_id': time_chunk_id}
 
 
 @task(name="water_detection.recombine_geographic_chunks", base=BaseTask, bind=True)
@@ -327,10 +497,10 @@ def recombine_geographic_chunks(self, chunks, task_id=None):
     and combine it into a single dataset. Combine metadata as well, writing to disk.
 
     Args:
-        chunks: list of the return from the processing_task function - path, metadata, and {chunk ids}
+        chunks: list of the return from the processing_task function - path, metadata path, and {chunk ids}
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
     """
     task = WaterDetectionTask.objects.get(pk=task_id)
     if check_cancel_task(self, task): return
@@ -345,7 +515,7 @@ def recombine_geographic_chunks(self, chunks, task_id=None):
     metadata = {}
     chunk_data = []
     for index, chunk in enumerate(total_chunks):
-        metadata = task.combine_metadata(metadata, chunk[1])
+        metadata = task.combine_metadata(metadata, task.get_chunk_metadata(chunk[1]))
         chunk_data.append(xr.open_dataset(chunk[0]))
     combined_data = combine_geographic_chunks(chunk_data)
 
@@ -362,12 +532,17 @@ def recombine_geographic_chunks(self, chunks, task_id=None):
                     animated_data.append(xr.open_dataset(path))
             path = os.path.join(task.get_temp_path(), "animation_{}.nc".format(base_index + index))
             if len(animated_data) > 0:
-                export_xarray_to_netcdf(combine_geographic_chunks(animated_data), path)
+                with trace_step("export") as span:
+                    export_xarray_to_netcdf(combine_geographic_chunks(animated_data), path)
+                    span.add_output(path)
 
     path = os.path.join(task.get_temp_path(), "recombined_geo_{}.nc".format(time_chunk_id))
-    export_xarray_to_netcdf(combined_data, path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(combined_data, path)
+        span.add_output(path)
     logger.info("Done combining geographic chunks for time: " + str(time_chunk_id))
-    return path, metadata, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
+    metadata_path = task.store_chunk_metadata(path, metadata)
+    return path, metadata_path, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
 
 
 @task(name="water_detection.recombine_time_chunks", base=BaseTask, bind=True)
@@ -379,10 +554,10 @@ def recombine_time_chunks(self, chunks, task_id=None):
     simply return the data again.
 
     Args:
-        chunks: list of the return from the processing_task function - path, metadata, and {chunk ids}
+        chunks: list of the return from the processing_task function - path, metadata path, and {chunk ids}
 
     Returns:
-        path to the output product, metadata dict, and a dict containing the geo/time ids
+        path to the output product, path to its metadata, and a dict containing the geo/time ids
     """
     task = WaterDetectionTask.objects.get(pk=task_id)
     if check_cancel_task(self, task): return
@@ -392,7 +567,7 @@ def recombine_time_chunks(self, chunks, task_id=None):
     chunks = [chunk for chunk in chunks if chunk is not None]
     if len(chunks) == 0:
         return None
-    total_chunks = sorted(chunks, key=lambda x: x[0])
+    total_chunks = sorted(chunks, key=lambda chunk: int(chunk[-1]['time_chunk_id']))
     geo_chunk_id = total_chunks[0][2]['geo_chunk_id']
     time_chunk_id = total_chunks[0][2]['time_chunk_id']
 
@@ -416,19 +591,21 @@ def recombine_time_chunks(self, chunks, task_id=None):
                     combine_intermediates(combined_data, animated_data)
                 path = os.path.join(task.get_temp_path(), "animation_{}.png".format(base_index + index))
 
-                write_single_band_png_from_xr(
-                    path,
-                    animated_data,
-                    task.animated_product.data_variable,
-                    color_scale=task.color_scales[task.animated_product.data_variable],
-                    fill_color=task.query_type.fill,
-                    interpolate=False,
-                    no_data=task.satellite.no_data_value)
+                with trace_step("write_png") as span:
+                    write_single_band_png_from_xr(
+                        path,
+                        animated_data,
+                        task.animated_product.data_variable,
+                        color_scale=task.color_scales[task.animated_product.data_variable],
+                        fill_color=task.query_type.fill,
+                        interpolate=False,
+                        no_data=task.satellite.no_data_value)
+                    span.add_output(path)
 
     metadata = {}
     combined_data = None
     for index, chunk in enumerate(total_chunks):
-        metadata.update(chunk[1])
+        metadata.update(task.get_chunk_metadata(chunk[1]))
         data = xr.open_dataset(chunk[0])
         if combined_data is None:
             if task.animated_product.animation_id != "none":
@@ -441,13 +618,16 @@ def recombine_time_chunks(self, chunks, task_id=None):
             generate_animation(index, combined_data)
 
     path = os.path.join(task.get_temp_path(), "recombined_time_{}.nc".format(geo_chunk_id))
-    export_xarray_to_netcdf(combined_data, path)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(combined_data, path)
+        span.add_output(path)
     logger.info("Done combining time chunks for geo: " + str(geo_chunk_id))
-    return path, metadata, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
+    metadata_path = task.store_chunk_metadata(path, metadata)
+    return path, metadata_path, {'geo_chunk_id': geo_chunk_id, 'time_chunk_id': time_chunk_id}
 
 
 @task(name="water_detection.create_output_products", base=BaseTask, bind=True)
-def create_output_products(self, data, task_id=None):
+def create_output_products(self, data, task_id=None, subset=False):
     """Create the final output products for this algorithm.
 
     Open the final dataset and metadata and generate all remaining metadata.
@@ -455,12 +635,13 @@ def create_output_products(self, data, task_id=None):
     Update status and exit.
 
     Args:
-        data: tuple in the format of processing_task function - path, metadata, and {chunk ids}
+        data: tuple in the format of processing_task function - path, metadata path, and {chunk ids}
+        subset: whether data was sliced from the result of a parent task - see slice_parent_result
     """
     task = WaterDetectionTask.objects.get(pk=task_id)
     if check_cancel_task(self, task): return
 
-    full_metadata = data[1]
+    full_metadata = task.get_chunk_metadata(data[1])
     dataset = xr.open_dataset(data[0]).astype('float64')
 
     task.result_path = os.path.join(task.get_result_path(), "water_percentage.png")
@@ -472,22 +653,30 @@ def create_output_products(self, data, task_id=None):
                                        "animation.gif") if task.animated_product.animation_id != 'none' else ""
     task.final_metadata_from_dataset(dataset)
     task.metadata_from_dict(full_metadata)
+    if subset:
+        task.drop_acquisition_statistics()
 
     bands = ['normalized_data', 'total_data', 'total_clean']
     band_paths = [task.result_path, task.water_observations_path, task.clear_observations_path]
 
-    export_xarray_to_netcdf(dataset, task.data_netcdf_path)
-    write_geotiff_from_xr(task.data_path, dataset, bands=bands, no_data=task.satellite.no_data_value)
+    with trace_step("export") as span:
+        export_xarray_to_netcdf(dataset, task.data_netcdf_path)
+        span.add_output(task.data_netcdf_path)
+    with trace_step("export") as span:
+        write_geotiff_from_xr(task.data_path, dataset, bands=bands, no_data=task.satellite.no_data_value)
+        span.add_output(task.data_path)
 
     for band, band_path in zip(bands, band_paths):
-        write_single_band_png_from_xr(
-            band_path,
-            dataset,
-            band,
-            color_scale=task.color_scales[band],
-            fill_color=task.query_type.fill,
-            interpolate=False,
-            no_data=task.satellite.no_data_value)
+        with trace_step("write_png") as span:
+            write_single_band_png_from_xr(
+                band_path,
+                dataset,
+                band,
+                color_scale=task.color_scales[band],
+                fill_color=task.query_type.fill,
+                interpolate=False,
+                no_data=task.satellite.no_data_value)
+            span.add_output(band_path)
 
     if task.animated_product.animation_id != "none":
         with imageio.get_writer(task.animation_path, mode='I', duration=1.0) as writer:
@@ -499,9 +688,9 @@ def create_output_products(self, data, task_id=None):
                     writer.append_data(image)
 
     dates = list(map(lambda x: datetime.strptime(x, "%m/%d/%Y"), task._get_field_as_list('acquisition_list')))
-    if len(dates) > 1:
-        task.plot_path = os.path.join(task.get_result_path(), "plot_path.png")
-        create_2d_plot(
+    if len(dates) > 1 and not subset:
+        task.plot_path = os.path.join(task.get_result_path(), "plot_data.json")
+        write_2d_plot_data(
             task.plot_path,
             dates=dates,
             datasets=[
@@ -515,6 +704,10 @@ def create_output_products(self, data, task_id=None):
             data_labels=["Clean Pixel Percentage (%)", "Water Pixel Percentage (%)"],
             titles=["Clean Pixel Percentage Per Acquisition", "Water Pixels Percentage Per Acquisition"])
 
+    # keep the final dataset so the task can be extended or subset without reprocessing.
+    if not task.preview:
+        task.store_intermediate(data[0], full_metadata)
+
     logger.info("All products created.")
     # task.update_bounds_from_dataset(dataset)
     task.complete = True
@@ -24,10 +24,15 @@ import os
 from celery import Celery
 from django.conf import settings
 
+from .serialization import register_serializer
+
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'data_cube_ui.settings')
 app = Celery('data_cube_ui')
 
+# the serializer must be registered before any messages are sent or received.
+register_serializer()
+
 # Using a string here means the worker will not have to
 # pickle the object when using Windows.
 app.config_from_object('django.conf:settings')
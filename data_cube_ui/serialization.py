@@ -0,0 +1,92 @@
+"""A msgpack message format for Celery that preserves the types used in processing canvases and results
+
+Task arguments and results are plain containers of datetimes, tuples, and numpy values - e.g. metadata dicts keyed
+by acquisition datetime - so they are packed with msgpack extension types rather than pickled. Numpy arrays are
+stored as typed binary buffers instead of lists of numbers.
+"""
+
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+import msgpack
+import numpy as np
+from kombu.serialization import register
+
+SERIALIZER_NAME = 'dc_msgpack'
+CONTENT_TYPE = 'application/x-dc-msgpack'
+
+EXT_DATETIME = 1
+EXT_DATE = 2
+EXT_TUPLE = 3
+EXT_NDARRAY = 4
+EXT_UUID = 5
+EXT_TIMEDELTA = 6
+EXT_SET = 7
+
+
+def _default(obj):
+    """Convert the types that msgpack can't pack natively - called for every non exact builtin type"""
+    if isinstance(obj, datetime):
+        offset = obj.utcoffset()
+        return msgpack.ExtType(EXT_DATETIME, dumps([
+            obj.year, obj.month, obj.day, obj.hour, obj.minute, obj.second, obj.microsecond,
+            offset.days * 86400 + offset.seconds if offset is not None else None
+        ]))
+    if isinstance(obj, date):
+        return msgpack.ExtType(EXT_DATE, dumps([obj.year, obj.month, obj.day]))
+    if isinstance(obj, timedelta):
+        return msgpack.ExtType(EXT_TIMEDELTA, dumps(obj.days * 86400 * 10**6 + obj.seconds * 10**6 + obj.microseconds))
+    if isinstance(obj, tuple):
+        return msgpack.ExtType(EXT_TUPLE, dumps(list(obj)))
+    if isinstance(obj, (set, frozenset)):
+        return msgpack.ExtType(EXT_SET, dumps(list(obj)))
+    if isinstance(obj, uuid.UUID):
+        return msgpack.ExtType(EXT_UUID, obj.bytes)
+    if isinstance(obj, (np.ndarray, np.generic)):
+        array = np.asarray(obj)
+        if array.dtype.hasobject:
+            return array.tolist()
+        return msgpack.ExtType(EXT_NDARRAY, dumps([array.dtype.str, list(array.shape), array.tobytes()]))
+    # subclasses of builtins, e.g. OrderedDict or celery signatures.
+    for builtin in (dict, list, str, bytes, int, float):
+        if isinstance(obj, builtin):
+            return builtin(obj)
+    raise TypeError("Can not serialize {!r} of type {}".format(obj, type(obj)))
+
+
+def _ext_hook(code, data):
+    if code == EXT_DATETIME:
+        values = loads(data)
+        tzinfo = timezone(timedelta(seconds=values[7])) if values[7] is not None else None
+        return datetime(*values[:7], tzinfo=tzinfo)
+    if code == EXT_DATE:
+        return date(*loads(data))
+    if code == EXT_TIMEDELTA:
+        return timedelta(microseconds=loads(data))
+    if code == EXT_TUPLE:
+        return tuple(loads(data))
+    if code == EXT_SET:
+        return set(loads(data))
+    if code == EXT_UUID:
+        return uuid.UUID(bytes=data)
+    if code == EXT_NDARRAY:
+        dtype, shape, buffer = loads(data)
+        array = np.frombuffer(buffer, dtype=np.dtype(dtype)).reshape(shape)
+        # zero dimensional arrays were numpy scalars.
+        return array[()] if len(shape) == 0 else array.copy()
+    return msgpack.ExtType(code, data)
+
+
+def dumps(obj):
+    """Pack an object, preserving tuples, datetimes, uuids, and numpy values"""
+    return msgpack.packb(obj, default=_default, use_bin_type=True, strict_types=True)
+
+
+def loads(data):
+    """Unpack an object packed with dumps"""
+    return msgpack.unpackb(data, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+
+
+def register_serializer():
+    """Register the format with kombu so it can be used for CELERY_TASK_SERIALIZER and CELERY_RESULT_SERIALIZER"""
+    register(SERIALIZER_NAME, dumps, loads, content_type=CONTENT_TYPE, content_encoding='binary')
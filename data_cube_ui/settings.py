@@ -202,15 +202,37 @@ STATICFILES_DIRS = [
     '/home/' + LOCAL_USER + '/Datacube/data_cube_ui/static',
 ]
 
+# Shared by the web server and the workers, e.g. for the ingested area summary cached by
+# apps.data_cube_manager.tasks.update_data_cube_details. Database 1 keeps the cache apart from the broker.
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://' + MASTER_NODE + ':6379/1',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        }
+    }
+}
+
 # CELERY STUFF
 
 BROKER_URL = 'redis://' + MASTER_NODE + ':6379'
 CELERY_RESULT_BACKEND = 'redis://' + MASTER_NODE + ':6379'
-CELERY_ACCEPT_CONTENT = ['pickle']
-CELERY_TASK_SERIALIZER = 'pickle'
-CELERY_RESULT_SERIALIZER = 'pickle'
+# msgpack with extension types for datetimes, tuples, and numpy values - see data_cube_ui.serialization.
+CELERY_ACCEPT_CONTENT = ['dc_msgpack']
+CELERY_TASK_SERIALIZER = 'dc_msgpack'
+CELERY_RESULT_SERIALIZER = 'dc_msgpack'
+# chunk results only reference data and metadata written to the task's temp path, so results are small and only
+# need to outlive the longest running chord.
+CELERY_TASK_RESULT_EXPIRES = 60 * 60 * 12
 CELERYD_PREFETCH_MULTIPLIER = 1
 CELERY_TASK_ACKS_LATE = True
+# Enables task priorities on the redis broker - see apps.dc_algorithm.scheduler.
+# Lower values are served first.
+BROKER_TRANSPORT_OPTIONS = {'priority_steps': list(range(10)), 'queue_order_strategy': 'priority'}
+# Messages sent without a priority (run, parsing, validation, ingestion) use the 'full' class rather than 0 so
+# that they don't outrank prioritized chunks - see apps.dc_algorithm.scheduler.PRIORITY_CLASSES.
+CELERY_DEFAULT_PRIORITY = 4
 CELERY_TIMEZONE = 'UTC'
 # this is done to prevent weird mem issues as well as to force
 # close db connections for dc on demand.
@@ -4,3 +4,4 @@ python manage.py makemigrations {dc_algorithm,accounts,coastal_change,custom_mos
 python manage.py migrate
 
 python manage.py loaddata db_backups/init_database.json
+python manage.py create_dataset_extent_index
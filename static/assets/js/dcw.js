@@ -40,6 +40,9 @@ self.addEventListener("message", function(e) {
         case "SINGLE":
             getSingleResult(e);
             break;
+        case "SUBSET":
+            getSubsetResult(e);
+            break;
         default:
             close();
             break;
@@ -100,13 +103,26 @@ function addNewtask() {
 //used to load a single scene from a task.
 function getSingleResult(e) {
     csrftoken = e.data.csrf;
+    submitSingle('id=' + e.data.id + '&date=' + e.data.date);
+}
+
+//used to create a spatial subset of a task - the bounds must fall within the bounds of the task.
+function getSubsetResult(e) {
+    csrftoken = e.data.csrf;
+    var bounds = ['latitude_min', 'latitude_max', 'longitude_min', 'longitude_max'].map(function(field) {
+        return field + '=' + encodeURIComponent(e.data[field]);
+    });
+    submitSingle('id=' + e.data.id + '&' + bounds.join('&'));
+}
 
+//submits a new task based on an existing task and sets the checktask interval timer.
+function submitSingle(parameters) {
     var request = new XMLHttpRequest();
     request.open("POST", '/' + tool_name + '/submit_single', false);
     //request.timeout = 100;
     request.setRequestHeader("Content-type", "application/x-www-form-urlencoded");
     request.setRequestHeader("X-CSRFToken", csrftoken);
-    request.send('id=' + e.data.id + '&date=' + e.data.date);
+    request.send(parameters);
 
     if (request.status != 200) {
         error("There was a problem submitting your task, please check your connection.");
@@ -159,6 +175,15 @@ function checktask() {
                     'value': response.progress,
                 });
             }
+            //a low resolution preview is shown until the full result is complete.
+            if (response.preview && !task_obj['preview_posted']) {
+                task_obj['preview_posted'] = true;
+                postMessage({
+                    'status': "PREVIEW",
+                    'id': task_obj['id'],
+                    'preview': response.preview
+                });
+            }
             setTimeout(checktask, 3000);
         } else {
             //just pass in all the attributes from the result obj.
@@ -0,0 +1,163 @@
+/*
+Copyright 2016 United States Government as represented by the Administrator
+of the National Aeronautics and Space Administration. All Rights Reserved.
+
+Portion of this code is Copyright Geoscience Australia, Licensed under the
+Apache License, Version 2.0 (the "License"); you may not use this file
+except in compliance with the License. You may obtain a copy of the License
+at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+The CEOS 2 platform is licensed under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0.
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+*/
+
+//Renders the json time series served by the plot_data endpoints as simple svg plots.
+var TIME_SERIES_PLOT_COLORS = {
+    'r': '#d62728',
+    'g': '#2ca02c',
+    'b': '#1f77b4',
+    'c': '#17becf',
+    'm': '#e377c2',
+    'y': '#bcbd22',
+    'k': '#000000'
+};
+var TIME_SERIES_PLOT_WIDTH = 480;
+var TIME_SERIES_PLOT_HEIGHT = 260;
+var TIME_SERIES_PLOT_MARGIN = {top: 30, right: 15, bottom: 45, left: 60};
+
+//fetches plot data for a task and renders a plot per series in the container.
+//parameters should contain the task id and optionally max_points for server side downsampling.
+function plot_time_series(container, url, parameters) {
+    jQuery(container).html("<p>Loading plots...</p>");
+    jQuery.get(url, parameters, function(response) {
+        if (response.status != "OK") {
+            jQuery(container).html("<p>" + response.message + "</p>");
+            return;
+        }
+        render_time_series(container, response.plots, response.image);
+    });
+}
+
+//renders a list of plot dicts in the container, replacing its contents.
+//tasks completed before plots were served as json only have an image, which is shown instead.
+function render_time_series(container, plots, image) {
+    jQuery(container).empty();
+    if (image) {
+        jQuery(container).html(`<img src="` + image + `" alt="2D plot for task" class="img img-responsive"/>`);
+        return;
+    }
+    plots.forEach(function(plot) {
+        jQuery(container).append(create_time_series_svg(plot));
+    });
+}
+
+//parses a matplotlib style format string (e.g. 'ro', '.') into a color and marker definition.
+function parse_plot_style(style) {
+    style = style || "";
+    var color_key = style.split("").find(function(character) {
+        return character in TIME_SERIES_PLOT_COLORS;
+    });
+    return {
+        color: TIME_SERIES_PLOT_COLORS[color_key] || TIME_SERIES_PLOT_COLORS['b'],
+        radius: style.indexOf('o') != -1 ? 3 : 1.5,
+        line: style == ""
+    };
+}
+
+function create_svg_element(name, attributes) {
+    var element = document.createElementNS("http://www.w3.org/2000/svg", name);
+    for (var attribute in attributes)
+        element.setAttribute(attribute, attributes[attribute]);
+    return element;
+}
+
+function create_svg_text(text, attributes) {
+    var element = create_svg_element("text", attributes);
+    element.textContent = text;
+    return element;
+}
+
+//creates a single svg plot from a plot dict - title, label, style, x, y.
+function create_time_series_svg(plot) {
+    var inner_width = TIME_SERIES_PLOT_WIDTH - TIME_SERIES_PLOT_MARGIN.left - TIME_SERIES_PLOT_MARGIN.right;
+    var inner_height = TIME_SERIES_PLOT_HEIGHT - TIME_SERIES_PLOT_MARGIN.top - TIME_SERIES_PLOT_MARGIN.bottom;
+    var svg = create_svg_element("svg", {
+        viewBox: "0 0 " + TIME_SERIES_PLOT_WIDTH + " " + TIME_SERIES_PLOT_HEIGHT,
+        width: "100%",
+        "class": "time_series_plot"
+    });
+
+    var points = plot.x.map(function(x, index) {
+        return [x, plot.y[index]];
+    }).filter(function(point) {
+        return point[1] !== null;
+    });
+    if (points.length == 0) {
+        return jQuery("<p></p>").text(plot.title + ": no valid data.");
+    }
+    var x_values = points.map(function(point) { return point[0]; });
+    var y_values = points.map(function(point) { return point[1]; });
+    var x_min = Math.min.apply(null, x_values), x_max = Math.max.apply(null, x_values);
+    var y_min = Math.min.apply(null, y_values), y_max = Math.max.apply(null, y_values);
+    if (x_min == x_max) { x_min -= 1; x_max += 1; }
+    if (y_min == y_max) { y_min -= 1; y_max += 1; }
+
+    var scale_x = function(x) {
+        return TIME_SERIES_PLOT_MARGIN.left + (x - x_min) / (x_max - x_min) * inner_width;
+    };
+    var scale_y = function(y) {
+        return TIME_SERIES_PLOT_MARGIN.top + inner_height - (y - y_min) / (y_max - y_min) * inner_height;
+    };
+
+    svg.appendChild(create_svg_text(plot.title, {
+        x: TIME_SERIES_PLOT_WIDTH / 2, y: 18, "text-anchor": "middle", "font-weight": "bold"}));
+    svg.appendChild(create_svg_element("rect", {
+        x: TIME_SERIES_PLOT_MARGIN.left, y: TIME_SERIES_PLOT_MARGIN.top, width: inner_width, height: inner_height,
+        fill: "none", stroke: "#999999"}));
+
+    //axis ticks - min, mid, and max values on each axis.
+    [x_min, (x_min + x_max) / 2, x_max].forEach(function(x) {
+        svg.appendChild(create_svg_text(new Date(x).toISOString().slice(0, 10), {
+            x: scale_x(x), y: TIME_SERIES_PLOT_MARGIN.top + inner_height + 15, "text-anchor": "middle",
+            "font-size": "10"}));
+    });
+    [y_min, (y_min + y_max) / 2, y_max].forEach(function(y) {
+        svg.appendChild(create_svg_text(+y.toPrecision(4), {
+            x: TIME_SERIES_PLOT_MARGIN.left - 5, y: scale_y(y) + 3, "text-anchor": "end", "font-size": "10"}));
+    });
+    svg.appendChild(create_svg_text("Acquisition Date", {
+        x: TIME_SERIES_PLOT_MARGIN.left + inner_width / 2, y: TIME_SERIES_PLOT_HEIGHT - 8, "text-anchor": "middle",
+        "font-size": "11"}));
+    svg.appendChild(create_svg_text(plot.label, {
+        x: 0, y: 0, "text-anchor": "middle", "font-size": "11",
+        transform: "translate(12," + (TIME_SERIES_PLOT_MARGIN.top + inner_height / 2) + ") rotate(-90)"}));
+
+    var style = parse_plot_style(plot.style);
+    if (style.line && points.length > 1) {
+        svg.appendChild(create_svg_element("polyline", {
+            points: points.map(function(point) {
+                return scale_x(point[0]) + "," + scale_y(point[1]);
+            }).join(" "),
+            fill: "none", stroke: style.color, "stroke-width": 1.5}));
+    }
+    points.forEach(function(point) {
+        var marker = create_svg_element("circle", {
+            cx: scale_x(point[0]), cy: scale_y(point[1]), r: style.radius, fill: style.color});
+        //title elements are shown as a tooltip on hover.
+        var tooltip = create_svg_element("title", {});
+        tooltip.textContent = new Date(point[0]).toISOString().slice(0, 10) + ": " + point[1];
+        marker.appendChild(tooltip);
+        svg.appendChild(marker);
+    });
+    return svg;
+}